@@ -0,0 +1,66 @@
+"""
+Micro-benchmarks of serializers, pagination and auth primitives.
+
+They run with pytest-benchmark on data built in memory, at the sizes the
+API serves: a page of results and an export batch. They are left out of
+the test suite and only run when asked for, from this directory's parent,
+where pytest.ini sets up Django with ``core.settings``:
+
+    pytest benchmarks
+    pytest benchmarks --benchmark-save=baseline
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=min:10%
+
+``--benchmark-save`` stores the results as JSON under ``.benchmarks/``,
+``--benchmark-json=path`` writes them anywhere. ``--benchmark-compare``
+compares the run with the latest saved one, or with a given run id, and
+``--benchmark-compare-fail`` fails the run when a benchmark got slower
+than the threshold. Compare runs of the same machine only.
+"""
+import os
+import uuid
+from datetime import timedelta
+import pytest
+from django.utils import timezone
+from community.models import Puppy
+from user.models import User
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# A page of a list endpoint and a batch of an export
+SIZES = [100, 1000]
+
+
+def pytest_ignore_collect(path, config):
+    requested = [os.path.abspath(str(arg).split('::')[0]) for arg in config.args]
+    return not any(arg == HERE or arg.startswith(HERE + os.sep) for arg in requested)
+
+
+def make_users(count):
+    now = timezone.now()
+    return [
+        User(id=uuid.uuid4(), email=f'bench-{index}@example.com', firstname='Bench',
+             lastname=f'User {index}', phone=f'+234801{index:07d}',
+             image_thumbnail=f'users/{index}_thumbnail.png' if index % 2 else None,
+             image_medium=f'users/{index}_medium.png' if index % 2 else None, roles=['CANDIDATE'],
+             date_joined=now - timedelta(minutes=index), verified=True)
+        for index in range(count)
+    ]
+
+
+def make_puppies(count):
+    now = timezone.now()
+    return [
+        Puppy(id=uuid.uuid4(), name=f'Puppy {index}', age=index % 16, breed='Labrador',
+              color='Brown', created_at=now - timedelta(minutes=index), updated_at=now)
+        for index in range(count)
+    ]
+
+
+@pytest.fixture(params=SIZES, ids=lambda size: f'{size}rows')
+def users(request):
+    return make_users(request.param)
+
+
+@pytest.fixture(params=SIZES, ids=lambda size: f'{size}rows')
+def puppies(request):
+    return make_puppies(request.param)
@@ -0,0 +1,33 @@
+import pytest
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from user.models import Token, User
+from user.permissions import IsAdmin, IsCandidate, IsSuperAdmin
+from user.utils import hash_token
+from .conftest import make_users
+
+
+def test_token_is_valid(benchmark):
+    token = Token(token=hash_token('123456'), token_type='PASSWORD_RESET',
+                  created_at=timezone.now())
+    assert benchmark(token.is_valid)
+
+
+def test_hash_token(benchmark):
+    benchmark(hash_token, '123456')
+
+
+@pytest.mark.parametrize('permission', [IsSuperAdmin, IsAdmin, IsCandidate])
+def test_permission(benchmark, permission):
+    request = Request(APIRequestFactory().get('/'))
+    request.user = User(roles=['ADMIN', 'CANDIDATE'])
+    benchmark(permission().has_permission, request, None)
+
+
+def test_access_token_validation(benchmark):
+    raw = str(AccessToken.for_user(make_users(1)[0])).encode()
+    authentication = JWTAuthentication()
+    benchmark(authentication.get_validated_token, raw)
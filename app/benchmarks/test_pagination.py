@@ -0,0 +1,36 @@
+import pytest
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from community.models import Puppy
+from core.pagination import Cursor, CustomPagination, KeysetPagination
+from .conftest import make_puppies
+
+factory = APIRequestFactory()
+
+
+@pytest.fixture(scope='module')
+def puppies():
+    return make_puppies(10000)
+
+
+@pytest.mark.parametrize('page_size', [20, 100])
+def test_paginated_response(benchmark, puppies, page_size):
+    paginator = CustomPagination()
+    request = Request(factory.get('/api/v1/community/puppies/', {'page': 3, 'page_size': page_size}))
+    page = paginator.paginate_queryset(puppies, request)
+    data = [{'id': str(puppy.id), 'name': puppy.name} for puppy in page]
+    benchmark(paginator.get_paginated_response, data)
+
+
+def test_keyset_cursor(benchmark, puppies):
+    paginator = KeysetPagination()
+    paginator.ordering = ('-created_at', '-id')
+    request = Request(factory.get('/api/v1/community/puppies/', {'breed': 'Labrador'}))
+    paginator.base_url = request.build_absolute_uri()
+
+    def round_trip():
+        link = paginator.encode_cursor(Cursor(paginator._position(puppies[19]), False))
+        cursor = link.split('cursor=')[1].split('&')[0]
+        return paginator.decode_cursor(Request(factory.get('/', {'cursor': cursor})), Puppy)
+
+    benchmark(round_trip)
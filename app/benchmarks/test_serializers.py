@@ -0,0 +1,36 @@
+from collections import namedtuple
+from community.serializers import PuppySerializer
+from core.serializers import ValuesSerializer
+from user.serializers import UserSerializer
+
+
+def as_rows(serializer, instances):
+    """The named tuples ``prepare()`` fetches, without the database"""
+    _, sources, _ = serializer._compile()
+    Row = namedtuple('Row', sources)
+    return [Row(*(instance.__dict__[source] for source in sources)) for instance in instances]
+
+
+def test_user_serializer(benchmark, users):
+    benchmark(lambda: UserSerializer(users, many=True).data)
+
+
+def test_user_values_serializer(benchmark, users):
+    serializer = ValuesSerializer(UserSerializer)
+    rows = as_rows(serializer, users)
+    benchmark(serializer.to_representation, rows)
+
+
+def test_puppy_serializer(benchmark, puppies):
+    benchmark(lambda: PuppySerializer(puppies, many=True).data)
+
+
+def test_puppy_values_serializer(benchmark, puppies):
+    serializer = ValuesSerializer(PuppySerializer)
+    rows = as_rows(serializer, puppies)
+    benchmark(serializer.to_representation, rows)
+
+
+def test_puppy_validation(benchmark):
+    data = {'name': 'Casper', 'age': 4, 'breed': 'Bull Dog', 'color': 'Black'}
+    benchmark(lambda: PuppySerializer(data=data).is_valid(raise_exception=True))
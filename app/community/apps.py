@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CommunityConfig(AppConfig):
     name = 'community'
+
+    def ready(self):
+        from core.caching import watch
+        watch(self.get_model('Puppy'))
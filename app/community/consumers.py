@@ -0,0 +1,98 @@
+import asyncio
+import time
+import uuid
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from .models import Room
+from .messages import get_message_buffer
+from .presence import get_presence
+
+MAX_MESSAGE_LENGTH = 4000
+
+
+@database_sync_to_async
+def room_exists(room_id):
+    return Room.objects.filter(pk=room_id).exists()
+
+
+class RoomConsumer(AsyncJsonWebsocketConsumer):
+    """
+    One socket in a room. Events fan out to every socket through the channel
+    layer group ``room.<id>``, and each socket forwards them to its client in
+    batches: one frame per ``ROOM_SEND_BATCH_INTERVAL`` or ``ROOM_SEND_BATCH_SIZE``
+    events, whichever comes first, instead of one frame per event.
+    """
+    batch_interval = settings.ROOM_SEND_BATCH_INTERVAL
+    batch_size = settings.ROOM_SEND_BATCH_SIZE
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.room_id = str(self.scope['url_route']['kwargs']['room_id'])
+        if not await room_exists(self.room_id):
+            await self.close()
+            return
+        self.user_id = str(user.pk)
+        self.group = f'room.{self.room_id}'
+        self.member = f'{self.user_id}:{self.channel_name}'
+        self.outbox, self.flusher = [], None
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await get_presence().join(self.room_id, self.member)
+        await self.accept()
+        await self.send_presence()
+        await self.broadcast({'type': 'join', 'user': self.user_id})
+
+    async def disconnect(self, code):
+        if not hasattr(self, 'group'):
+            return
+        if self.flusher is not None:
+            self.flusher.cancel()
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+        await get_presence().leave(self.room_id, self.member)
+        await self.broadcast({'type': 'leave', 'user': self.user_id})
+
+    async def receive_json(self, content, **kwargs):
+        kind = content.get('type') if isinstance(content, dict) else None
+        if kind == 'message':
+            body = str(content.get('body') or '')[:MAX_MESSAGE_LENGTH]
+            if body:
+                event = {'type': 'message', 'id': uuid.uuid4().hex, 'user': self.user_id,
+                         'body': body, 'time': time.time()}
+                # Buffered before anyone sees it, the writer saves it later
+                await get_message_buffer().append({'room': self.room_id, 'id': event['id'],
+                                                   'user': self.user_id, 'body': body,
+                                                   'time': event['time']})
+                await self.broadcast(event)
+        elif kind == 'ping':
+            await get_presence().touch(self.room_id, self.member)
+        elif kind == 'presence':
+            await self.send_presence()
+
+    async def broadcast(self, event):
+        await self.channel_layer.group_send(self.group, {'type': 'room.event', 'event': event})
+
+    async def send_presence(self):
+        await self.send_json({'type': 'presence', 'users': await get_presence().users(self.room_id)})
+
+    async def room_event(self, message):
+        self.outbox.append(message['event'])
+        if len(self.outbox) >= self.batch_size:
+            await self.flush()
+        elif self.flusher is None:
+            self.flusher = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.batch_interval)
+        self.flusher = None
+        await self.flush()
+
+    async def flush(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        if self.outbox:
+            events, self.outbox = self.outbox, []
+            await self.send_json({'type': 'batch', 'events': events})
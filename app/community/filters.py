@@ -0,0 +1,15 @@
+import django_filters
+from .models import Puppy
+
+
+class PuppyFilter(django_filters.FilterSet):
+    """
+    ``breed`` and ``color`` are exact matches served by the Puppy indexes.
+    The age range isn't indexed, it filters the rows those indexes walk.
+    """
+    min_age = django_filters.NumberFilter(field_name='age', lookup_expr='gte')
+    max_age = django_filters.NumberFilter(field_name='age', lookup_expr='lte')
+
+    class Meta:
+        model = Puppy
+        fields = ['breed', 'color', 'min_age', 'max_age']
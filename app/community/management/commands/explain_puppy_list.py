@@ -0,0 +1,61 @@
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from community.models import Puppy
+from community.views import get_post_puppy
+
+SCENARIOS = [
+    '',
+    'ordering=created_at',
+    'breed=Labrador',
+    'color=Black',
+    'breed=Labrador&color=Black',
+    'min_age=3&max_age=5',
+    'breed=Labrador&min_age=3&max_age=5',
+]
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN ANALYZE the queries behind the puppy list, first and second page, '
+            'on existing rows (see seed_puppies)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--query', action='append', help='Query string to explain, repeatable')
+        parser.add_argument('--verbose-plan', action='store_true', help='Print the full plans')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans are only checked on PostgreSQL')
+        self.stdout.write(f'{Puppy.objects.count()} puppies')
+        with connection.cursor() as cursor:
+            # Plans on a freshly seeded table are useless without statistics
+            cursor.execute(f'ANALYZE {Puppy._meta.db_table}')
+        for query in options['query'] or SCENARIOS:
+            response, sql = self.request(f'/api/v1/puppies/?{query}')
+            self.explain(query or '(no filters)', sql, options['verbose_plan'])
+            next_link = response.data['links']['next']
+            if next_link:
+                _, sql = self.request(f'/api/v1/puppies/?{urlsplit(next_link).query}')
+                self.explain(f'{query or "(no filters)"}, page 2', sql, options['verbose_plan'])
+
+    @staticmethod
+    def request(path):
+        with CaptureQueriesContext(connection) as queries:
+            response = get_post_puppy(RequestFactory().get(path, SERVER_NAME='localhost'))
+        if response.status_code != 200:
+            raise CommandError(f'{path} returned {response.status_code}: {response.data}')
+        return response, queries.captured_queries[-1]['sql']
+
+    def explain(self, label, sql, verbose):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}')
+            plan = [row[0] for row in cursor.fetchall()]
+        scans = [line.strip() for line in plan if 'Scan' in line or 'Sort' in line]
+        total = plan[-1].strip()
+        style = self.style.WARNING if any(
+            'Seq Scan' in line or line.startswith('Sort') for line in scans) else self.style.SUCCESS
+        self.stdout.write(style(f'{label}: {total}'))
+        for line in plan if verbose else scans:
+            self.stdout.write(f'    {line.strip() if not verbose else line}')
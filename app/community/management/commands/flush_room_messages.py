@@ -0,0 +1,38 @@
+import logging
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from community.messages import flush_messages
+from community.tasks import writer_name
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Save buffered room messages to the database in batches, until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.ROOM_MESSAGE_FLUSH_BATCH_SIZE,
+                            help='Messages saved per insert')
+        parser.add_argument('--block', type=int, default=5000,
+                            help='Milliseconds to wait for new messages before polling again')
+        parser.add_argument('--once', action='store_true', help='Stop once the buffer is empty')
+
+    def handle(self, *args, **options):
+        name = writer_name()
+        block = None if options['once'] else options['block']
+        self.stdout.write(f'Writer {name} started')
+        saved = 0
+        while True:
+            # A long running process, drop connections the database has closed
+            close_old_connections()
+            try:
+                handled = flush_messages(name, options['batch_size'], block=block)
+            except KeyboardInterrupt:
+                break
+            saved += handled
+            if handled:
+                logger.info('Saved %s room messages', handled)
+            elif options['once']:
+                break
+        self.stdout.write(self.style.SUCCESS(f'Saved {saved} room messages'))
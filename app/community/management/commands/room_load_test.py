@@ -0,0 +1,107 @@
+import asyncio
+import json
+import random
+import time
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from community.models import Room
+from community.routing import websocket_urlpatterns
+from user.models import User
+
+IN_MEMORY = {
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                                   'CONFIG': {'capacity': 10000}}},
+    'ROOM_PRESENCE': {'BACKEND': 'community.presence.MemoryPresence'},
+    # Messages stay in this process, out of the real stream and Message table
+    'ROOM_MESSAGE_BUFFER': {'BACKEND': 'community.messages.MemoryMessageBuffer'},
+}
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+class Command(BaseCommand):
+    help = ('Open thousands of room sockets in this process, have them all talk and measure '
+            'delivered messages per second and delivery latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=2000)
+        parser.add_argument('--rooms', type=int, default=100)
+        parser.add_argument('--messages', type=int, default=5, help='Messages sent by every socket')
+        parser.add_argument('--rate', type=float, default=2, help='Messages per second per socket')
+        parser.add_argument('--in-memory', action='store_true',
+                            help='In-memory channel layer, presence and message buffer instead of the configured Redis')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(email='room-load@example.com', defaults={'verified': True})
+        rooms = [Room.objects.get_or_create(name=f'load-test-{index}')[0].pk for index in range(options['rooms'])]
+        if options['in_memory']:
+            with override_settings(**IN_MEMORY):
+                stats = async_to_sync(self.run)(user, rooms, options)
+        else:
+            stats = async_to_sync(self.run)(user, rooms, options)
+        for line in stats:
+            self.stdout.write(line)
+
+    async def run(self, user, rooms, options):
+        router = URLRouter(websocket_urlpatterns)
+        application = lambda scope: router(dict(scope, user=user))  # noqa: E731
+        sockets = [(rooms[index % len(rooms)], WebsocketCommunicator(
+            application, f'/ws/rooms/{rooms[index % len(rooms)]}/')) for index in range(options['sockets'])]
+
+        started = time.perf_counter()
+        for offset in range(0, len(sockets), 200):
+            await asyncio.gather(*[socket.connect(timeout=30) for _, socket in sockets[offset:offset + 200]])
+        connect_time = time.perf_counter() - started
+        # Let the join events settle before measuring
+        await asyncio.sleep(1)
+        for _, socket in sockets:
+            while not await socket.receive_nothing(timeout=0.01):
+                await socket.receive_output()
+
+        members = {room: sum(1 for socket_room, _ in sockets if socket_room == room) for room in rooms}
+        expected = {id(socket): members[room] * options['messages'] for room, socket in sockets}
+        latencies = []
+
+        async def receive(socket):
+            remaining = expected[id(socket)]
+            while remaining > 0:
+                try:
+                    frame = json.loads((await socket.receive_output(timeout=30))['text'])
+                except asyncio.TimeoutError:
+                    return remaining
+                if frame['type'] != 'batch':
+                    continue
+                now = time.time()
+                for event in frame['events']:
+                    if event['type'] == 'message':
+                        latencies.append(now - event['time'])
+                        remaining -= 1
+            return 0
+
+        async def send(socket):
+            for number in range(options['messages']):
+                await asyncio.sleep(random.expovariate(options['rate']))
+                await socket.send_json_to({'type': 'message', 'body': f'message {number}'})
+
+        started = time.perf_counter()
+        receivers = [asyncio.ensure_future(receive(socket)) for _, socket in sockets]
+        await asyncio.gather(*[send(socket) for _, socket in sockets])
+        missing = sum(await asyncio.gather(*receivers))
+        elapsed = time.perf_counter() - started
+        for offset in range(0, len(sockets), 200):
+            await asyncio.gather(*[socket.disconnect() for _, socket in sockets[offset:offset + 200]])
+
+        latencies.sort()
+        sent = len(sockets) * options['messages']
+        return [
+            f'{len(sockets)} sockets in {len(rooms)} rooms, connected in {connect_time:.1f}s',
+            f'{sent} messages sent, {len(latencies)} delivered, {missing} missing, in {elapsed:.1f}s',
+            f'{len(latencies) / elapsed:.0f} deliveries/s, {sent / elapsed:.0f} messages/s',
+            f'latency p50 {percentile(latencies, 0.5) * 1000:.0f}ms, '
+            f'p99 {percentile(latencies, 0.99) * 1000:.0f}ms, max {percentile(latencies, 1) * 1000:.0f}ms',
+        ]
@@ -0,0 +1,27 @@
+import random
+from django.core.management.base import BaseCommand
+from community.models import Puppy
+
+BREEDS = ['Bull Dog', 'Labrador', 'Gradane', 'Pamerion', 'Poodle', 'Beagle', 'Boxer', 'Husky']
+COLORS = ['Black', 'Brown', 'White', 'Golden', 'Grey', 'Spotted']
+
+
+class Command(BaseCommand):
+    help = 'Insert fake puppies for load tests and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        created = 0
+        while created < options['count']:
+            size = min(options['batch_size'], options['count'] - created)
+            Puppy.objects.bulk_create([
+                Puppy(name=f'Puppy {created + index}', age=random.randint(0, 15),
+                      breed=random.choice(BREEDS), color=random.choice(COLORS))
+                for index in range(size)
+            ])
+            created += size
+            self.stdout.write(f'{created} puppies')
+        self.stdout.write(self.style.SUCCESS(f'Created {created} puppies'))
@@ -0,0 +1,265 @@
+"""
+Write-behind persistence for room messages.
+
+Sockets don't insert messages. They append them to a Redis stream and to a
+short per-room tail, and a writer (the ``flush_room_messages`` command, with
+a celery beat task as a safety net) reads the stream through a consumer
+group and saves whole batches with one ``bulk_create``. Entries are acked
+only once their batch is committed, and a writer that dies leaves them
+pending for another one to claim, so delivery is at least once. Message ids
+are made by the socket, which makes the inserts idempotent.
+
+History is served newest first from the tail while it reaches back far
+enough, and from the database below that.
+"""
+import itertools
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timezone
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+from core.pagination import KeysetPagination
+from core.redis import get_async_redis, get_redis
+from .models import Message, Room
+
+STREAM_KEY = 'room:messages'
+WRITER_GROUP = 'writers'
+
+_buffer = None
+
+
+def tail_key(room_id):
+    return f'room:{room_id}:tail'
+
+
+def to_message(record):
+    """An unsaved ``Message`` from a buffered record"""
+    return Message(id=uuid.UUID(record['id']), room_id=uuid.UUID(record['room']),
+                   user_id=record['user'] and uuid.UUID(record['user']), body=record['body'],
+                   created_at=datetime.fromtimestamp(record['time'], tz=timezone.utc))
+
+
+class BaseMessageBuffer(ABC):
+    def __init__(self, tail=100, claim_idle=60):
+        self.tail_length = tail
+        # Seconds before another writer takes over a batch left unacked
+        self.claim_idle = claim_idle
+
+    @abstractmethod
+    async def append(self, record):
+        pass
+
+    @abstractmethod
+    def tail(self, room_id):
+        """Buffered records of the room, newest first"""
+
+    @abstractmethod
+    def read(self, consumer, count, block=None):
+        """
+        Up to ``count`` ``(entry id, record)`` pairs for ``consumer``: its own
+        unacked entries and stale ones of other writers first, then new ones.
+        Waits up to ``block`` milliseconds for new entries when there are none.
+        """
+
+    @abstractmethod
+    def ack(self, entry_ids):
+        pass
+
+
+class RedisMessageBuffer(BaseMessageBuffer):
+    def __init__(self, url, tail=100, claim_idle=60):
+        super().__init__(tail, claim_idle)
+        self.url = url
+        self._group_ready = False
+
+    @property
+    def client(self):
+        return get_redis('channels')
+
+    async def append(self, record):
+        pool = await get_async_redis(self.url)
+        payload = json.dumps(record, separators=(',', ':'))
+        key = tail_key(record['room'])
+        transaction = pool.multi_exec()
+        transaction.xadd(STREAM_KEY, {'data': payload})
+        transaction.lpush(key, payload)
+        transaction.ltrim(key, 0, self.tail_length - 1)
+        await transaction.execute()
+
+    def tail(self, room_id):
+        return [json.loads(item) for item in self.client.lrange(tail_key(room_id), 0, -1)]
+
+    def _ensure_group(self):
+        if not self._group_ready:
+            try:
+                self.client.xgroup_create(STREAM_KEY, WRITER_GROUP, id='0', mkstream=True)
+            except redis.ResponseError as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
+            self._group_ready = True
+
+    def _claim(self, consumer, count):
+        pending = self.client.xpending_range(STREAM_KEY, WRITER_GROUP, '-', '+', count)
+        stale = [entry['message_id'] for entry in pending
+                 if entry['consumer'].decode() == consumer
+                 or entry['time_since_delivered'] >= self.claim_idle * 1000]
+        if not stale:
+            return []
+        return self.client.xclaim(STREAM_KEY, WRITER_GROUP, consumer, 0, stale)
+
+    def read(self, consumer, count, block=None):
+        self._ensure_group()
+        entries = self._claim(consumer, count)
+        if not entries:
+            for _, new in self.client.xreadgroup(WRITER_GROUP, consumer, {STREAM_KEY: '>'},
+                                                 count=count, block=block):
+                entries.extend(new)
+        return [(entry_id, json.loads(fields[b'data'])) for entry_id, fields in entries if fields]
+
+    def ack(self, entry_ids):
+        if entry_ids:
+            pipe = self.client.pipeline()
+            pipe.xack(STREAM_KEY, WRITER_GROUP, *entry_ids)
+            # Saved entries have nothing left to do in the stream
+            pipe.xdel(STREAM_KEY, *entry_ids)
+            pipe.execute()
+
+
+class MemoryMessageBuffer(BaseMessageBuffer):
+    """A buffer for one process, for tests and the in-memory channel layer"""
+
+    def __init__(self, tail=100, claim_idle=60):
+        super().__init__(tail, claim_idle)
+        self._ids = itertools.count(1)
+        self._entries = OrderedDict()
+        self._delivered = {}
+        self._tails = defaultdict(lambda: deque(maxlen=self.tail_length))
+
+    async def append(self, record):
+        self._entries[next(self._ids)] = record
+        self._tails[record['room']].appendleft(record)
+
+    def tail(self, room_id):
+        return list(self._tails[str(room_id)])
+
+    def read(self, consumer, count, block=None):
+        now, entries = time.time(), []
+        for entry_id, record in self._entries.items():
+            owner, delivered = self._delivered.get(entry_id, (None, None))
+            if owner is None or owner == consumer or now - delivered >= self.claim_idle:
+                self._delivered[entry_id] = (consumer, now)
+                entries.append((entry_id, record))
+                if len(entries) == count:
+                    break
+        return entries
+
+    def ack(self, entry_ids):
+        for entry_id in entry_ids:
+            self._entries.pop(entry_id, None)
+            self._delivered.pop(entry_id, None)
+
+
+def get_message_buffer():
+    global _buffer
+    if _buffer is None:
+        config = settings.ROOM_MESSAGE_BUFFER
+        _buffer = import_string(config['BACKEND'])(**config.get('CONFIG', {}))
+    return _buffer
+
+
+def _reset_message_buffer(setting, **kwargs):
+    global _buffer
+    if setting == 'ROOM_MESSAGE_BUFFER':
+        _buffer = None
+
+
+setting_changed.connect(_reset_message_buffer)
+
+
+def flush_messages(consumer, batch_size=None, block=None, buffer=None):
+    """
+    Save one batch from the buffer and ack it, returns the number of entries
+    handled. Messages whose room is gone are dropped, and messages of deleted
+    users are kept without a user, so one bad record can't block the stream.
+    """
+    buffer = buffer or get_message_buffer()
+    batch_size = batch_size or settings.ROOM_MESSAGE_FLUSH_BATCH_SIZE
+    entries = buffer.read(consumer, batch_size, block=block)
+    if not entries:
+        return 0
+    messages = [to_message(record) for _, record in entries]
+    rooms = set(Room.objects.filter(pk__in={message.room_id for message in messages})
+                .values_list('pk', flat=True))
+    user_ids = {message.user_id for message in messages if message.user_id}
+    users = set(get_user_model().objects.filter(pk__in=user_ids)
+                .values_list('pk', flat=True)) if user_ids else set()
+    messages = [message for message in messages if message.room_id in rooms]
+    for message in messages:
+        if message.user_id not in users:
+            message.user_id = None
+    # A batch redelivered after a crash conflicts on the ids already saved
+    Message.objects.bulk_create(messages, batch_size=batch_size, ignore_conflicts=True)
+    buffer.ack([entry_id for entry_id, _ in entries])
+    return len(entries)
+
+
+class MessageHistoryPagination(KeysetPagination):
+    """
+    Keyset pages of a room's history, newest first. A page is served from
+    the Redis tail alone when the tail holds all of it, so reading recent
+    messages doesn't touch the messages table and sees messages the writer
+    hasn't saved yet. Anything older merges the tail with the database.
+    """
+    ordering = ('-created_at', '-id')
+
+    def paginate_room(self, room_id, request, buffer=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request, Message)
+
+        reverse = bool(self.cursor and self.cursor.reverse)
+        ordering = self._invert(self.ordering) if reverse else self.ordering
+        tail = [to_message(record) for record in (buffer or get_message_buffer()).tail(room_id)]
+        results = self._seek(tail, reverse)
+        # The tail is the newest messages of the room, so it holds the whole
+        # page unless the page reaches past its oldest message
+        if reverse:
+            covered = bool(tail) and min(map(self._key, tail)) <= tuple(self.cursor.position)
+        else:
+            covered = len(results) > self.page_size
+        if not covered:
+            queryset = Message.objects.filter(room_id=room_id).order_by(*ordering)
+            if self.cursor:
+                queryset = queryset.filter(self._seek_filter(ordering, self.cursor.position))
+            seen = {message.id for message in results}
+            results += [message for message in queryset[:self.page_size + 1] if message.id not in seen]
+            results.sort(key=self._key, reverse=not reverse)
+
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        self.page = results
+        return results
+
+    @staticmethod
+    def _key(message):
+        return message.created_at, message.id
+
+    def _seek(self, messages, reverse):
+        """Tail messages after the cursor, in page order"""
+        if self.cursor:
+            position = tuple(self.cursor.position)
+            messages = [message for message in messages
+                        if (self._key(message) > position if reverse else self._key(message) < position)]
+        return sorted(messages, key=self._key, reverse=not reverse)
@@ -1,10 +1,12 @@
+from django.conf import settings
 from django.db import models
 import uuid
+from core.conditional import ConditionalUpdateMixin
 
 # Create your models here.
 
 
-class Puppy(models.Model):
+class Puppy(ConditionalUpdateMixin, models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     name = models.CharField(max_length=255)
     age = models.IntegerField()
@@ -13,6 +15,16 @@ class Puppy(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Serve the puppy list: newest first, optionally filtered by breed and/or color
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='puppy_created_idx'),
+            models.Index(fields=['breed', '-created_at', '-id'], name='puppy_breed_created_idx'),
+            models.Index(fields=['color', '-created_at', '-id'], name='puppy_color_created_idx'),
+            models.Index(fields=['breed', 'color', '-created_at', '-id'],
+                         name='puppy_breed_color_created_idx'),
+        ]
+
     def get_breed(self):
         return f"{self.name} belongs to {self.breed} breed"
 
@@ -31,3 +43,27 @@ class Room(models.Model):
 
     class Meta:
         ordering = ('name', )
+
+
+class Message(models.Model):
+    """
+    A chat message sent in a room. Rows are written in batches by the
+    write-behind worker, see community/messages.py, so ``id`` and
+    ``created_at`` come from the socket that accepted the message.
+    """
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
+    # message_room_created_idx serves room lookups, no separate index to write
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='messages', db_index=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+                             related_name='messages')
+    body = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        # Room history, newest first
+        indexes = [
+            models.Index(fields=['room', '-created_at', '-id'], name='message_room_created_idx'),
+        ]
+
+    def __str__(self):
+        return self.body
@@ -0,0 +1,117 @@
+"""
+Room presence in Redis sorted sets.
+
+Every open socket is a member of ``presence:room:<id>`` scored with the time
+it was last seen. Sockets heartbeat to stay in, and members that stop are
+pruned whenever the set is read, so a crashed node leaves no ghosts behind
+and presence never touches the database.
+"""
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+from core.redis import get_async_redis
+
+_presence = None
+
+
+def presence_key(room_id):
+    return f'presence:room:{room_id}'
+
+
+def member_user(member):
+    """Members are ``<user id>:<channel name>``, one per socket"""
+    return member.split(':', 1)[0]
+
+
+class BasePresence(ABC):
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+
+    @abstractmethod
+    async def join(self, room_id, member):
+        pass
+
+    @abstractmethod
+    async def leave(self, room_id, member):
+        pass
+
+    @abstractmethod
+    async def members(self, room_id):
+        """Live members of the room"""
+
+    async def users(self, room_id):
+        """Ids of the users with at least one live socket in the room"""
+        return list(dict.fromkeys(member_user(member) for member in await self.members(room_id)))
+
+    # A heartbeat just refreshes the score
+    async def touch(self, room_id, member):
+        await self.join(room_id, member)
+
+
+class RedisPresence(BasePresence):
+    def __init__(self, url, ttl=60):
+        super().__init__(ttl)
+        self.url = url
+
+    async def join(self, room_id, member):
+        redis = await get_async_redis(self.url)
+        key = presence_key(room_id)
+        transaction = redis.multi_exec()
+        transaction.zadd(key, time.time(), member)
+        # Rooms nobody heartbeats in disappear by themselves
+        transaction.expire(key, self.ttl * 2)
+        await transaction.execute()
+
+    async def leave(self, room_id, member):
+        redis = await get_async_redis(self.url)
+        await redis.zrem(presence_key(room_id), member)
+
+    async def members(self, room_id):
+        redis = await get_async_redis(self.url)
+        key = presence_key(room_id)
+        transaction = redis.multi_exec()
+        transaction.zremrangebyscore(key, max=time.time() - self.ttl)
+        transaction.zrange(key)
+        _, members = await transaction.execute()
+        return [member.decode() for member in members]
+
+
+class MemoryPresence(BasePresence):
+    """Presence for one process, for tests and the in-memory channel layer"""
+
+    def __init__(self, ttl=60):
+        super().__init__(ttl)
+        self._rooms = defaultdict(dict)
+
+    async def join(self, room_id, member):
+        self._rooms[str(room_id)][member] = time.time()
+
+    async def leave(self, room_id, member):
+        self._rooms[str(room_id)].pop(member, None)
+
+    async def members(self, room_id):
+        room = self._rooms[str(room_id)]
+        cutoff = time.time() - self.ttl
+        for member in [member for member, seen in room.items() if seen < cutoff]:
+            del room[member]
+        return sorted(room, key=room.get)
+
+
+def get_presence():
+    global _presence
+    if _presence is None:
+        config = settings.ROOM_PRESENCE
+        _presence = import_string(config['BACKEND'])(**config.get('CONFIG', {}))
+    return _presence
+
+
+def _reset_presence(setting, **kwargs):
+    global _presence
+    if setting == 'ROOM_PRESENCE':
+        _presence = None
+
+
+setting_changed.connect(_reset_presence)
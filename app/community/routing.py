@@ -0,0 +1,6 @@
+from django.urls import path
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/rooms/<uuid:room_id>/', consumers.RoomConsumer, name='room-socket'),
+]
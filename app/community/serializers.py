@@ -1,8 +1,57 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Puppy
+from core.serializers import TimedSerializerMixin
+from .models import Message, Puppy
 
+BULK_BATCH_SIZE = 500
 
-class PuppySerializer(serializers.ModelSerializer):
+
+class PuppySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Puppy
-        fields = ('name', 'age', 'breed', 'color', 'created_at', 'updated_at')
\ No newline at end of file
+        fields = ('id', 'name', 'age', 'breed', 'color', 'created_at', 'updated_at')
+
+
+class PuppyListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """Saves a whole list of puppies with bulk queries instead of one per item"""
+
+    def create(self, validated_data):
+        puppies = [Puppy(**item) for item in validated_data]
+        Puppy.objects.bulk_create(puppies, batch_size=BULK_BATCH_SIZE)
+        return puppies
+
+    def update(self, instances, validated_data):
+        """``instances`` maps ids to the puppies being updated"""
+        puppies, fields = [], {'updated_at'}
+        now = timezone.now()
+        for item in validated_data:
+            puppy = instances[item.pop('id')]
+            for attr, value in item.items():
+                setattr(puppy, attr, value)
+            # bulk_update() skips auto_now
+            puppy.updated_at = now
+            fields.update(item)
+            puppies.append(puppy)
+        Puppy.objects.bulk_update(puppies, fields, batch_size=BULK_BATCH_SIZE)
+        return puppies
+
+
+class PuppyBulkSerializer(PuppySerializer):
+    class Meta(PuppySerializer.Meta):
+        list_serializer_class = PuppyListSerializer
+
+
+class PuppyBulkUpdateSerializer(PuppyBulkSerializer):
+    id = serializers.UUIDField()
+
+    def validate(self, attrs):
+        # PATCH skips missing fields, but the id is always needed
+        if 'id' not in attrs:
+            raise serializers.ValidationError({'id': [self.fields['id'].error_messages['required']]})
+        return attrs
+
+
+class MessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ('id', 'user', 'body', 'created_at')
@@ -0,0 +1,29 @@
+import logging
+import os
+import socket
+from celery import shared_task
+from .messages import flush_messages
+
+logger = logging.getLogger(__name__)
+
+
+def writer_name():
+    """Consumer name of this process in the writers group"""
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+@shared_task
+def flush_room_messages():
+    """
+    Safety net for the message writer: saves whatever is buffered, including
+    batches a dead writer left unacked
+    """
+    saved = 0
+    while True:
+        handled = flush_messages(writer_name())
+        if not handled:
+            break
+        saved += handled
+    if saved:
+        logger.info('Flushed %s room messages', saved)
+    return saved
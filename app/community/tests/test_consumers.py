@@ -0,0 +1,101 @@
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from community.messages import get_message_buffer
+from community.models import Message, Room
+from community.routing import websocket_urlpatterns
+from core.routing import application
+from user.models import User
+
+router = URLRouter(websocket_urlpatterns)
+
+
+def as_user(user):
+    """The socket router with ``user`` already in the scope"""
+    return lambda scope: router(dict(scope, user=user))
+
+
+async def receive_events(communicator, count):
+    """The next ``count`` events, and the number of frames they came in"""
+    events, frames = [], 0
+    while len(events) < count:
+        frame = await communicator.receive_json_from(timeout=2)
+        if frame['type'] == 'batch':
+            events.extend(frame['events'])
+            frames += 1
+    return events, frames
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   ROOM_PRESENCE={'BACKEND': 'community.presence.MemoryPresence'},
+                   ROOM_MESSAGE_BUFFER={'BACKEND': 'community.messages.MemoryMessageBuffer'})
+class RoomConsumerTest(TransactionTestCase):
+    """Test module for room sockets on the in-memory channel layer"""
+
+    def setUp(self):
+        self.room = Room.objects.create(name='Lobby')
+        self.path = f'/ws/rooms/{self.room.pk}/'
+        self.ada = User.objects.create_user('ada@example.com', 'pAssw0rd!', verified=True)
+        self.bola = User.objects.create_user('bola@example.com', 'pAssw0rd!', verified=True)
+
+    def test_requires_a_valid_token(self):
+        async def run():
+            origin = [(b'origin', b'http://localhost')]
+            anonymous = WebsocketCommunicator(application, self.path, headers=origin)
+            self.assertFalse((await anonymous.connect())[0])
+            token = AccessToken.for_user(self.ada)
+            socket = WebsocketCommunicator(application, f'{self.path}?token={token}', headers=origin)
+            self.assertTrue((await socket.connect())[0])
+            self.assertEqual(await socket.receive_json_from(), {'type': 'presence', 'users': [str(self.ada.pk)]})
+            await socket.disconnect()
+        async_to_sync(run)()
+
+    def test_unknown_room_is_rejected(self):
+        async def run():
+            socket = WebsocketCommunicator(as_user(self.ada), '/ws/rooms/8d9f4f6e-3a4b-4c2d-9e1f-0a1b2c3d4e5f/')
+            self.assertFalse((await socket.connect())[0])
+        async_to_sync(run)()
+
+    def test_messages_fan_out_in_batches(self):
+        async def run():
+            ada = WebsocketCommunicator(as_user(self.ada), self.path)
+            bola = WebsocketCommunicator(as_user(self.bola), self.path)
+            await ada.connect()
+            await ada.receive_json_from()
+            await bola.connect()
+            presence = await bola.receive_json_from()
+            self.assertEqual(presence['users'], [str(self.ada.pk), str(self.bola.pk)])
+            for body in ('one', 'two', 'three'):
+                await ada.send_json_to({'type': 'message', 'body': body})
+            # Both joins and the three messages, in fewer frames than events
+            events, frames = await receive_events(ada, 5)
+            self.assertEqual([event['type'] for event in events], ['join', 'join', 'message', 'message', 'message'])
+            self.assertLess(frames, 5)
+            events, _ = await receive_events(bola, 4)
+            self.assertEqual([event.get('body') for event in events], [None, 'one', 'two', 'three'])
+            await bola.disconnect()
+            self.assertEqual((await receive_events(ada, 1))[0], [{'type': 'leave', 'user': str(self.bola.pk)}])
+            await ada.send_json_to({'type': 'presence'})
+            self.assertEqual((await ada.receive_json_from())['users'], [str(self.ada.pk)])
+            await ada.disconnect()
+        async_to_sync(run)()
+        # Buffered for the writer, not saved by the socket
+        tail = get_message_buffer().tail(self.room.pk)
+        self.assertEqual([record['body'] for record in tail], ['three', 'two', 'one'])
+        self.assertFalse(Message.objects.exists())
+
+
+class RoomLoadTestCommandTest(TransactionTestCase):
+    """Test module for the room_load_test command"""
+
+    def test_in_memory_run_needs_no_redis(self):
+        out = StringIO()
+        with mock.patch('aioredis.create_redis_pool', side_effect=ConnectionRefusedError):
+            call_command('room_load_test', '--in-memory', sockets=4, rooms=2, messages=2, rate=50, stdout=out)
+        self.assertIn('8 messages sent, 16 delivered, 0 missing', out.getvalue())
+        self.assertFalse(Message.objects.exists())
@@ -0,0 +1,106 @@
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from community.messages import MemoryMessageBuffer, flush_messages, get_message_buffer
+from community.models import Message, Room
+from user.models import User
+
+
+def record(room, user, body, sent):
+    return {'room': str(room.pk), 'id': uuid.uuid4().hex, 'user': str(user.pk), 'body': body, 'time': sent}
+
+
+class FlushMessagesTest(TestCase):
+    """Test module for saving buffered room messages"""
+
+    def setUp(self):
+        self.buffer = MemoryMessageBuffer(claim_idle=0)
+        self.room = Room.objects.create(name='Lobby')
+        self.user = User.objects.create_user('ada@example.com', 'pAssw0rd!')
+
+    def append(self, *records):
+        for item in records:
+            async_to_sync(self.buffer.append)(item)
+
+    def test_saves_a_batch_with_one_insert(self):
+        self.append(*[record(self.room, self.user, f'message {n}', time.time()) for n in range(5)])
+        # The room and user checks, then one insert
+        with self.assertNumQueries(3):
+            self.assertEqual(flush_messages('writer', buffer=self.buffer), 5)
+        self.assertEqual(Message.objects.filter(room=self.room, user=self.user).count(), 5)
+        self.assertEqual(flush_messages('writer', buffer=self.buffer), 0)
+
+    def test_redelivered_batch_is_not_saved_twice(self):
+        self.append(record(self.room, self.user, 'hello', time.time()))
+        ack, self.buffer.ack = self.buffer.ack, lambda entry_ids: None
+        # The writer dies after saving but before acking
+        flush_messages('writer', buffer=self.buffer)
+        self.assertEqual(Message.objects.count(), 1)
+        self.buffer.ack = ack
+        self.assertEqual(flush_messages('other', buffer=self.buffer), 1)
+        self.assertEqual(Message.objects.count(), 1)
+        self.assertEqual(flush_messages('other', buffer=self.buffer), 0)
+
+    def test_messages_of_deleted_rooms_and_users(self):
+        gone = Room.objects.create(name='Gone')
+        leaver = User.objects.create_user('leaver@example.com', 'pAssw0rd!')
+        self.append(record(gone, self.user, 'lost', time.time()),
+                    record(self.room, leaver, 'kept', time.time()))
+        gone.delete()
+        leaver.delete()
+        self.assertEqual(flush_messages('writer', buffer=self.buffer), 2)
+        self.assertEqual(list(Message.objects.values_list('body', 'user')), [('kept', None)])
+
+
+@override_settings(ROOM_MESSAGE_BUFFER={'BACKEND': 'community.messages.MemoryMessageBuffer',
+                                       'CONFIG': {'tail': 3}})
+class RoomMessagesTest(TestCase):
+    """Test module for the room history API"""
+
+    def setUp(self):
+        self.room = Room.objects.create(name='Lobby')
+        self.user = User.objects.create_user('ada@example.com', 'pAssw0rd!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('room-messages', kwargs={'room_id': self.room.pk})
+        # Eight messages: five saved, the last three still in the tail
+        # with the newest of them not saved yet
+        start = time.time() - 100
+        self.records = [record(self.room, self.user, f'message {n}', start + n) for n in range(8)]
+        buffer = get_message_buffer()
+        for item in self.records:
+            async_to_sync(buffer.append)(item)
+        flush_messages('writer', batch_size=7)
+
+    def bodies(self, response):
+        return [message['body'] for message in response.data['results']]
+
+    def test_recent_page_comes_from_the_tail(self):
+        # Only the room check, no messages query
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.bodies(response), ['message 7', 'message 6'])
+
+    def test_pages_run_from_the_tail_into_the_database(self):
+        bodies, url = [], f'{self.url}?page_size=3'
+        while url:
+            response = self.client.get(url)
+            bodies.extend(self.bodies(response))
+            url = response.data['links']['next']
+        self.assertEqual(bodies, [f'message {n}' for n in range(7, -1, -1)])
+        # And back up again, through the unsaved message
+        response = self.client.get(response.data['links']['previous'])
+        self.assertEqual(self.bodies(response), ['message 4', 'message 3', 'message 2'])
+        response = self.client.get(response.data['links']['previous'])
+        self.assertEqual(self.bodies(response), ['message 7', 'message 6', 'message 5'])
+        self.assertIsNone(response.data['links']['previous'])
+
+    def test_requires_login_and_a_room(self):
+        self.assertEqual(APIClient().get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        url = reverse('room-messages', kwargs={'room_id': uuid.uuid4()})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
@@ -1,15 +1,22 @@
 import json
 import uuid
+from unittest import mock
 from rest_framework import status
+from django.db import connection
+from django.db.models.signals import post_delete
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from community.models import Puppy
 from community.serializers import PuppySerializer
+from core.conditional import check_preconditions, make_etag, save_if_unchanged
+from core.testing import QueryBudgetMixin
 
 client = Client()
 
 
-class GetAllPuppiesTest(TestCase):
+class GetAllPuppiesTest(QueryBudgetMixin, TestCase):
     """Test modules to get all puppies API"""
 
     def setUp(self):
@@ -20,11 +27,40 @@ class GetAllPuppiesTest(TestCase):
 
     def test_get_all_puppies(self):
         response = client.get(reverse('puppy'))
-        puppies = Puppy.objects.all()
+        puppies = Puppy.objects.order_by('-created_at', '-id')
         serializer = PuppySerializer(puppies, many=True)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_filter_puppies(self):
+        response = client.get(reverse('puppy'), {'breed': 'Labrador', 'min_age': 2})
+        self.assertEqual([puppy['name'] for puppy in response.data['results']], ['Ricky'])
+        response = client.get(reverse('puppy'), {'color': 'Black', 'ordering': 'created_at'})
+        self.assertEqual([puppy['name'] for puppy in response.data['results']], ['Casper', 'Rambo'])
+
+    def test_paginate_puppies(self):
+        names, url = [], reverse('puppy') + '?page_size=2&ordering=created_at&max_age=5'
+        while url:
+            response = client.get(url)
+            names.extend(puppy['name'] for puppy in response.data['results'])
+            url = response.data['links']['next']
+        self.assertEqual(names, ['Casper', 'Muffin', 'Rambo'])
+
+    def test_query_budget(self):
+        with self.assertQueryBudget(1):
+            client.get(reverse('puppy'), {'breed': 'Labrador', 'page_size': 100})
+
+    def test_results_are_addressable(self):
+        for puppy in client.get(reverse('puppy')).data['results']:
+            response = client.get(reverse('puppy-detail', kwargs={'pk': puppy['id']}))
+            self.assertEqual(response.data['name'], puppy['name'])
+
+    def test_invalid_filters(self):
+        response = client.get(reverse('puppy'), {'min_age': 'old'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.get(reverse('puppy'), {'ordering': 'name'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class GetSinglePuppyTest(TestCase):
     """Test module to GET single puppy API"""
@@ -65,8 +101,11 @@ class CreateNewPuppyTest(TestCase):
         }
 
     def test_create_valid_puppy(self):
-        response = client.post(reverse('puppy'), data=json.dumps(self.valid_payload), content_type='application/json')
+        response = client.post(reverse('puppy'), data=json.dumps(dict(self.valid_payload, id=str(uuid.uuid4()))),
+                               content_type='application/json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # The id is the server's, clients can't pick it
+        self.assertEqual(str(Puppy.objects.get().pk), response.data['id'])
 
     def test_create_invalid_payload(self):
         response = client.post(reverse('puppy'), data=json.dumps(self.invalid_payload), content_type='application/json')
@@ -96,6 +135,7 @@ class UpdateSinglePuppyTest(TestCase):
         response = client.put(reverse('puppy-detail', kwargs={'pk': self.muffin.pk}),
                               data=json.dumps(self.valid_payload), content_type='application/json')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response.content, b'')
 
     def test_invalid_update_puppy(self):
         response = client.put(reverse('puppy-detail', kwargs={'pk': self.muffin.pk}),
@@ -117,3 +157,164 @@ class DeleteSinglePuppyTest(TestCase):
     def test_invalid_delete_puppy(self):
         response = client.delete(reverse('puppy-detail', kwargs={'pk': uuid.uuid4()}))
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExportPuppiesTest(TestCase):
+    """Test module for the streaming puppy export"""
+
+    def setUp(self):
+        for index in range(5):
+            Puppy.objects.create(name=f'Puppy {index}', age=index, breed='Labrador', color='Black')
+
+    def test_export_json_array(self):
+        response = client.get(reverse('puppy-export'))
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        serializer = PuppySerializer(Puppy.objects.order_by('created_at'), many=True)
+        self.assertEqual(data, json.loads(json.dumps(serializer.data)))
+
+    def test_export_ndjson(self):
+        response = client.get(reverse('puppy-export'), {'output': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines],
+                         [f'Puppy {index}' for index in range(5)])
+
+
+class BulkPuppiesTest(TestCase):
+    """Test module for bulk create, update and delete of puppies"""
+
+    def setUp(self):
+        self.casper = Puppy.objects.create(name='Casper', age=4, breed='Bull Dog', color='Black')
+        self.muffin = Puppy.objects.create(name='Muffin', age=3, breed='Gradane', color='Brown')
+        self.url = reverse('puppy-bulk')
+
+    def request(self, method, payload):
+        return getattr(client, method)(self.url, data=json.dumps(payload), content_type='application/json')
+
+    def test_bulk_create(self):
+        payload = [{'name': f'Puppy {i}', 'age': i % 10, 'breed': 'Labrador', 'color': 'Black'}
+                   for i in range(1000)]
+        # Savepoints plus one INSERT per batch of 500
+        with self.assertNumQueries(4):
+            response = self.request('post', payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 1000)
+        self.assertEqual(Puppy.objects.filter(breed='Labrador').count(), 1000)
+
+    def test_bulk_create_invalid_item(self):
+        payload = [{'name': 'Rambo', 'age': 1, 'breed': 'Labrador', 'color': 'Black'},
+                   {'name': '', 'age': 1, 'breed': 'Labrador', 'color': 'Black'}]
+        response = self.request('post', payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('name', response.data[1])
+        self.assertFalse(Puppy.objects.filter(name='Rambo').exists())
+
+    def test_bulk_update(self):
+        payload = [{'id': str(self.casper.pk), 'age': 5}, {'id': str(self.muffin.pk), 'color': 'White'}]
+        with self.assertNumQueries(4):
+            response = self.request('patch', payload)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.casper.refresh_from_db()
+        self.muffin.refresh_from_db()
+        self.assertEqual((self.casper.age, self.muffin.color), (5, 'White'))
+
+    def test_bulk_update_unknown_id(self):
+        payload = [{'id': str(self.casper.pk), 'age': 5}, {'id': str(uuid.uuid4()), 'age': 1}, {'age': 2}]
+        response = self.request('patch', payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', response.data[2])
+        response = self.request('patch', payload[:2])
+        self.assertEqual(response.data, [{}, {'id': ['Not found.']}])
+        self.casper.refresh_from_db()
+        self.assertEqual(self.casper.age, 4)
+
+    def test_bulk_delete(self):
+        receiver = mock.Mock()
+        post_delete.connect(receiver, sender=Puppy)
+        self.addCleanup(post_delete.disconnect, receiver, sender=Puppy)
+        # The ids checked and locked, the rows loaded for post_delete, one DELETE
+        with self.assertNumQueries(5), mock.patch('core.caching.bump_generation') as bump_in_watcher, \
+                mock.patch('community.views.bump_generation') as bump_in_view:
+            response = self.request('delete', [str(self.casper.pk), str(self.muffin.pk)])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Puppy.objects.exists())
+        self.assertEqual(receiver.call_count, 2)
+        # One bump for the whole request, none per row
+        bump_in_watcher.assert_not_called()
+        bump_in_view.assert_called_once_with(Puppy)
+
+    def test_bulk_delete_invalid_ids(self):
+        response = self.request('delete', [str(self.casper.pk), 'not-an-id', str(uuid.uuid4())])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(Puppy.objects.count(), 2)
+
+    def test_not_a_list(self):
+        response = self.request('post', {'name': 'Rambo'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PuppyConditionalRequestTest(TestCase):
+    """Test module for ETags on the puppy detail endpoint"""
+
+    def setUp(self):
+        self.casper = Puppy.objects.create(name='Casper', age=4, breed='Bull Dog', color='Black')
+        self.url = reverse('puppy-detail', kwargs={'pk': self.casper.pk})
+        self.payload = {'name': 'Casper', 'age': 5, 'breed': 'Bull Dog', 'color': 'Black'}
+
+    def test_if_none_match_returns_304(self):
+        etag = client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_if_match_on_put(self):
+        etag = client.get(self.url)['ETag']
+        response = client.put(self.url, data=json.dumps(self.payload),
+                              content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        # A 204 body would be read as the next response on a keep-alive connection
+        self.assertEqual(response.content, b'')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(client.get(self.url)['ETag'], response['ETag'])
+        response = client.put(self.url, data=json.dumps(dict(self.payload, age=6)),
+                              content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.casper.refresh_from_db()
+        self.assertEqual(self.casper.age, 5)
+
+    def test_lost_update_is_rejected(self):
+        stale = Puppy.objects.get(pk=self.casper.pk)
+        Puppy.objects.get(pk=self.casper.pk).save()
+        serializer = PuppySerializer(stale, data=self.payload)
+        self.assertTrue(serializer.is_valid())
+        self.assertFalse(save_if_unchanged(serializer, 'updated_at', make_etag(stale.updated_at)))
+
+    def test_conditional_save_is_one_update(self):
+        serializer = PuppySerializer(self.casper, data=dict(self.payload, age=6))
+        self.assertTrue(serializer.is_valid())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(save_if_unchanged(serializer, 'updated_at', make_etag(self.casper.updated_at)))
+        self.assertEqual([query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']],
+                         ['UPDATE'])
+        self.casper.refresh_from_db()
+        self.assertEqual(self.casper.age, 6)
+
+    def test_write_after_precondition_check_is_rejected(self):
+        etag = client.get(self.url)['ETag']
+
+        def check_then_write(*args):
+            response = check_preconditions(*args)
+            Puppy.objects.filter(pk=self.casper.pk).update(age=7, updated_at=timezone.now())
+            return response
+
+        with mock.patch('community.views.check_preconditions', side_effect=check_then_write):
+            response = client.put(self.url, data=json.dumps(self.payload),
+                                  content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.casper.refresh_from_db()
+        self.assertEqual(self.casper.age, 7)
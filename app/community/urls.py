@@ -2,6 +2,9 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+    path('puppies/bulk/', views.bulk_puppies, name='puppy-bulk'),
+    path('puppies/export/', views.export_puppies, name='puppy-export'),
     path('puppies/<str:pk>/', views.get_delete_update_puppy, name='puppy-detail'),
     path('puppies/', views.get_post_puppy, name='puppy'),
+    path('rooms/<uuid:room_id>/messages/', views.room_messages, name='room-messages'),
 ]
\ No newline at end of file
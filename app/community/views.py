@@ -1,14 +1,36 @@
 from django.shortcuts import render
-from rest_framework.decorators import api_view
+from django.db import transaction
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework import serializers
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Puppy
-from .serializers import PuppySerializer
+from .models import Puppy, Room
+from .messages import MessageHistoryPagination
+from .serializers import (PuppySerializer, PuppyBulkSerializer, PuppyBulkUpdateSerializer,
+                          MessageSerializer)
+from core.caching import bump_generation, suspend_invalidation
+from core.conditional import check_preconditions, make_etag, precondition_failed, save_if_unchanged
+from core.streaming import export_response
+from core.serializers import ValuesSerializer
+from core.pagination import KeysetPagination
+from .filters import PuppyFilter
 # Create your views here.
 
+PUPPY_LIST_SERIALIZER = ValuesSerializer(PuppySerializer)
+PUPPY_ORDERINGS = {
+    'created_at': ('created_at', 'id'),
+    '-created_at': ('-created_at', '-id'),
+}
+BULK_MAX_ITEMS = 1000
+
 
 @api_view(['GET', 'DELETE', 'PUT'])
 def get_delete_update_puppy(request, pk):
+    precondition = check_preconditions(request, Puppy.objects.all(), pk, 'updated_at')
+    if precondition is not None:
+        return precondition
     try:
         puppy = Puppy.objects.get(pk=pk)
     except Puppy.DoesNotExist:
@@ -16,24 +38,38 @@ def get_delete_update_puppy(request, pk):
 
     if request.method == 'GET':
         serializer = PuppySerializer(puppy)
-        return Response(serializer.data)
+        return Response(serializer.data, headers={'ETag': make_etag(puppy.updated_at)})
     elif request.method == 'DELETE':
         puppy.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     elif request.method == 'PUT':
         serializer = PuppySerializer(puppy, data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_204_NO_CONTENT)
+            if 'HTTP_IF_MATCH' not in request.META:
+                serializer.save()
+            elif not save_if_unchanged(serializer, 'updated_at', request.META['HTTP_IF_MATCH']):
+                return precondition_failed()
+            # No body with a 204, clients would read it as the next response
+            return Response(status=status.HTTP_204_NO_CONTENT,
+                            headers={'ETag': make_etag(puppy.updated_at)})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['GET', 'POST'])
 def get_post_puppy(request):
     if request.method == 'GET':
-        puppies = Puppy.objects.all()
-        serializer = PuppySerializer(puppies, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        filterset = PuppyFilter(request.GET, queryset=Puppy.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        ordering = request.GET.get('ordering', '-created_at')
+        if ordering not in PUPPY_ORDERINGS:
+            return Response({'ordering': [f'Must be one of {", ".join(PUPPY_ORDERINGS)}']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        paginator = KeysetPagination()
+        paginator.ordering = PUPPY_ORDERINGS[ordering]
+        puppies = paginator.paginate_queryset(
+            PUPPY_LIST_SERIALIZER.prepare(filterset.qs, extra=['id']), request)
+        return paginator.get_paginated_response(PUPPY_LIST_SERIALIZER.to_representation(puppies))
     elif request.method == 'POST':
         data = {
             'name': request.data.get('name'),
@@ -46,3 +82,104 @@ def get_post_puppy(request):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+def export_puppies(request):
+    """Stream every puppy as a JSON array, or NDJSON with ?output=ndjson"""
+    return export_response(request, Puppy.objects.order_by('created_at'), PuppySerializer, 'puppies')
+
+
+def _id_errors(ids, found):
+    """Per item errors, in request order, for ids that don't exist or repeat"""
+    errors, seen = [], set()
+    for pk in ids:
+        if pk not in found:
+            errors.append({'id': ['Not found.']})
+        elif pk in seen:
+            errors.append({'id': ['Duplicate id.']})
+        else:
+            errors.append({})
+        seen.add(pk)
+    return errors
+
+
+def _bulk_update(request):
+    serializer = PuppyBulkUpdateSerializer(data=request.data, many=True,
+                                           partial=request.method == 'PATCH')
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    ids = [item['id'] for item in serializer.validated_data]
+    with transaction.atomic():
+        puppies = Puppy.objects.select_for_update().in_bulk(ids)
+        errors = _id_errors(ids, puppies)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.instance = puppies
+        serializer.save()
+    bump_generation(Puppy)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+def _bulk_delete(request):
+    field, ids, errors = serializers.UUIDField(), [], []
+    for item in request.data:
+        try:
+            ids.append(field.to_internal_value(item))
+            errors.append({})
+        except ValidationError as e:
+            ids.append(None)
+            errors.append({'id': e.detail})
+    if any(errors):
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        queryset = Puppy.objects.filter(pk__in=ids)
+        errors = _id_errors(ids, set(queryset.select_for_update().values_list('pk', flat=True)))
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        # Loads the rows to send post_delete, for anyone listening. The caches
+        # skip it, one bump instead of one per row
+        with suspend_invalidation(Puppy):
+            queryset.delete()
+    # Once committed, a read in between may have cached the rows
+    bump_generation(Puppy)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['POST', 'PUT', 'PATCH', 'DELETE'])
+def bulk_puppies(request):
+    """
+    Create (POST), update (PUT/PATCH, items need their id) or delete (DELETE,
+    a list of ids) up to BULK_MAX_ITEMS puppies in one transaction. Nothing is
+    written unless every item is valid; errors come back as a list in request order.
+    """
+    if not isinstance(request.data, list):
+        return Response({'non_field_errors': ['Expected a list of items.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if len(request.data) > BULK_MAX_ITEMS:
+        return Response({'non_field_errors': [f'At most {BULK_MAX_ITEMS} items per request.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if request.method == 'POST':
+        serializer = PuppyBulkSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            serializer.save()
+        # Bulk queries send no post_save/post_delete
+        bump_generation(Puppy)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    elif request.method == 'DELETE':
+        return _bulk_delete(request)
+    return _bulk_update(request)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def room_messages(request, room_id):
+    """A room's messages, newest first, in keyset pages"""
+    if not Room.objects.filter(pk=room_id).exists():
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    paginator = MessageHistoryPagination()
+    messages = paginator.paginate_room(room_id, request)
+    return paginator.get_paginated_response(MessageSerializer(messages, many=True).data)
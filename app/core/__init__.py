@@ -0,0 +1,4 @@
+# Web processes queue tasks through this app, not celery's default broker
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -0,0 +1,183 @@
+"""
+Versioned cache helpers shared by the apps.
+
+Cached values are stored under keys that embed a generation number for every
+model they were built from. Saving or deleting a watched model bumps its
+generation, so every key built from it is skipped from then on and simply
+ages out of Redis; nothing has to be deleted by pattern.
+
+Rebuilds are protected against stampedes in two ways: a value is recomputed
+a little before it expires (probabilistic early expiration, aka XFetch) and
+only the worker holding a short ``add`` lock in the ``locks`` cache does the
+recomputation while the others keep serving the current value.
+"""
+import math
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models.signals import post_save, post_delete
+from .metrics import record_cache_lookup
+from .replicas import use_primary
+
+CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
+LOCK_TIMEOUT = 10  # seconds a rebuild lock is held at most
+LOCK_WAIT = 2  # seconds a cold miss waits for another worker's rebuild
+LOCK_POLL_INTERVAL = 0.05
+EARLY_RECOMPUTE_BETA = 1.0
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _record(event):
+    with _stats_lock:
+        _stats[event] += 1
+    if event != 'rebuild':
+        record_cache_lookup(event)
+
+
+def stats():
+    """Hit, miss and rebuild counters of the current process"""
+    with _stats_lock:
+        return {'hit': _stats['hit'], 'miss': _stats['miss'], 'rebuild': _stats['rebuild']}
+
+
+def _generation_key(model):
+    return 'cache-gen:%s' % model._meta.label_lower
+
+
+def _initial_generation():
+    # Millisecond clock so an evicted counter never restarts at a value an
+    # older, still cached entry was built with.
+    return int(time.time() * 1000)
+
+
+def get_generations(models):
+    keys = [_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _initial_generation(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(model):
+    """Invalidate every versioned key built from ``model``"""
+    key = _generation_key(model)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, _initial_generation(), timeout=None):
+            return cache.get(key)
+        return cache.incr(key)
+
+
+def versioned_key(key, models=()):
+    if not models:
+        return key
+    generations = get_generations(models)
+    return '%s:v%s' % (key, '.'.join(str(generation) for generation in generations))
+
+
+def _should_recompute(delta, expires_at, beta=EARLY_RECOMPUTE_BETA):
+    if expires_at is None:
+        return False
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+def _rebuild(key, builder, timeout):
+    started = time.time()
+    # Everybody gets this value until it expires, don't build it from a
+    # replica that may not have the write which bumped the generation yet
+    with use_primary():
+        value = builder()
+    delta = time.time() - started
+    expires_at = None if timeout is None else time.time() + timeout
+    cache.set(key, (value, delta, expires_at), timeout=timeout)
+    _record('rebuild')
+    return value
+
+
+def get_or_build(key, builder, timeout=CACHE_TTL, models=()):
+    """
+    Return the cached value for ``key``, building it with ``builder()`` when
+    it is missing, stale or about to expire.
+
+    ``models`` lists the model classes the value depends on; it is dropped as
+    soon as any of them is saved or deleted (see ``watch``).
+    """
+    if timeout is DEFAULT_TIMEOUT:
+        timeout = cache.default_timeout
+    key = versioned_key(key, models)
+    lock_key = '%s:lock' % key
+    locks = caches['locks']
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires_at = entry
+        # Only one worker refreshes early, everybody else keeps the old value
+        if not _should_recompute(delta, expires_at) or not locks.add(lock_key, 1, LOCK_TIMEOUT):
+            _record('hit')
+            return value
+    else:
+        _record('miss')
+        if not locks.add(lock_key, 1, LOCK_TIMEOUT):
+            deadline = time.time() + LOCK_WAIT
+            while time.time() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                entry = cache.get(key)
+                if entry is not None:
+                    return entry[0]
+            return _rebuild(key, builder, timeout)
+
+    try:
+        return _rebuild(key, builder, timeout)
+    finally:
+        locks.delete(lock_key)
+
+
+_watched_fields = {}
+_suspended = threading.local()
+
+
+@contextmanager
+def suspend_invalidation(*models):
+    """
+    Saves and deletes of ``models`` in this thread leave their generation
+    alone, for bulk paths that bump it once themselves afterwards.
+    """
+    previous = getattr(_suspended, 'models', frozenset())
+    _suspended.models = previous | frozenset(models)
+    try:
+        yield
+    finally:
+        _suspended.models = previous
+
+
+def _invalidate(sender, update_fields=None, **kwargs):
+    if sender in getattr(_suspended, 'models', ()):
+        return
+    fields = _watched_fields.get(sender)
+    if fields and update_fields is not None and fields.isdisjoint(update_fields):
+        return
+    bump_generation(sender)
+
+
+def watch(*models, fields=None):
+    """
+    Bump the generation of ``models`` whenever an instance is saved or deleted.
+    With ``fields``, the ones cached values are built from, saves whose
+    ``update_fields`` leave all of them out don't.
+    """
+    for model in models:
+        if fields:
+            _watched_fields[model] = frozenset(fields)
+        uid = 'core.caching:%s' % model._meta.label_lower
+        post_save.connect(_invalidate, sender=model, dispatch_uid=uid)
+        post_delete.connect(_invalidate, sender=model, dispatch_uid=uid)
@@ -1,4 +1,3 @@
-from django_redis import get_redis_connection
 import os
 
 from celery import Celery
@@ -12,5 +11,8 @@ app.autodiscover_tasks()
 
 
 def tearDown(self):
-    get_redis_connection("default").flushall()
+    # Imported here, this module loads with the settings, before Django is ready
+    from .redis import get_redis
+    # The cache database only, flushall() would take the broker and sessions too
+    get_redis('cache').flushdb()
     print('Cache Flushed!!')
@@ -0,0 +1,99 @@
+"""
+Conditional requests for detail endpoints.
+
+ETags come from a row's ``auto_now`` timestamp, so checking one is a single
+column primary key lookup and a matching ``If-None-Match`` gets a 304 before
+the row is loaded or serialized. The same ETag in ``If-Match`` on a write
+gives optimistic concurrency: the save only goes through while the row still
+holds the timestamp the client saw, with no lock held in between.
+"""
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+CONDITIONAL_HEADERS = ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH')
+
+
+def make_etag(timestamp):
+    return quote_etag('%x' % int(timestamp.timestamp() * 1000000))
+
+
+def current_etag(queryset, pk, field):
+    """ETag of the row ``pk`` without loading it, None if it doesn't exist"""
+    try:
+        timestamp = queryset.filter(pk=pk).values_list(field, flat=True).first()
+    except (ValueError, ValidationError):
+        return None
+    return make_etag(timestamp) if timestamp else None
+
+
+def check_preconditions(request, queryset, pk, field):
+    """
+    The 304 or 412 response ``If-None-Match``/``If-Match`` call for, None when
+    the view should carry on. Costs nothing on requests without them.
+    """
+    if not any(header in request.META for header in CONDITIONAL_HEADERS):
+        return None
+    etag = current_etag(queryset, pk, field)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        return None
+    if response.status_code == status.HTTP_412_PRECONDITION_FAILED:
+        return precondition_failed()
+    # A 304 carries the validator it matched, clients refresh theirs from it
+    response['ETag'] = etag
+    return response
+
+
+def precondition_failed():
+    return Response({'message': 'Resource has been modified'}, status=status.HTTP_412_PRECONDITION_FAILED)
+
+
+class RowChanged(DatabaseError):
+    """A conditional save found the row changed since the instance was loaded"""
+
+
+class ConditionalUpdateMixin:
+    """
+    Model mixin letting ``save_if_unchanged()`` make its version check part
+    of the ``UPDATE`` that ``save()`` runs, instead of a separate write.
+    """
+    _update_condition = None
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        if self._update_condition is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if not super()._do_update(base_qs.filter(**self._update_condition), using, pk_val, values,
+                                  update_fields, forced_update):
+            # save() would fall back to an INSERT of the existing primary key
+            raise RowChanged
+        return True
+
+
+def save_if_unchanged(serializer, field, if_match):
+    """
+    ``serializer.save()`` as a compare and swap on ``field``: the row is only
+    written if the instance still carries an ETag from the ``if_match`` header
+    and the row still holds the value the instance was loaded with. The check
+    is a condition of the save's own ``UPDATE``, so the row is written once
+    and only locked for that statement. The model needs
+    ``ConditionalUpdateMixin``. Returns False when another write got there first.
+    """
+    instance = serializer.instance
+    etags = parse_etags(if_match)
+    # The instance is loaded after check_preconditions(), a write in between shows up here
+    if '*' not in etags and make_etag(getattr(instance, field)) not in etags:
+        return False
+    instance._update_condition = {field: getattr(instance, field)}
+    try:
+        # Undoes whatever the serializer wrote before the model's save
+        with transaction.atomic():
+            serializer.save()
+    except RowChanged:
+        return False
+    finally:
+        del instance._update_condition
+    return True
@@ -0,0 +1,177 @@
+"""
+Per-request query and timing instrumentation.
+
+``InstrumentationMiddleware`` measures a sample of the requests, see
+``INSTRUMENTATION_SAMPLE_RATE``: the number of SQL queries and the time
+spent in them on every database alias, the Redis commands sent by caches,
+sessions and locks, and the time spent in the project's serializers, see
+``core.serializers.TimedSerializerMixin``. The totals go to the
+``Server-Timing`` response header, which browsers show next to the request,
+and to a ``core.instrumentation`` log record whose fields are attributes of
+the record, ready for a structured formatter.
+
+Queries are grouped by shape, their SQL with literals and parameters
+replaced, so a shape running ``INSTRUMENTATION_N_PLUS_ONE_THRESHOLD`` times
+or more in one request is logged as a warning: a loop doing one query per
+row instead of a join or a prefetch.
+
+Requests that aren't sampled don't pay anything but a random number.
+"""
+import contextvars
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+_LITERALS = re.compile(r"'(?:''|[^'])*'|\b\d+(?:\.\d+)?\b|%s")
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def sql_shape(sql):
+    """``sql`` with its literals and parameters replaced, so one query run with other values looks the same"""
+    return _LISTS.sub('(?...)', _LITERALS.sub('?', sql))
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = self.cache_time = self.serializer_time = 0.0
+        self.cache_calls = 0
+        self.shapes = Counter()
+        self.serializing = False
+
+    def execute(self, execute, sql, params, many, context):
+        """A database ``execute_wrapper`` counting every query"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    @property
+    def duplicates(self):
+        """Queries that repeated the shape of an earlier one"""
+        return sum(count - 1 for count in self.shapes.values())
+
+    def n_plus_one(self):
+        """``(shape, count)`` of the shapes repeated often enough to be a query per row"""
+        threshold = settings.INSTRUMENTATION_N_PLUS_ONE_THRESHOLD
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries, {self.duplicates} duplicates"',
+            f'cache;dur={self.cache_time * 1000:.1f};desc="{self.cache_calls} calls"',
+            f'serialize;dur={self.serializer_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_time_ms': round(self.db_time * 1000, 2),
+            'duplicate_queries': self.duplicates,
+            'cache_calls': self.cache_calls,
+            'cache_time_ms': round(self.cache_time * 1000, 2),
+            'serializer_time_ms': round(self.serializer_time * 1000, 2),
+        }
+
+
+def current():
+    """The metrics of the request being measured, None when it isn't"""
+    return _metrics.get()
+
+
+def record_cache_call(elapsed):
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.cache_calls += 1
+        metrics.cache_time += elapsed
+
+
+@contextmanager
+def serializing():
+    """Count the block as serializer time, nested serializers only once"""
+    metrics = _metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - started
+        metrics.serializing = False
+
+
+@contextmanager
+def measure(metrics=None):
+    """Collect the metrics of the block, in ``metrics`` or new ones, yields them"""
+    metrics = metrics or RequestMetrics()
+    token = _metrics.set(metrics)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(metrics.execute))
+            yield metrics
+    finally:
+        _metrics.reset(token)
+
+
+class InstrumentationMiddleware:
+    """Adds ``Server-Timing`` and logs the metrics of a sample of the requests"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+        started = time.perf_counter()
+        with measure() as metrics:
+            response = self.get_response(request)
+        if response.streaming:
+            # The body's queries run after this returns, it's logged once sent.
+            # Its headers are sent before that, so no Server-Timing
+            response.streaming_content = self._stream(
+                response.streaming_content, request, response, metrics, started)
+            return response
+        total = time.perf_counter() - started
+        response['Server-Timing'] = metrics.server_timing(total)
+        self.log(request, response, metrics, total)
+        return response
+
+    def _stream(self, content, request, response, metrics, started):
+        iterator = iter(content)
+        try:
+            while True:
+                with measure(metrics):
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                yield chunk
+        finally:
+            # Also when the client went away before the end
+            self.log(request, response, metrics, time.perf_counter() - started)
+
+    @staticmethod
+    def log(request, response, metrics, total):
+        fields = {'method': request.method, 'path': request.path, 'status': response.status_code,
+                  'total_ms': round(total * 1000, 2), **metrics.as_dict()}
+        logger.info('%(method)s %(path)s %(status)s in %(total_ms)sms, %(queries)s queries',
+                    fields, extra=fields)
+        for shape, count in metrics.n_plus_one():
+            logger.warning('Possible N+1 on %s %s: %s queries like %s', request.method, request.path,
+                           count, shape, extra={**fields, 'shape': shape, 'count': count})
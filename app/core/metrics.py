@@ -0,0 +1,135 @@
+"""
+Prometheus metrics, served at ``/metrics``.
+
+Every request observes its latency in a histogram labelled by the name of
+the view it resolved to (``puppy``, ``user:user-user-list``, ...), never by
+its path, so ids in URLs can't blow up the number of series. ``get_or_build``
+counts its hits and misses, Celery counts the runtime of every task, and the
+length of the Celery queues is read from the broker at scrape time.
+
+Gunicorn workers and Celery pool processes each keep their own counters.
+With the ``prometheus_multiproc_dir`` environment variable set, before
+anything imports ``prometheus_client``, every process writes its counters to
+memory mapped files in that directory, and a scrape adds up the files of
+all the directories in ``METRICS_MULTIPROC_DIRS``: one per service, as the
+pids of two containers can be the same. Each service empties its directory
+when it starts, see ``gunicorn.conf.py`` and ``clear_multiproc_dir()``.
+"""
+import logging
+import os
+import shutil
+import time
+import redis
+from celery.signals import task_postrun, task_prerun, worker_init
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from .redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.environ.get('prometheus_multiproc_dir')
+if MULTIPROC_DIR:
+    # Services without the shared volume still need somewhere to write
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+HTTP_METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent answering HTTP requests',
+    ['route', 'method', 'status'],
+    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 10))
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', 'Lookups of get_or_build, by result', ['result'])
+TASK_DURATION = Histogram(
+    'celery_task_duration_seconds', 'Time spent running Celery tasks', ['task', 'state'],
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300))
+
+_task_started = {}
+
+
+class MetricsMiddleware:
+    """Observes the latency of every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        REQUEST_LATENCY.labels(
+            route=match.view_name if match else 'unresolved',
+            method=request.method if request.method in HTTP_METHODS else 'other',
+            status=response.status_code,
+        ).observe(time.perf_counter() - started)
+        return response
+
+
+def record_cache_lookup(result):
+    CACHE_LOOKUPS.labels(result=result).inc()
+
+
+@task_prerun.connect
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_DURATION.labels(task=task.name, state=state or 'UNKNOWN').observe(
+            time.perf_counter() - started)
+
+
+@worker_init.connect
+def clear_multiproc_dir(**kwargs):
+    """Forget the counters of the previous run, before any process writes new ones"""
+    if MULTIPROC_DIR:
+        shutil.rmtree(MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+
+class CeleryQueueCollector:
+    """Length of the Celery queues, read from the broker at scrape time"""
+
+    def collect(self):
+        queues = settings.METRICS_CELERY_QUEUES
+        try:
+            pipe = get_redis('celery').pipeline(transaction=False)
+            for queue in queues:
+                pipe.llen(queue)
+            lengths = pipe.execute()
+        except redis.RedisError:
+            logger.warning('Could not read the Celery queue lengths', exc_info=True)
+            return
+        gauge = GaugeMetricFamily('celery_queue_length', 'Tasks waiting in a Celery queue',
+                                  labels=['queue'])
+        for queue, length in zip(queues, lengths):
+            gauge.add_metric([queue], length)
+        yield gauge
+
+
+def registry():
+    """The metrics of every process, or of this one without multiprocess mode"""
+    collected = CollectorRegistry()
+    if settings.METRICS_MULTIPROC_DIRS:
+        for path in settings.METRICS_MULTIPROC_DIRS:
+            if os.path.isdir(path):
+                MultiProcessCollector(collected, path=path)
+    else:
+        collected.register(REGISTRY)
+    collected.register(CeleryQueueCollector())
+    return collected
+
+
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        raise PermissionDenied
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
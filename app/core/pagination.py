@@ -1,10 +1,20 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import namedtuple
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.db.models import F, Q
+from django.http import QueryDict
+from django.utils.translation import ugettext_lazy as _
 import math
 from django.conf import settings
 
 DEFAULT_PAGE = 1
 
+Cursor = namedtuple('Cursor', ['position', 'reverse'])
+
 
 class CustomPagination(PageNumberPagination):
     # page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
@@ -28,3 +38,198 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size = 100
     page_size_query_param = 'page_size'
     max_page_size = 1000
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite, unique ordering.
+
+    Each page is fetched with a ``WHERE (a, b) < (x, y) ... LIMIT n`` style
+    query, so page 1000 costs the same as page 1 and the total row count is
+    never computed. Cursors are opaque base64 tokens holding the ordering
+    values of the row at the page boundary.
+
+    Nullable ordering columns sort NULLs as the largest value, first in a
+    descending ordering as PostgreSQL and its indexes do by default. Their
+    cursors hold a JSON null and the seek matches them with ``IS NULL``.
+    """
+    ordering = ('-date_joined', '-id')
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # Query parameters carried over into the links, None keeps them all
+    link_query_params = None
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = self.get_base_url(request)
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request, queryset.model)
+
+        reverse = bool(self.cursor and self.cursor.reverse)
+        ordering = self._invert(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*self._order_by(ordering, queryset.model))
+        if self.cursor:
+            queryset = queryset.filter(
+                self._seek_filter(ordering, self.cursor.position, queryset.model))
+
+        # One extra row tells us whether another page exists without COUNT(*)
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'links': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link()
+            },
+            'page_size': self.page_size,
+            'results': data
+        })
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_base_url(self, request):
+        if self.link_query_params is None:
+            return request.build_absolute_uri()
+        query = QueryDict(mutable=True)
+        for name in self.link_query_params:
+            if name in request.query_params:
+                query.setlist(name, request.query_params.getlist(name))
+        url = request.build_absolute_uri(request.path)
+        return '%s?%s' % (url, query.urlencode()) if query else url
+
+    def get_cache_key(self, request, prefix):
+        """
+        Key identifying a single page, built without touching the database.
+        The page's links keep only the pagination parameters from then on, so
+        nothing outside the key ends up in a page served to other clients.
+        """
+        self.link_query_params = (self.page_size_query_param, self.cursor_query_param)
+        return '%s:%s://%s:%s:%s' % (prefix, request.scheme, request.get_host(), self.get_page_size(request),
+                                     request.query_params.get(self.cursor_query_param, ''))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(self._position(self.page[-1]), False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(Cursor(self._position(self.page[0]), True))
+
+    def encode_cursor(self, cursor):
+        payload = json.dumps({'p': cursor.position, 'r': int(cursor.reverse)},
+                             separators=(',', ':'))
+        token = urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+            position = payload['p']
+            if len(position) != len(self.ordering):
+                raise ValueError
+            fields = [model._meta.get_field(self._field_name(field)) for field in self.ordering]
+            if any(value is None and not field.null for field, value in zip(fields, position)):
+                raise ValueError
+            position = [None if value is None else field.to_python(value)
+                        for field, value in zip(fields, position)]
+            return Cursor(position, bool(payload.get('r')))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _position(self, item):
+        values = []
+        for field in self.ordering:
+            value = getattr(item, self._field_name(field))
+            if value is not None:
+                value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+            values.append(value)
+        return values
+
+    def _order_by(self, ordering, model):
+        """``ordering`` with NULLs explicitly largest on the nullable columns"""
+        expressions = []
+        for field in ordering:
+            name = self._field_name(field)
+            if not model._meta.get_field(name).null:
+                expressions.append(field)
+            elif field.startswith('-'):
+                expressions.append(F(name).desc(nulls_first=True))
+            else:
+                expressions.append(F(name).asc(nulls_last=True))
+        return expressions
+
+    def _seek_filter(self, ordering, position, model=None):
+        """
+        Expand ``(a, b) < (x, y)`` into ``a <= x AND (a < x OR (a = x AND b < y))``.
+        The redundant leading ``a <= x`` keeps the index range scan bounded.
+        """
+        names = [self._field_name(field) for field in ordering]
+        nullable = [model is not None and model._meta.get_field(name).null for name in names]
+        descending = [field.startswith('-') for field in ordering]
+        condition = Q()
+        for index, name in enumerate(names):
+            term = self._after(name, descending[index], position[index], nullable[index])
+            if term is None:
+                continue
+            for prev in range(index):
+                term &= self._equal(names[prev], position[prev])
+            condition |= term
+        first, value = names[0], position[0]
+        if value is None:
+            # Every row sorts at or after a leading NULL in a descending ordering
+            return condition if descending[0] else Q(**{first + '__isnull': True}) & condition
+        bound = Q(**{first + ('__lte' if descending[0] else '__gte'): value})
+        if nullable[0] and not descending[0]:
+            bound |= Q(**{first + '__isnull': True})
+        return bound & condition
+
+    @staticmethod
+    def _after(name, descending, value, nullable):
+        """Rows strictly after ``value`` in the ordering, None when there are none"""
+        if value is None:
+            return Q(**{name + '__isnull': False}) if descending else None
+        term = Q(**{name + ('__lt' if descending else '__gt'): value})
+        if nullable and not descending:
+            term |= Q(**{name + '__isnull': True})
+        return term
+
+    @staticmethod
+    def _equal(name, value):
+        return Q(**{name + '__isnull': True}) if value is None else Q(**{name: value})
+
+    @staticmethod
+    def _field_name(field):
+        return field.lstrip('-')
+
+    @staticmethod
+    def _invert(ordering):
+        return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
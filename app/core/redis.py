@@ -0,0 +1,242 @@
+"""
+Shared Redis connection pools, one per role.
+
+Every role (cache, sessions, celery, channels, locks) lives in its own
+logical database of ``REDIS_URL`` and gets its own explicitly sized pool per
+process, see ``REDIS_POOLS`` in settings. A burst on one role waits for its
+own connections, up to ``REDIS_POOL_TIMEOUT``, instead of opening more and
+more, and ``flushdb()`` on one role can't wipe another one's data. Never use
+``flushall()``, that empties every database.
+
+The roles behind Django caches go through django-redis with
+``MeteredConnectionPool``, the others are made here. Async code gets aioredis
+pools from ``get_async_redis()``, one per URL and event loop. Every pool counts the
+connections in use, the time spent waiting for one and the errors it saw,
+see ``pool_stats()``. Commands also count towards the cache calls of the
+request being instrumented, see ``core.instrumentation``.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+import aioredis
+import redis
+from django.conf import settings
+from django_redis import get_redis_connection
+from core.instrumentation import record_cache_call
+
+# Roles served by a Django cache, the rest have a client of their own
+CACHE_ALIASES = {'cache': 'default', 'sessions': 'sessions', 'locks': 'locks'}
+
+_clients = {}
+_clients_lock = threading.Lock()
+# aioredis pools by event loop, until the loop shuts down
+_async_pools = weakref.WeakKeyDictionary()
+_stats = {}
+_stats_pid = None
+_stats_lock = threading.Lock()
+
+
+class PoolStats:
+    """Counters of one role's pool in the current process"""
+
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+        self.in_use = self.checkouts = self.errors = 0
+        self.wait_time = self.max_wait = 0.0
+
+    def as_dict(self):
+        return {
+            'max_connections': self.max_connections,
+            'in_use': self.in_use,
+            'checkouts': self.checkouts,
+            'wait_time': self.wait_time,
+            'max_wait': self.max_wait,
+            'errors': self.errors,
+        }
+
+
+def _registry():
+    global _stats_pid
+    # Forked workers start counting from scratch
+    if _stats_pid != os.getpid():
+        _stats.clear()
+        _stats_pid = os.getpid()
+    return _stats
+
+
+def _register(role, max_connections):
+    with _stats_lock:
+        _registry().setdefault(role, PoolStats(max_connections))
+
+
+def _record(role, max_connections, **changes):
+    with _stats_lock:
+        registry = _registry()
+        stats = registry.get(role)
+        if stats is None:
+            # A pool made before a fork, its stats were cleared with the parent's
+            stats = registry[role] = PoolStats(max_connections)
+        for name, value in changes.items():
+            setattr(stats, name, getattr(stats, name) + value)
+        if 'wait_time' in changes:
+            stats.max_wait = max(stats.max_wait, changes['wait_time'])
+
+
+def pool_stats():
+    """Counters of every pool used by the current process, by role"""
+    with _stats_lock:
+        return {role: stats.as_dict() for role, stats in _registry().items()}
+
+
+_metered_classes = {}
+
+
+def _metered(connection_class):
+    """``connection_class`` counting its failed commands in its pool's stats, and timing the others"""
+    metered = _metered_classes.get(connection_class)
+    if metered is None:
+        def send_packed_command(self, command, check_health=True):
+            try:
+                connection_class.send_packed_command(self, command, check_health)
+            except (redis.ConnectionError, redis.TimeoutError):
+                _record(self.role, self.pool_max_connections, errors=1)
+                raise
+            self.sent_at = time.perf_counter()
+
+        def read_response(self):
+            try:
+                response = connection_class.read_response(self)
+            except (redis.ConnectionError, redis.TimeoutError):
+                _record(self.role, self.pool_max_connections, errors=1)
+                raise
+            # Each reply of a pipeline counts from the previous one
+            now = time.perf_counter()
+            record_cache_call(now - getattr(self, 'sent_at', now))
+            self.sent_at = now
+            return response
+
+        metered = _metered_classes[connection_class] = type(
+            f'Metered{connection_class.__name__}', (connection_class,),
+            {'send_packed_command': send_packed_command, 'read_response': read_response})
+    return metered
+
+
+class MeteredConnectionPool(redis.BlockingConnectionPool):
+    """
+    A pool of at most ``max_connections`` that waits up to ``timeout``
+    seconds for a free connection and keeps the stats of ``role``
+    """
+
+    def __init__(self, role='default', **kwargs):
+        self.role = role
+        super().__init__(**kwargs)
+        self.connection_class = _metered(self.connection_class)
+        _register(role, self.max_connections)
+
+    def make_connection(self):
+        connection = super().make_connection()
+        connection.role, connection.pool_max_connections = self.role, self.max_connections
+        return connection
+
+    def get_connection(self, command_name, *keys, **options):
+        started = time.monotonic()
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+        except (redis.ConnectionError, redis.TimeoutError):
+            _record(self.role, self.max_connections, errors=1)
+            raise
+        connection.checked_out = True
+        _record(self.role, self.max_connections, in_use=1, checkouts=1,
+                wait_time=time.monotonic() - started)
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        # Not counted: connections that failed to connect, or inherited from
+        # before a fork
+        if getattr(connection, 'checked_out', False) and connection.pid == os.getpid():
+            connection.checked_out = False
+            _record(self.role, self.max_connections, in_use=-1)
+
+
+def pool_kwargs(role):
+    """Connection pool arguments of ``role``, as configured in settings"""
+    return {
+        'role': role,
+        'max_connections': settings.REDIS_POOLS[role]['max_connections'],
+        'timeout': settings.REDIS_POOL_TIMEOUT,
+        'health_check_interval': settings.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+
+
+def get_redis(role):
+    """The client of ``role``, all its users in a process share one pool"""
+    if role in CACHE_ALIASES:
+        return get_redis_connection(CACHE_ALIASES[role])
+    client = _clients.get(role)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(role)
+            if client is None:
+                pool = MeteredConnectionPool.from_url(
+                    settings.REDIS_URLS[role], socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT, **pool_kwargs(role))
+                client = _clients[role] = redis.Redis(connection_pool=pool)
+    return client
+
+
+class _LoopPools:
+    """The aioredis pools of one event loop, closed when the loop shuts down"""
+
+    def __init__(self, loop):
+        # Weak, the pools themselves already keep the loop alive until closed
+        self._loop = weakref.ref(loop)
+        self.pools = {}
+        self.closed = False
+        self._guard = None
+
+    async def watch(self):
+        # Loops run by asyncio.run() and async_to_sync() finalize their async
+        # generators before closing, which runs this one's cleanup on the loop
+        self._guard = self._close_on_shutdown()
+        await self._guard.__anext__()
+
+    async def _close_on_shutdown(self):
+        try:
+            yield
+        finally:
+            await self.close()
+
+    async def close(self):
+        self.closed = True
+        loop = self._loop()
+        if loop is not None and _async_pools.get(loop) is self:
+            del _async_pools[loop]
+        pools, self.pools = list(self.pools.values()), {}
+        for pending in pools:
+            if not pending.done():
+                pending.cancel()
+            elif not pending.cancelled() and pending.exception() is None:
+                pending.result().close()
+                await pending.result().wait_closed()
+
+
+async def get_async_redis(url):
+    """
+    The aioredis pool of ``url`` on the running event loop. aioredis pools
+    belong to the loop that made them, so every loop gets its own, and they
+    are closed when it shuts down.
+    """
+    loop = asyncio.get_event_loop()
+    pools = _async_pools.get(loop)
+    if pools is None or pools.closed:
+        pools = _async_pools[loop] = _LoopPools(loop)
+        await pools.watch()
+    pending = pools.pools.get(url)
+    if pending is None or (pending.done() and (pending.cancelled() or pending.exception())):
+        # A task, so coroutines asking at the same time share one pool
+        pending = pools.pools[url] = loop.create_task(aioredis.create_redis_pool(url))
+    return await pending
+
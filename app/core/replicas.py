@@ -0,0 +1,166 @@
+"""
+Read replicas with read-your-writes.
+
+``ReplicaRouter`` sends the reads of safe (GET, HEAD, OPTIONS) requests to
+one of ``DATABASE_REPLICAS``, the same one for the whole request. Everything
+else reads from the primary: unsafe requests, celery tasks, commands, and
+a request as soon as it writes.
+
+A client that wrote is pinned to the primary for ``REPLICA_PIN_SECONDS``,
+long enough for the replicas to catch up, so it always reads its own
+writes. The pin travels in the ``primary_pin`` cookie for browsers and in
+the ``X-Primary-Pin`` header for API clients, which send back the value of
+the last response header they got.
+
+A replica that can't be connected to is skipped for
+``REPLICA_RETRY_SECONDS``, its reads go to the primary meanwhile.
+"""
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'primary_pin'
+PIN_HEADER = 'X-Primary-Pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The replica the current request reads from, None while replicas are off
+_read_from = contextvars.ContextVar('read_from', default=None)
+# Whether the current request wrote, None outside requests
+_wrote = contextvars.ContextVar('wrote', default=None)
+
+_down_until = {}
+_down_lock = threading.Lock()
+
+
+def _available(alias):
+    """Whether ``alias`` can be connected to, skipping it for a while when it can't"""
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        logger.warning('Replica %s is unavailable, reading from the primary', alias, exc_info=True)
+        with _down_lock:
+            _down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        return False
+    return True
+
+
+def choose_replica():
+    """A random replica that is up, or the primary when none is"""
+    replicas = list(settings.DATABASE_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        if _available(alias):
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def _scope(read_from):
+    tokens = _read_from.set(read_from), _wrote.set(False)
+    try:
+        yield
+    finally:
+        _read_from.reset(tokens[0])
+        _wrote.reset(tokens[1])
+
+
+def use_replicas():
+    """Read from a replica inside the block, the middleware does this for safe requests"""
+    return _scope('')
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside the block"""
+    token = _read_from.set(None)
+    try:
+        yield
+    finally:
+        if not wrote():
+            _read_from.reset(token)
+
+
+def wrote():
+    """Whether the current request wrote to the primary"""
+    return bool(_wrote.get())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_from.get()
+        if alias is None:
+            return DEFAULT_DB_ALIAS
+        if not alias:
+            # Chosen on the first read so a request sees one consistent replica
+            alias = choose_replica()
+            _read_from.set(alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        if _wrote.get() is not None:
+            # The rest of the request reads what it wrote
+            _read_from.set(None)
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas copy the primary's schema
+        return db not in settings.DATABASE_REPLICAS
+
+
+def pinned_until(request):
+    """The time the client is pinned to the primary until, 0 when it isn't"""
+    value = request.COOKIES.get(PIN_COOKIE) or request.headers.get(PIN_HEADER)
+    try:
+        until = float(value)
+    except (TypeError, ValueError):
+        return 0
+    # Never longer than a pin we would have handed out
+    return until if until <= time.time() + settings.REPLICA_PIN_SECONDS else 0
+
+
+def _iterate_in(context, iterable):
+    iterator = iter(iterable)
+    while True:
+        try:
+            yield context.run(next, iterator)
+        except StopIteration:
+            return
+
+
+class ReplicaPinMiddleware:
+    """Routes the reads of safe, unpinned requests to a replica and pins clients that write"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas = (settings.DATABASE_REPLICAS and request.method in SAFE_METHODS
+                    and pinned_until(request) <= time.time())
+        with _scope('' if replicas else None):
+            response = self.get_response(request)
+            if replicas and response.streaming:
+                # Streamed rows are read after this returns, on the same replica
+                response.streaming_content = _iterate_in(
+                    contextvars.copy_context(), response.streaming_content)
+            pin = wrote()
+        if pin:
+            # Rounded down, a value rounded up would look longer than a pin we hand out
+            until = math.floor((time.time() + settings.REPLICA_PIN_SECONDS) * 1000) / 1000
+            response.set_cookie(PIN_COOKIE, f'{until:.3f}', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+            response[PIN_HEADER] = f'{until:.3f}'
+        return response
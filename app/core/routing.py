@@ -1,3 +1,8 @@
-from channels.routing import ProtocolTypeRouter
+from channels.routing import ProtocolTypeRouter, URLRouter
+from community.routing import websocket_urlpatterns
+from user.authentication import JWTAuthMiddleware
 
-application = ProtocolTypeRouter({})
+# Sockets authenticate with a token, not cookies, so there's no origin check
+application = ProtocolTypeRouter({
+    'websocket': JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+})
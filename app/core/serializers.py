@@ -0,0 +1,103 @@
+"""
+Read-only fast path for ``ModelSerializer`` list endpoints.
+
+``ValuesSerializer(UserSerializer)`` fetches only the serializer's readable
+columns with ``values_list()`` and turns each row into a dict with converters
+compiled once per serializer class, skipping model instantiation and the
+generic per-field machinery. Converters either are the serializer field's own
+``to_representation`` or a builtin known to return the same thing, so the
+output is identical to ``Serializer(queryset, many=True).data``.
+
+``TimedSerializerMixin`` counts a serializer's output towards the serializer
+time of the request being instrumented.
+"""
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import models
+from rest_framework import serializers
+from core.instrumentation import serializing
+
+# Fields whose to_representation() boils down to a builtin
+_BUILTIN_CONVERTERS = {
+    serializers.CharField: str,
+    serializers.EmailField: str,
+    serializers.SlugField: str,
+    serializers.URLField: str,
+    serializers.IntegerField: int,
+}
+
+
+class TimedSerializerMixin:
+    """Time ``to_representation()``, see ``core.instrumentation``"""
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
+
+
+class ValuesSerializer:
+    """Serialize querysets through ``values_list()`` for a ``ModelSerializer`` class"""
+
+    def __init__(self, serializer_class, context=None):
+        self.serializer_class = serializer_class
+        self.context = context or {}
+        self._compiled = None
+
+    def _compile(self):
+        if self._compiled is not None:
+            return self._compiled
+        serializer = self.serializer_class(context=self.context)
+        model = serializer.Meta.model
+        names, sources, converters = [], [], []
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                model_field = None
+            if model_field is None or not model_field.concrete or model_field.is_relation:
+                raise ImproperlyConfigured(
+                    f'{self.serializer_class.__name__}.{field.field_name} is not a plain column')
+            names.append(field.field_name)
+            sources.append(model_field.attname)
+            converters.append(self._converter(field, model_field))
+        self._compiled = (names, sources, converters)
+        return self._compiled
+
+    @staticmethod
+    def _converter(field, model_field):
+        if isinstance(model_field, models.FileField):
+            # values_list() gives the file name, the serializer field wants a FieldFile
+            attr_class, to_representation = model_field.attr_class, field.to_representation
+            return lambda name: to_representation(attr_class(None, model_field, name))
+        if type(field) is serializers.UUIDField and field.uuid_format == 'hex_verbose':
+            return str
+        return _BUILTIN_CONVERTERS.get(type(field), field.to_representation)
+
+    @property
+    def names(self):
+        return self._compile()[0]
+
+    def prepare(self, queryset, extra=()):
+        """
+        The queryset as named tuples of the columns needed, which the keyset
+        paginator can read its cursor position from. ``extra`` columns, e.g.
+        a pagination tie breaker, are fetched but left out of the output.
+        """
+        sources = self._compile()[1]
+        return queryset.values_list(*sources, *[name for name in extra if name not in sources],
+                                    named=True)
+
+    def to_representation(self, rows):
+        """Convert rows fetched with ``prepare()``"""
+        names, _, converters = self._compile()
+        pairs = list(zip(names, converters))
+        with serializing():
+            return [
+                {name: None if value is None else convert(value)
+                 for (name, convert), value in zip(pairs, row)}
+                for row in rows
+            ]
+
+    def serialize(self, queryset):
+        return self.to_representation(self.prepare(queryset))
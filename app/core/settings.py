@@ -15,6 +15,8 @@ from celery.schedules import crontab
 import dj_database_url
 from decouple import config
 from datetime import timedelta
+from urllib.parse import urlsplit
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -44,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'channels',
     'corsheaders',
     'storages',
@@ -51,14 +54,17 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'drf_yasg',
     'django_filters',
-    'user',
-    'community',
+    'user.apps.UserConfig',
+    'community.apps.CommunityConfig',
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.instrumentation.InstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.replicas.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +98,9 @@ AUTH_USER_MODEL = "user.User"
 WSGI_APPLICATION = 'core.wsgi.application'
 ASGI_APPLICATION = 'core.routing.application'
 CORS_ALLOW_ALL_ORIGINS = True
+# Clients echo the read-your-writes pin back, see core/replicas.py
+CORS_ALLOW_HEADERS = list(default_headers) + ['x-primary-pin']
+CORS_EXPOSE_HEADERS = ['X-Primary-Pin']
 
 
 # Database
@@ -111,23 +120,79 @@ DATABASES = {
     }
 }
 
-REDIS_URL = os.getenv('REDIS_URL', "redis://redis:6379")
+# Read replicas of the default database as comma separated host[:port], the
+# reads of GET requests go to them, see core/replicas.py
+for index, replica in enumerate(filter(None, os.environ.get("SQL_REPLICA_HOSTS", "").split(",")), start=1):
+    host, _, port = replica.strip().partition(":")
+    DATABASES[f"replica{index}"] = dict(DATABASES["default"], HOST=host,
+                                         PORT=port or DATABASES["default"]["PORT"],
+                                         TEST={'MIRROR': 'default'})
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 5))  # primary only reads after a write
+REPLICA_RETRY_SECONDS = 30  # a replica that failed to connect is skipped for this long
+
+# The Redis server. Any database number in it is replaced: every role below
+# gets a logical database of its own and a pool of its own, see core/redis.py
+REDIS_URL = urlsplit(os.getenv('REDIS_URL', "redis://redis:6379"))._replace(path='').geturl()
+REDIS_POOLS = {
+    # max_connections: per process, callers wait REDIS_POOL_TIMEOUT for one beyond that
+    'cache': {'db': 0, 'max_connections': 50},
+    'sessions': {'db': 1, 'max_connections': 20},
+    'celery': {'db': 2, 'max_connections': 20},
+    'channels': {'db': 3, 'max_connections': 50},
+    'locks': {'db': 4, 'max_connections': 20},
+}
+REDIS_URLS = {role: urlsplit(REDIS_URL)._replace(path=f"/{pool['db']}").geturl()
+              for role, pool in REDIS_POOLS.items()}
+REDIS_POOL_TIMEOUT = 2  # seconds
+REDIS_SOCKET_TIMEOUT = 5  # seconds
+REDIS_SOCKET_CONNECT_TIMEOUT = 2  # seconds
+REDIS_HEALTH_CHECK_INTERVAL = 30  # idle seconds after which a connection is pinged before use
 
-CACHES = {
-    "default": {
+
+def redis_cache(role):
+    return {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": REDIS_URL,
+        "LOCATION": REDIS_URLS[role],
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SOCKET_TIMEOUT": REDIS_SOCKET_TIMEOUT,
+            "SOCKET_CONNECT_TIMEOUT": REDIS_SOCKET_CONNECT_TIMEOUT,
+            "CONNECTION_POOL_CLASS": "core.redis.MeteredConnectionPool",
+            "CONNECTION_POOL_KWARGS": {
+                "role": role,
+                "max_connections": REDIS_POOLS[role]['max_connections'],
+                "timeout": REDIS_POOL_TIMEOUT,
+                "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+            },
         }
     }
+
+
+CACHES = {
+    "default": redis_cache('cache'),
+    "sessions": redis_cache('sessions'),
+    "locks": redis_cache('locks'),
 }
 
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
-SESSION_CACHE_ALIAS = "default"
+SESSION_CACHE_ALIAS = "sessions"
 LOGIN_URL = 'rest_framework:login'
 LOGOUT_URL = 'rest_framework:logout'
 
+AUTHENTICATION_BACKENDS = ['user.backends.IdentifierBackend']
+
+# Password hashing, see user/hashers.py. Lower the cost for local development
+# and tests through PASSWORD_HASH_ITERATIONS, stored hashes are re-encoded
+# with the configured cost on the next login.
+PASSWORD_HASHERS = [
+    'user.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 216000))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -166,7 +231,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'core.pagination.CustomPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
@@ -258,9 +323,26 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'core.instrumentation': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     }
 }
 
+# Share of the requests measured by core/instrumentation.py, 0 to 1
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get("INSTRUMENTATION_SAMPLE_RATE", 1 if DEBUG else 0.05))
+INSTRUMENTATION_N_PLUS_ONE_THRESHOLD = 5  # repeats of one query shape logged as a possible N+1
+
+# Prometheus metrics at /metrics, see core/metrics.py. The directories of
+# every service writing metrics with prometheus_multiproc_dir, comma
+# separated, defaults to this process's own
+METRICS_MULTIPROC_DIRS = [path for path in os.environ.get(
+    "METRICS_MULTIPROC_DIRS", os.environ.get("prometheus_multiproc_dir", "")).split(",") if path]
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")  # bearer token required to scrape, when set
+METRICS_CELERY_QUEUES = ['celery']
+
 # Email Settings
 EMAIL_FROM = os.environ.get('EMAIL_FROM')
 EMAIL_HOST = 'smtp.sendgrid.net'
@@ -268,6 +350,10 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'apikey'
 EMAIL_HOST_PASSWORD = os.environ.get('SENDGRID_API_KEY')
+EMAIL_TIMEOUT = 30
+EMAIL_BATCH_SIZE = 50  # messages per send_messages() call
+EMAIL_FLUSH_DELAY = 2  # seconds a queued email waits for the others of its batch
+EMAIL_PROCESSING_LEASE = 300  # seconds before the batch of a dead mail drain is sent again
 
 # SMS Settings
 TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
@@ -288,8 +374,27 @@ SWAGGER_SETTINGS = {
 
 
 TOKEN_LIFESPAN = 24  # hours
-CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://redis:6379")
-CELERY_RESULT_BACKEND = os.environ.get("CELERY_BROKER", "redis://redis:6379")
+USER_IMPORT_CHUNK_SIZE = 1000  # rows validated and inserted per bulk_create
+USER_CACHE_SIZE = 10000  # users kept in memory per process for JWT auth
+USER_CACHE_TTL = 300  # seconds
+TOKEN_REAPER_BATCH_SIZE = 1000  # rows deleted per statement
+# Profile image uploads wait here, on disk shared with the celery workers, until
+# user.images has pushed them and their resized variants to DEFAULT_FILE_STORAGE
+IMAGE_STAGING_ROOT = os.environ.get('IMAGE_STAGING_ROOT', os.path.join(BASE_DIR, 'uploads'))
+PROFILE_IMAGE_SIZES = {'thumbnail': 96, 'medium': 512}  # longest side in pixels
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", REDIS_URLS['celery'])
+CELERY_RESULT_BACKEND = os.environ.get("CELERY_BROKER", REDIS_URLS['celery'])
+CELERY_BROKER_POOL_LIMIT = REDIS_POOLS['celery']['max_connections']
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'max_connections': REDIS_POOLS['celery']['max_connections'],
+    'socket_timeout': REDIS_SOCKET_TIMEOUT,
+    'socket_connect_timeout': REDIS_SOCKET_CONNECT_TIMEOUT,
+    'health_check_interval': REDIS_HEALTH_CHECK_INTERVAL,
+}
+CELERY_REDIS_MAX_CONNECTIONS = REDIS_POOLS['celery']['max_connections']
+CELERY_REDIS_SOCKET_TIMEOUT = REDIS_SOCKET_TIMEOUT
+CELERY_REDIS_SOCKET_CONNECT_TIMEOUT = REDIS_SOCKET_CONNECT_TIMEOUT
+CELERY_IMPORTS = ['core.metrics']  # times every task
 FLOWER_BASIC_AUTH = os.environ.get('FLOWER_BASIC_AUTH')
 
 
@@ -297,16 +402,45 @@ CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            'hosts': [REDIS_URL],
+            'hosts': [{'address': REDIS_URLS['channels'], 'timeout': REDIS_SOCKET_CONNECT_TIMEOUT}],
+            # Every socket of a worker shares one backlog in Redis, the
+            # default of 100 drops room events as soon as a busy room fans out
+            'capacity': 5000,
         },
         # 'ROUTING': 'core'
     },
 }
 
+# Realtime rooms, see community/consumers.py and community/presence.py
+ROOM_PRESENCE = {
+    'BACKEND': 'community.presence.RedisPresence',
+    'CONFIG': {'url': REDIS_URLS['channels'], 'ttl': 60},  # sockets heartbeat well within ttl seconds
+}
+ROOM_SEND_BATCH_INTERVAL = 0.05  # seconds a socket holds events before sending a frame
+ROOM_SEND_BATCH_SIZE = 100  # events that trigger an immediate frame
+# Messages are buffered in Redis and saved in batches, see community/messages.py
+ROOM_MESSAGE_BUFFER = {
+    'BACKEND': 'community.messages.RedisMessageBuffer',
+    # tail: recent messages per room served from Redis, claim_idle: seconds
+    # before a batch left unacked by a dead writer is taken over
+    'CONFIG': {'url': REDIS_URLS['channels'], 'tail': 100, 'claim_idle': 60},
+}
+ROOM_MESSAGE_FLUSH_BATCH_SIZE = 500
 
-# REDIS_DEFAULT_CONNECTION_POOL = redis.ConnectionPool.from_url(REDIS_URL)
 
 CELERY_BEAT_SCHEDULE = {
+    "delete_expired_tokens": {
+        "task": "user.tasks.delete_expired_tokens",
+        "schedule": crontab(minute=0),
+    },
+    "flush_email_outbox": {
+        "task": "user.tasks.flush_email_outbox",
+        "schedule": crontab(minute="*/5"),
+    },
+    "flush_room_messages": {
+        "task": "community.tasks.flush_room_messages",
+        "schedule": crontab(minute="*/1"),
+    },
     # "sample_task": {
     #     "task": "user.tasks.sample_task",
     #     "schedule": crontab(minute="*/1"),
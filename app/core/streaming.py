@@ -0,0 +1,65 @@
+"""
+Streaming JSON exports.
+
+Rows are pulled from the database with ``queryset.iterator()`` and serialized
+a chunk at a time, so the first bytes leave right away and memory stays flat
+however large the table is.
+"""
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+from .serializers import ValuesSerializer
+
+EXPORT_CHUNK_SIZE = 1000
+NDJSON = 'ndjson'
+
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_batches(queryset, serializer_class, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of serialized rows, ``chunk_size`` rows at a time"""
+    serializer = ValuesSerializer(serializer_class)
+    batch = []
+    for row in serializer.prepare(queryset).iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) == chunk_size:
+            yield serializer.to_representation(batch)
+            batch = []
+    if batch:
+        yield serializer.to_representation(batch)
+
+
+def _encode(batch):
+    return [_encoder.encode(row).encode('utf-8') for row in batch]
+
+
+def iter_json_array(batches):
+    # The opening bracket goes out before the first query runs
+    yield b'['
+    separator = b''
+    for batch in batches:
+        yield separator + b','.join(_encode(batch))
+        separator = b','
+    yield b']'
+
+
+def iter_ndjson(batches):
+    for batch in batches:
+        yield b''.join(row + b'\n' for row in _encode(batch))
+
+
+def export_response(request, queryset, serializer_class, filename, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream ``queryset`` as a JSON array, or as newline delimited JSON when the
+    request asks for ``?output=ndjson``.
+    """
+    batches = iter_batches(queryset, serializer_class, chunk_size)
+    if request.GET.get('output') == NDJSON:
+        response = StreamingHttpResponse(iter_ndjson(batches), content_type='application/x-ndjson')
+        filename = f'{filename}.ndjson'
+    else:
+        response = StreamingHttpResponse(iter_json_array(batches), content_type='application/json')
+        filename = f'{filename}.json'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Keep nginx from buffering the whole body before sending it on
+    response['X-Accel-Buffering'] = 'no'
+    return response
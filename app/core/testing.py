@@ -0,0 +1,29 @@
+"""
+Query budgets for tests.
+
+``assertNumQueries`` pins an exact count, which breaks on every harmless
+change and says nothing about why a count grew. ``QueryBudgetMixin`` lets a
+test state the most queries an endpoint may run, and how many of them may
+repeat the shape of another one, and fails with the offending shapes, so a
+new query per row shows up as an N+1 rather than as a number.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from core.instrumentation import sql_shape
+
+
+class QueryBudgetMixin:
+    @contextmanager
+    def assertQueryBudget(self, queries, duplicates=0, using=DEFAULT_DB_ALIAS):
+        """Fail when the block runs more than ``queries`` queries or ``duplicates`` repeated shapes"""
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        shapes = Counter(sql_shape(query['sql']) for query in context.captured_queries)
+        repeated = sum(count - 1 for count in shapes.values())
+        if len(context) <= queries and repeated <= duplicates:
+            return
+        lines = [f'{count}x {shape}' for shape, count in shapes.most_common()]
+        self.fail(f'{len(context)} queries ({repeated} repeated shapes) over a budget of {queries} '
+                  f'({duplicates} repeated):\n' + '\n'.join(lines))
@@ -0,0 +1,63 @@
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache, caches
+from django.test import TestCase
+from community.models import Puppy
+from core import caching
+from user.models import User
+
+
+class VersionedCacheTest(TestCase):
+    """Test module for the versioned, signal invalidated cache"""
+
+    def setUp(self):
+        cache.clear()
+        caches['locks'].clear()
+        self.calls = 0
+
+    def build(self):
+        self.calls += 1
+        return list(Puppy.objects.values_list('name', flat=True))
+
+    def test_value_is_cached(self):
+        caching.get_or_build('puppies', self.build, models=[Puppy])
+        caching.get_or_build('puppies', self.build, models=[Puppy])
+        self.assertEqual(self.calls, 1)
+
+    def test_save_and_delete_invalidate(self):
+        self.assertEqual(caching.get_or_build('puppies', self.build, models=[Puppy]), [])
+        puppy = Puppy.objects.create(name='Casper', age=4, breed='Bull Dog', color='Black')
+        self.assertEqual(caching.get_or_build('puppies', self.build, models=[Puppy]), ['Casper'])
+        puppy.delete()
+        self.assertEqual(caching.get_or_build('puppies', self.build, models=[Puppy]), [])
+        self.assertEqual(self.calls, 3)
+
+    def test_saves_of_unlisted_fields_keep_the_user_list(self):
+        user = User.objects.create_user('cached@example.com', 'pAssw0rd!')
+        generation = caching.get_generations([User])
+        update_last_login(None, user)
+        user.save(update_fields=['password'])
+        self.assertEqual(caching.get_generations([User]), generation)
+        user.save(update_fields=['firstname', 'last_login'])
+        self.assertNotEqual(caching.get_generations([User]), generation)
+        generation = caching.get_generations([User])
+        user.save()
+        self.assertNotEqual(caching.get_generations([User]), generation)
+
+    def test_locked_early_recompute_serves_current_value(self):
+        caching.get_or_build('puppies', self.build, timeout=60, models=[Puppy])
+        key = caching.versioned_key('puppies', [Puppy])
+        value, delta, _ = cache.get(key)
+        # Force the entry into its early recompute window while another worker holds the lock
+        cache.set(key, (value, delta, 0), timeout=60)
+        caches['locks'].add('%s:lock' % key, 1, 60)
+        caching.get_or_build('puppies', self.build, timeout=60, models=[Puppy])
+        self.assertEqual(self.calls, 1)
+
+    def test_stats(self):
+        before = caching.stats()
+        caching.get_or_build('puppies', self.build, models=[Puppy])
+        caching.get_or_build('puppies', self.build, models=[Puppy])
+        after = caching.stats()
+        self.assertEqual(after['miss'] - before['miss'], 1)
+        self.assertEqual(after['rebuild'] - before['rebuild'], 1)
+        self.assertEqual(after['hit'] - before['hit'], 1)
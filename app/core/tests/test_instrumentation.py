@@ -0,0 +1,109 @@
+import redis
+from rest_framework import serializers
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from community.models import Puppy
+from community.serializers import PuppySerializer
+from core.instrumentation import InstrumentationMiddleware, measure, sql_shape
+from core.redis import MeteredConnectionPool
+
+
+class RepliedConnection(redis.Connection):
+    """A connection that replies OK to everything without a server"""
+
+    def connect(self):
+        pass
+
+    def can_read(self, timeout=0):
+        return False
+
+    def send_packed_command(self, command, check_health=True):
+        pass
+
+    def read_response(self):
+        return b'OK'
+
+
+class InstrumentationTest(TestCase):
+    """Test module for the per request query and timing instrumentation"""
+
+    def setUp(self):
+        for name in ('Casper', 'Muffin', 'Rambo', 'Ricky', 'Rocky', 'Bella'):
+            Puppy.objects.create(name=name, age=2, breed='Labrador', color='Black')
+
+    def test_sql_shape_ignores_values(self):
+        self.assertEqual(sql_shape("SELECT * FROM puppy WHERE id = 'a' AND age > 3 LIMIT 21"),
+                         sql_shape("SELECT * FROM puppy WHERE id = 'b''c' AND age > 10 LIMIT 1"))
+        self.assertEqual(sql_shape('SELECT * FROM puppy WHERE id IN (%s, %s, %s)'),
+                         'SELECT * FROM puppy WHERE id IN (?...)')
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('puppy'))
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="1 queries, 0 duplicates"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_times_project_serializers_only(self):
+        class NameSerializer(serializers.Serializer):
+            name = serializers.CharField()
+
+        with measure() as metrics:
+            NameSerializer({'name': 'Casper'}).data
+        # DRF's own serializers are left alone
+        self.assertEqual(metrics.serializer_time, 0)
+        with measure() as metrics:
+            PuppySerializer(Puppy.objects.all(), many=True).data
+        self.assertGreater(metrics.serializer_time, 0)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_left_alone(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('puppy')))
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1, INSTRUMENTATION_N_PLUS_ONE_THRESHOLD=5)
+    def test_logs_metrics_and_n_plus_one(self):
+        def view(request):
+            # One query per puppy
+            for pk in Puppy.objects.values_list('pk', flat=True):
+                Puppy.objects.get(pk=pk)
+            return HttpResponse()
+
+        middleware = InstrumentationMiddleware(view)
+        with self.assertLogs('core.instrumentation', 'INFO') as logs:
+            middleware(RequestFactory().get('/puppies'))
+        summary, warning = logs.records
+        self.assertEqual((summary.queries, summary.duplicate_queries, summary.status), (7, 5, 200))
+        self.assertEqual(warning.levelname, 'WARNING')
+        self.assertEqual(warning.count, 6)
+        self.assertIn('WHERE', warning.shape)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1, INSTRUMENTATION_N_PLUS_ONE_THRESHOLD=5)
+    def test_streamed_queries_are_logged_once_sent(self):
+        def view(request):
+            # The body queries as it streams, after the view returned
+            return StreamingHttpResponse(
+                Puppy.objects.get(pk=pk).name for pk in Puppy.objects.values_list('pk', flat=True))
+
+        middleware = InstrumentationMiddleware(view)
+        with self.assertLogs('core.instrumentation', 'INFO') as logs:
+            response = middleware(RequestFactory().get('/puppies/export'))
+            self.assertNotIn('Server-Timing', response)
+            self.assertEqual(logs.records, [])
+            self.assertEqual(len(b''.join(response.streaming_content)), 32)
+        summary, warning = logs.records
+        self.assertEqual((summary.queries, summary.duplicate_queries), (7, 5))
+        self.assertEqual(warning.count, 6)
+
+    def test_counts_redis_commands(self):
+        pool = MeteredConnectionPool(role='test-instrumented', max_connections=1,
+                                     connection_class=RepliedConnection)
+        client = redis.Redis(connection_pool=pool)
+        with measure() as metrics:
+            client.set('key', 'value')
+            pipe = client.pipeline(transaction=False)
+            pipe.get('key').get('other').execute()
+        client.get('key')
+        self.assertEqual(metrics.cache_calls, 3)
@@ -0,0 +1,57 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from core.caching import get_or_build
+from user.tasks import delete_expired_tokens
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTest(TestCase):
+    """Test module for the Prometheus metrics"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_request_latency_by_route(self):
+        labels = {'route': 'puppy', 'method': 'GET', 'status': '200'}
+        before = sample('http_request_duration_seconds_count', **labels)
+        self.client.get(reverse('puppy'))
+        self.client.get(reverse('puppy') + '?page_size=1')
+        self.assertEqual(sample('http_request_duration_seconds_count', **labels), before + 2)
+        # Paths that resolve to nothing share one series
+        before = sample('http_request_duration_seconds_count', route='unresolved', method='GET',
+                        status='404')
+        self.client.get('/nothing/here/')
+        self.assertEqual(sample('http_request_duration_seconds_count', route='unresolved',
+                                method='GET', status='404'), before + 1)
+
+    def test_cache_lookups(self):
+        hits = sample('cache_lookups_total', result='hit')
+        misses = sample('cache_lookups_total', result='miss')
+        get_or_build('metrics-test', lambda: 1)
+        get_or_build('metrics-test', lambda: 1)
+        self.assertEqual(sample('cache_lookups_total', result='miss'), misses + 1)
+        self.assertEqual(sample('cache_lookups_total', result='hit'), hits + 1)
+
+    def test_task_duration(self):
+        labels = {'task': 'user.tasks.delete_expired_tokens', 'state': 'SUCCESS'}
+        before = sample('celery_task_duration_seconds_count', **labels)
+        delete_expired_tokens.apply()
+        self.assertEqual(sample('celery_task_duration_seconds_count', **labels), before + 1)
+
+    @override_settings(METRICS_TOKEN='secret', METRICS_CELERY_QUEUES=['celery'])
+    def test_endpoint(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        client = mock.Mock()
+        client.pipeline.return_value.execute.return_value = [3]
+        with mock.patch('core.metrics.get_redis', return_value=client):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('celery_queue_length{queue="celery"} 3.0', body)
+        self.assertIn('http_request_duration_seconds_bucket{', body)
@@ -0,0 +1,93 @@
+import asyncio
+import gc
+from unittest import mock
+import redis
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase
+from core.redis import MeteredConnectionPool, _async_pools, get_async_redis, pool_stats
+
+
+class IdleConnection(redis.Connection):
+    """A connection that never talks to a server"""
+
+    def connect(self):
+        pass
+
+    def can_read(self, timeout=0):
+        return False
+
+
+class MeteredConnectionPoolTest(SimpleTestCase):
+    """Test module for the per role Redis pools"""
+
+    def test_counts_connections_in_use_and_waits(self):
+        pool = MeteredConnectionPool(role='test-pool', max_connections=2, timeout=0.05,
+                                     connection_class=IdleConnection)
+        first = pool.get_connection('GET')
+        second = pool.get_connection('GET')
+        self.assertEqual(pool_stats()['test-pool']['in_use'], 2)
+        # Exhausted: waits for the timeout, then fails
+        with self.assertRaises(redis.ConnectionError):
+            pool.get_connection('GET')
+        pool.release(first)
+        pool.release(second)
+        stats = pool_stats()['test-pool']
+        self.assertEqual((stats['in_use'], stats['checkouts'], stats['errors']), (0, 2, 1))
+        self.assertEqual(stats['max_connections'], 2)
+        self.assertGreaterEqual(stats['max_wait'], 0)
+
+    def test_counts_connect_errors(self):
+        # Nothing listens on port 1
+        pool = MeteredConnectionPool(role='test-unreachable', max_connections=2, timeout=0.05,
+                                     port=1, socket_connect_timeout=0.5)
+        with self.assertRaises(redis.ConnectionError):
+            redis.Redis(connection_pool=pool).get('key')
+        stats = pool_stats()['test-unreachable']
+        self.assertEqual(stats['in_use'], 0)
+        self.assertGreaterEqual(stats['errors'], 1)
+
+    def test_pool_made_before_a_fork_keeps_reporting(self):
+        pool = MeteredConnectionPool(role='test-forked', max_connections=3, timeout=0.05,
+                                     connection_class=IdleConnection)
+        # The child starts with no stats, the pool is inherited as is
+        with mock.patch('core.redis._stats_pid', -1):
+            pool.release(pool.get_connection('GET'))
+        stats = pool_stats()['test-forked']
+        self.assertEqual((stats['checkouts'], stats['in_use'], stats['max_connections']), (1, 0, 3))
+
+
+class FakePool:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+class AsyncRedisTest(SimpleTestCase):
+    """Test module for the aioredis pools of event loops"""
+
+    def test_one_pool_per_loop_closed_with_it(self):
+        created = []
+
+        async def create_redis_pool(url):
+            await asyncio.sleep(0)
+            created.append(FakePool())
+            return created[-1]
+
+        async def use():
+            pools = await asyncio.gather(*[get_async_redis('redis://redis:6379/3') for _ in range(3)])
+            self.assertEqual(len(set(map(id, pools))), 1)
+
+        with mock.patch('aioredis.create_redis_pool', side_effect=create_redis_pool):
+            for _ in range(3):
+                async_to_sync(use)()
+        # A loop per call, each closed its pool on the way out and is forgotten
+        self.assertEqual(len(created), 3)
+        self.assertTrue(all(pool.closed for pool in created))
+        gc.collect()
+        self.assertEqual(len(_async_pools), 0)
+
@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import time
+from django.db import connections
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from community.models import Puppy
+from core import replicas
+
+
+def add_database(alias, name):
+    """A SQLite database standing in for a replica of the primary"""
+    connections.databases[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}
+
+
+def remove_database(alias):
+    connections[alias].close()
+    del connections.databases[alias]
+    delattr(connections._connections, alias)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_test'])
+class ReplicaRouterTest(TestCase):
+    """Test module for reads from replicas with read-your-writes"""
+    databases = {'default', 'replica_test'}
+
+    @classmethod
+    def setUpClass(cls):
+        add_database('replica_test', ':memory:')
+        with connections['replica_test'].schema_editor() as editor:
+            editor.create_model(Puppy)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        remove_database('replica_test')
+
+    def setUp(self):
+        Puppy.objects.create(name='Casper', age=4, breed='Bull Dog', color='Black')
+        # The replica lags behind and only has an older puppy
+        Puppy.objects.using('replica_test').create(name='Rambo', age=1, breed='Labrador', color='Black')
+
+    def names(self, client, **headers):
+        response = client.get(reverse('puppy'), **headers)
+        return [puppy['name'] for puppy in response.data['results']]
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertEqual(self.names(Client()), ['Rambo'])
+        # Streamed rows are read after the view returned
+        response = Client().get(reverse('puppy-export'))
+        self.assertEqual([puppy['name'] for puppy in json.loads(b''.join(response.streaming_content))],
+                         ['Rambo'])
+        # Outside requests everything reads from the primary
+        self.assertEqual(list(Puppy.objects.values_list('name', flat=True)), ['Casper'])
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        client = Client()
+        response = client.post(reverse('puppy'), {'name': 'Muffin', 'age': 3, 'breed': 'Gradane',
+                                                  'color': 'Brown'}, content_type='application/json')
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        pin = response[replicas.PIN_HEADER]
+        self.assertEqual(sorted(self.names(client)), ['Casper', 'Muffin'])
+        # API clients without cookies send the header back
+        self.assertEqual(sorted(self.names(Client(), HTTP_X_PRIMARY_PIN=pin)), ['Casper', 'Muffin'])
+        self.assertEqual(self.names(Client()), ['Rambo'])
+
+    def test_pins_expire_and_cant_be_stretched(self):
+        self.assertEqual(self.names(Client(), HTTP_X_PRIMARY_PIN=str(time.time() - 1)), ['Rambo'])
+        self.assertEqual(self.names(Client(), HTTP_X_PRIMARY_PIN=str(time.time() + 3600)), ['Rambo'])
+
+    def test_reads_after_a_write_in_the_request_use_the_primary(self):
+        with replicas.use_replicas():
+            self.assertEqual(Puppy.objects.get().name, 'Rambo')
+            Puppy.objects.filter(name='Casper').update(age=5)
+            self.assertEqual(Puppy.objects.get().name, 'Casper')
+            self.assertTrue(replicas.wrote())
+        self.assertFalse(replicas.wrote())
+
+
+class ReplicaFallbackTest(SimpleTestCase):
+    """Test module for replicas that are down"""
+    databases = {'replica_down'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        # SQLite can't create a database in a directory that doesn't exist
+        add_database('replica_down', os.path.join(cls.directory.name, 'missing', 'db.sqlite3'))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        remove_database('replica_down')
+        cls.directory.cleanup()
+
+    @override_settings(DATABASE_REPLICAS=['replica_down'], REPLICA_RETRY_SECONDS=60)
+    def test_unavailable_replica_falls_back_to_the_primary(self):
+        with self.assertLogs('core.replicas', 'WARNING'):
+            self.assertEqual(replicas.choose_replica(), 'default')
+        # Skipped without another connection attempt until the retry time
+        self.assertGreater(replicas._down_until['replica_down'], time.monotonic())
+        os.mkdir(os.path.join(self.directory.name, 'missing'))
+        self.assertEqual(replicas.choose_replica(), 'default')
+        replicas._down_until.clear()
+        self.assertEqual(replicas.choose_replica(), 'replica_down')
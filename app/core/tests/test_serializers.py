@@ -0,0 +1,41 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from rest_framework import serializers
+from community.models import Puppy
+from community.serializers import PuppySerializer
+from core.serializers import ValuesSerializer
+from user.models import User
+from user.serializers import UserSerializer
+
+
+class ValuesSerializerTest(TestCase):
+    """Test module for the values() based read serializer"""
+
+    def setUp(self):
+        Puppy.objects.create(name='Casper', age=4, breed='Bull Dog', color='Black')
+        Puppy.objects.create(name='Muffin', age=3, breed='Gradane', color='Brown')
+        User.objects.create_user('plain@example.com', 'pAssw0rd!')
+        User.objects.create_user('full@example.com', 'pAssw0rd!', firstname='Full', lastname='User',
+                                 phone='+2348012345678', image='users/full.png',
+                                 roles=['ADMIN', 'CANDIDATE'])
+
+    def test_puppy_output_is_identical(self):
+        queryset = Puppy.objects.order_by('created_at')
+        self.assertEqual(ValuesSerializer(PuppySerializer).serialize(queryset),
+                         PuppySerializer(queryset, many=True).data)
+
+    def test_user_output_is_identical(self):
+        queryset = User.objects.all()
+        self.assertEqual(ValuesSerializer(UserSerializer).serialize(queryset),
+                         UserSerializer(queryset, many=True).data)
+
+    def test_computed_fields_are_rejected(self):
+        class BreedSerializer(serializers.ModelSerializer):
+            description = serializers.CharField(source='get_breed')
+
+            class Meta:
+                model = Puppy
+                fields = ('name', 'description')
+
+        with self.assertRaises(ImproperlyConfigured):
+            ValuesSerializer(BreedSerializer).serialize(Puppy.objects.all())
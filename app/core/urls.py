@@ -19,6 +19,7 @@ from django.conf.urls import url
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from core.metrics import metrics
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -45,4 +46,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/auth/', include('user.urls')),
     path('api/v1/community/', include('community.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
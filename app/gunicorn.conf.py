@@ -0,0 +1,17 @@
+"""Gunicorn settings, read from the working directory"""
+import os
+import shutil
+
+
+def on_starting(server):
+    # Forget the metrics of the previous run, see core/metrics.py
+    path = os.environ.get('prometheus_multiproc_dir')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('prometheus_multiproc_dir'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
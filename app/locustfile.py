@@ -1,27 +1,213 @@
+"""
+Load test of the whole API, weighted like production traffic.
+
+Seed the database, then run headless with the settings of locust.conf:
+
+    python manage.py seed_load_test
+    locust --config locust.conf
+
+The run fails, with exit code 1, when an endpoint's p95 or the overall error
+rate breaks the limits of the --slo-file (locust_slo.json by default), which
+only the master, or a local run, reads. Seed again before every run, the
+password reset tokens are single use: seed with ``--workers N`` for a
+distributed run, and each of the N workers claims its own share of them.
+"""
+import base64
+import json
+import logging
+import os
 import random
-from locust import HttpUser, HttpLocust, TaskSet, task, between
+import uuid
+from locust import HttpUser, between, events, task
+from locust.runners import WorkerRunner
+
+AUTH = '/api/v1/auth'
+PUPPIES = '/api/v1/community/puppies/'
+BREEDS = ['Bull Dog', 'Labrador', 'Gradane', 'Pamerion', 'Poodle', 'Beagle', 'Boxer', 'Husky']
+COLORS = ['Black', 'Brown', 'White', 'Golden', 'Grey', 'Spotted']
+LASTNAMES = ['Adeyemi', 'Bello', 'Chukwu', 'Eze', 'Lawal', 'Okafor', 'Usman']
+
+logger = logging.getLogger(__name__)
+seed = {}
+
+
+@events.init_command_line_parser.add_listener
+def _add_arguments(parser):
+    parser.add_argument('--seed-file', default='locust_seed.json',
+                        help='Credentials written by manage.py seed_load_test')
+    parser.add_argument('--slo-file', default='locust_slo.json',
+                        help='p95 and error rate limits the run must stay within')
+
+
+@events.init.add_listener
+def _load_seed(environment, runner=None, **kwargs):
+    path = environment.parsed_options.seed_file
+    with open(path) as seed_file:
+        seed.update(json.load(seed_file))
+    if isinstance(runner, WorkerRunner):
+        slot = claim_worker_slot(path, seed.get('workers', 1))
+        seed['reset_tokens'] = [] if slot is None else seed['reset_tokens'][slot::seed['workers']]
+    random.shuffle(seed['reset_tokens'])
+
+
+def claim_worker_slot(path, workers):
+    """
+    The first of the seed's worker slots no other worker took, by creating its
+    claim file next to the seed file. seed_load_test deletes the claims.
+    """
+    for slot in range(workers):
+        try:
+            os.close(os.open(f'{path}.worker{slot}', os.O_CREAT | os.O_EXCL))
+            return slot
+        except FileExistsError:
+            continue
+    logger.warning('All %s worker slots of %s are taken, skipping password changes', workers, path)
+    return None
+
+
+@events.quitting.add_listener
+def _check_slos(environment, **kwargs):
+    """Fail the run when it breached the limits of the SLO file"""
+    # Workers only hold their own share of the stats, the master decides
+    if isinstance(environment.runner, WorkerRunner):
+        return
+    with open(environment.parsed_options.slo_file) as slo_file:
+        slos = json.load(slo_file)
+    stats, breaches = environment.stats, []
+    if stats.total.fail_ratio > slos['error_rate']:
+        breaches.append(f'error rate {stats.total.fail_ratio:.2%} over {slos["error_rate"]:.2%}')
+    for (name, method), entry in stats.entries.items():
+        if not entry.num_requests:
+            continue
+        limit = slos['p95_ms'].get(f'{method} {name}', slos['p95_ms']['default'])
+        p95 = entry.get_response_time_percentile(0.95)
+        if p95 > limit:
+            breaches.append(f'{method} {name} p95 {p95:.0f}ms over {limit}ms')
+    for breach in breaches:
+        logger.error('SLO breached: %s', breach)
+    # Instead of locust's own exit code, which fails a run on any error at all
+    environment.process_exit_code = 1 if breaches else 0
+
+
+def jwt_claims(token):
+    payload = token.split('.')[1]
+    return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
 
 
-class UserLoadTest(HttpUser):
-    wait_time = between(5, 9)
+def puppy():
+    return {'name': f'Load {uuid.uuid4().hex[:8]}', 'age': random.randint(0, 15),
+            'breed': random.choice(BREEDS), 'color': random.choice(COLORS)}
+
+
+class SignUpUser(HttpUser):
+    weight = 1
+    wait_time = between(1, 2)
 
     @task
-    def users_api(self):
-        self.client.get("/api/v1/auth/users/user-list/")
-        # self.client.get("/world")
+    def signup(self):
+        self.client.post(f'{AUTH}/signup/', json={
+            'email': f'load-{uuid.uuid4().hex}@example.com',
+            'password': seed['password'],
+            'firstname': 'Load',
+            'lastname': 'Test',
+        }, name=f'{AUTH}/signup/')
+
+
+class AuthenticatedUser(HttpUser):
+    """A seeded user who logs in, then reads and edits their profile"""
+    weight = 4
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        self.login()
+
+    def login(self):
+        response = self.client.post(f'{AUTH}/login/', json={
+            'email': random.choice(seed['emails']), 'password': seed['password']})
+        if response.status_code != 200:
+            self.user_id = self.refresh = None
+            return
+        tokens = response.json()
+        self.refresh = tokens['refresh']
+        self.user_id = jwt_claims(tokens['access'])['user_id']
+        self.client.headers['Authorization'] = f'Bearer {tokens["access"]}'
+
+    @task(6)
+    def read_profile(self):
+        if self.user_id:
+            self.client.get(f'{AUTH}/users/{self.user_id}/', name=f'{AUTH}/users/[id]/')
+
+    @task(2)
+    def update_profile(self):
+        if self.user_id:
+            self.client.patch(f'{AUTH}/users/{self.user_id}/',
+                              json={'lastname': random.choice(LASTNAMES)}, name=f'{AUTH}/users/[id]/')
+
+    @task(3)
+    def user_list(self):
+        self.client.get(f'{AUTH}/users/user-list/')
+
+    @task(1)
+    def refresh_token(self):
+        if not self.refresh:
+            return self.login()
+        response = self.client.post(f'{AUTH}/token/refresh/', json={'refresh': self.refresh})
+        if response.status_code == 200:
+            self.client.headers['Authorization'] = f'Bearer {response.json()["access"]}'
+
+    @task(1)
+    def login_again(self):
+        self.login()
+
+
+class PuppyUser(HttpUser):
+    """Browses the puppy list and detail pages, and adds, edits and removes puppies"""
+    weight = 4
+    wait_time = between(1, 3)
+
+    @task(5)
+    def list_puppies(self):
+        params = random.choice([{}, {'breed': random.choice(BREEDS)},
+                                {'color': random.choice(COLORS), 'min_age': 3},
+                                {'ordering': 'created_at'}])
+        response = self.client.get(PUPPIES, params=params, name=PUPPIES)
+        if response.status_code == 200 and response.json()['links']['next'] and random.random() < 0.3:
+            self.client.get(response.json()['links']['next'], name=f'{PUPPIES}?cursor=[cursor]')
 
-    # @task(3)
-    # def view_post(self):
-    #     item_id = random.randint(1, 10000)
-    #     self.client.get(f"/item?id={item_id}", name="/item")
+    @task(3)
+    def read_puppy(self):
+        response = self.client.get(PUPPIES, params={'page_size': 20}, name=PUPPIES)
+        if response.status_code == 200 and response.json()['results']:
+            pk = random.choice(response.json()['results'])['id']
+            with self.client.get(f'{PUPPIES}{pk}/', name=f'{PUPPIES}[id]/',
+                                 catch_response=True) as detail:
+                # Another user may have deleted it since
+                if detail.status_code == 404:
+                    detail.success()
 
-    # def on_start(self):
-    #     self.client.post("/login", {"username": "foo", "password": "bar"})
+    @task(1)
+    def puppy_lifecycle(self):
+        response = self.client.post(PUPPIES, json=puppy(), name=PUPPIES)
+        if response.status_code != 201:
+            return
+        url = f'{PUPPIES}{response.json()["id"]}/'
+        self.client.put(url, json=puppy(), name=f'{PUPPIES}[id]/')
+        self.client.delete(url, name=f'{PUPPIES}[id]/')
 
 
-class UserTasks(TaskSet):
-    wait_time = between(5, 9)
+class PasswordResetUser(HttpUser):
+    """Asks for a reset, then checks and uses one of the seeded tokens"""
+    weight = 1
+    wait_time = between(2, 5)
 
     @task
-    def users_api(self):
-        self.client.get("/api/v1/auth/users/user-list/")
+    def reset_password(self):
+        self.client.post(f'{AUTH}/users/reset_password/',
+                         json={'email': random.choice(seed['emails'])})
+        if not seed['reset_tokens']:
+            return
+        # Reset tokens are single use, each is handed out once per run
+        token = seed['reset_tokens'].pop()
+        self.client.post(f'{AUTH}/users/reset_password/validate_token/', json={'token': token})
+        self.client.post(f'{AUTH}/users/reset_password/change/', json={
+            'token': token, 'new_password': seed['password']})
@@ -3,3 +3,21 @@ from django.apps import AppConfig
 
 class UserConfig(AppConfig):
     name = 'user'
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete, pre_migrate, post_migrate
+        from core.caching import watch
+        from .authentication import invalidate_user
+        from .search import create_trigram_extension, install_search_trigger
+        from .backends import check_identifiers, create_email_lower_index
+        from core.serializers import ValuesSerializer
+        from .serializers import UserSerializer
+        User = self.get_model('User')
+        # The columns of the cached user list, logins updating last_login leave it be
+        watch(User, fields=ValuesSerializer(UserSerializer).names)
+        post_save.connect(invalidate_user, sender=User, dispatch_uid='user.invalidate_user')
+        post_delete.connect(invalidate_user, sender=User, dispatch_uid='user.invalidate_user')
+        pre_migrate.connect(create_trigram_extension, sender=self, dispatch_uid='user.trigram_extension')
+        pre_migrate.connect(check_identifiers, sender=self, dispatch_uid='user.check_identifiers')
+        post_migrate.connect(install_search_trigger, sender=self, dispatch_uid='user.search_trigger')
+        post_migrate.connect(create_email_lower_index, sender=self, dispatch_uid='user.email_lower_index')
@@ -0,0 +1,168 @@
+"""
+JWT authentication backed by a per-process user cache.
+
+Authenticated requests look the user up in a bounded LRU instead of running a
+primary key SELECT every time. Saving or deleting a user evicts it locally and
+publishes the id on a Redis channel so every other process evicts it too;
+entries also expire after ``USER_CACHE_TTL`` seconds as a safety net for
+changes made with ``QuerySet.update()`` or a missed message.
+"""
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+from channels.auth import UserLazyObject
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+from django.db import transaction
+from core.redis import get_redis
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'user:invalidate'
+
+
+class UserCache:
+    """Thread safe LRU of user instances keyed by id"""
+    retry_interval = 30  # seconds between attempts to reach Redis
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._retry_at = 0
+
+    def get(self, user_id):
+        if not self._ensure_listener():
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # Requests get their own deep copy, roles and _state included, so one view
+        # can't leak changes into another
+        return copy.deepcopy(user)
+
+    def set(self, user_id, user):
+        if not self._listening():
+            return
+        with self._lock:
+            self._entries[user_id] = (copy.deepcopy(user), time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _on_message(self, message):
+        self.evict(message['data'].decode())
+
+    def _listening(self):
+        listener = self._listener
+        return listener is False or (listener is not None and listener.is_alive())
+
+    def _ensure_listener(self):
+        """Subscribe to evictions from other processes, returns whether caching is safe"""
+        if self._listening():
+            return True
+        with self._lock:
+            if self._listening():
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+            # Anything cached while unsubscribed may have missed an eviction
+            self._entries.clear()
+            try:
+                pubsub = get_redis('cache').pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_message})
+                self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            except NotImplementedError:
+                # Cache backend isn't Redis (tests, local dev): local evictions and TTL only
+                self._listener = False
+            except Exception:
+                logger.exception('Could not subscribe to %s', INVALIDATION_CHANNEL)
+                self._listener = None
+                self._retry_at = time.monotonic() + self.retry_interval
+                return False
+            return True
+
+
+user_cache = UserCache(maxsize=getattr(settings, 'USER_CACHE_SIZE', 10000),
+                       ttl=getattr(settings, 'USER_CACHE_TTL', 300))
+
+
+def _publish_eviction(user_id):
+    try:
+        get_redis('cache').publish(INVALIDATION_CHANNEL, user_id)
+    except NotImplementedError:
+        pass
+    except Exception:
+        logger.exception('Could not publish eviction of user %s', user_id)
+
+
+def invalidate_user(sender, instance, **kwargs):
+    """post_save/post_delete receiver for the user model"""
+    user_id = str(instance.pk)
+    user_cache.evict(user_id)
+    transaction.on_commit(lambda: _publish_eviction(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the token's user through ``user_cache``"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        return user
+
+
+@database_sync_to_async
+def get_socket_user(scope):
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    if not token:
+        return AnonymousUser()
+    authentication = CachedJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(token[0]))
+    except (InvalidToken, AuthenticationFailed):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Channels middleware authenticating sockets with an access token in ``?token=``"""
+
+    def populate_scope(self, scope):
+        if 'user' not in scope:
+            scope['user'] = UserLazyObject()
+
+    async def resolve_scope(self, scope):
+        if isinstance(scope['user'], UserLazyObject):
+            scope['user']._wrapped = await get_socket_user(scope)
@@ -0,0 +1,126 @@
+import logging
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.management.base import CommandError
+from django.db import connections
+from django.db.models import Count
+from django.db.models.functions import Lower
+from .hashers import check_password, make_password
+from .models import normalize_phone
+
+UserModel = get_user_model()
+logger = logging.getLogger(__name__)
+
+EMAIL_LOWER_INDEX = 'user_email_lower_uniq'
+# Unique, or a case variant of an address would make both accounts ambiguous at login.
+# Left unbuilt while such duplicates exist, they have to be merged first
+EMAIL_LOWER_INDEX_SQL = [
+    'DROP INDEX IF EXISTS user_email_lower_idx',
+    f'CREATE UNIQUE INDEX IF NOT EXISTS {EMAIL_LOWER_INDEX} ON {{table}} (lower(email))',
+]
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend hashing through the bounded pool in ``user.hashers``"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        user = self.get_login_user(username)
+        if user is None:
+            # Hash anyway so unknown users take as long as wrong passwords
+            make_password(password)
+        elif check_password(user, password) and self.user_can_authenticate(user):
+            return user
+
+    def get_login_user(self, username):
+        try:
+            return UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            return None
+
+
+class IdentifierBackend(PooledModelBackend):
+    """
+    Log in with an email, in any case, or a phone number. The identifier's
+    shape picks the column, so it's one indexed query and never a fallback.
+    """
+
+    def get_login_user(self, username):
+        username = username.strip()
+        phone = normalize_phone(username)
+        if phone is not None:
+            users = UserModel._default_manager.filter(phone=phone)
+        else:
+            # Served by user_email_lower_uniq
+            users = UserModel._default_manager.annotate(email_lower=Lower('email')).filter(
+                email_lower=username.lower())
+        try:
+            return users.get()
+        except UserModel.DoesNotExist:
+            return None
+        except UserModel.MultipleObjectsReturned:
+            # Case variants from before user_email_lower_uniq, see clean_user_identifiers
+            return None
+
+
+def existing_user_model(using, apps):
+    """The historical User model, None unless its table is there to work on"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or apps is None:
+        return None
+    try:
+        User = apps.get_model('user', 'User')
+    except LookupError:
+        return None
+    if User._meta.db_table not in connection.introspection.table_names():
+        return None
+    return User
+
+
+def email_case_duplicates(users):
+    """Lowercased addresses held by more than one user"""
+    return list(users.annotate(email_lower=Lower('email')).exclude(email=None).values(
+        'email_lower').annotate(count=Count('pk')).filter(count__gt=1).values_list('email_lower', flat=True))
+
+
+def phone_duplicates(users):
+    """Phone values, blank included, held by more than one user"""
+    return list(users.exclude(phone=None).values('phone').annotate(
+        count=Count('pk')).filter(count__gt=1).values_list('phone', flat=True))
+
+
+def check_identifiers(using='default', apps=None, **kwargs):
+    """
+    pre_migrate receiver, read only: stops the migration with a pointer to
+    ``clean_user_identifiers`` while phone values the unique column can't
+    hold exist, instead of failing halfway through on the constraint.
+    """
+    User = existing_user_model(using, apps)
+    if User is None:
+        return
+    users = User._base_manager.using(using)
+    duplicates = phone_duplicates(users)
+    if duplicates:
+        raise CommandError(
+            f'{len(duplicates)} phone values are shared by several users. Review them with '
+            f'"manage.py clean_user_identifiers --dry-run" and resolve them before migrating.')
+    if email_case_duplicates(users):
+        logger.warning('Emails differ only in case, %s will not be built, see clean_user_identifiers',
+                       EMAIL_LOWER_INDEX)
+
+
+def create_email_lower_index(using='default', apps=None, **kwargs):
+    """post_migrate receiver, migrations here are generated and can't hold a functional index"""
+    User = existing_user_model(using, apps)
+    if User is None:
+        return
+    if email_case_duplicates(User._base_manager.using(using)):
+        logger.error('Not creating %s while emails differ only in case, see clean_user_identifiers',
+                     EMAIL_LOWER_INDEX)
+        return
+    with connections[using].cursor() as cursor:
+        for sql in EMAIL_LOWER_INDEX_SQL:
+            cursor.execute(sql.format(table=User._meta.db_table))
@@ -0,0 +1,83 @@
+"""
+Password hashing through a bounded per-process thread pool.
+
+PBKDF2 releases the GIL while it runs, so with threaded gunicorn workers the
+pool lets a burst of logins use every core while capping how many hashes run
+at once, instead of one slow hash per request pinning every worker. Only
+the pure hashing runs in the pool, database access stays on the request
+thread.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with the work factor taken from ``PASSWORD_HASH_ITERATIONS``.
+
+    The algorithm name is unchanged, so existing hashes keep verifying and are
+    re-encoded with the configured cost on the user's next login.
+    """
+    iterations = getattr(settings, 'PASSWORD_HASH_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+def _new_executor(max_workers=None):
+    return ThreadPoolExecutor(max_workers=max_workers or settings.PASSWORD_HASH_WORKERS,
+                              thread_name_prefix='password-hash')
+
+
+def get_executor():
+    global _executor, _executor_pid
+    # Threads don't survive a fork, build a fresh pool in every worker process
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = _new_executor()
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def reset_executor(max_workers=None):
+    """Replace the pool, e.g. to benchmark a different size"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=True)
+        _executor = _new_executor(max_workers)
+        _executor_pid = os.getpid()
+
+
+def make_password(password):
+    return get_executor().submit(hashers.make_password, password).result()
+
+
+def _check(password, encoded):
+    outdated = []
+    correct = hashers.check_password(password, encoded, setter=outdated.append)
+    return correct, bool(outdated)
+
+
+def set_password(user, password):
+    """Pooled ``user.set_password()``, the caller saves the user"""
+    user.password = make_password(password)
+    user._password = password
+
+
+def check_password(user, password):
+    """
+    Pooled ``user.check_password()``. When the stored hash uses another
+    hasher or cost than the preferred one it is upgraded and saved.
+    """
+    correct, outdated = get_executor().submit(_check, password, user.password).result()
+    if correct and outdated:
+        set_password(user, password)
+        user.save(update_fields=['password'])
+    return correct
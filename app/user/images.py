@@ -0,0 +1,107 @@
+"""
+Profile image pipeline.
+
+During the request an upload is only written to local staging storage.
+``build_profile_images`` then runs on a celery worker: it makes the resized
+variants with Pillow, pushes the original and the variants to the user's
+storage (S3 in production) and swaps them onto the user. API payloads expose
+the small variants, never the full size original.
+"""
+import io
+import logging
+import os
+import uuid
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from PIL import Image, ImageOps
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = ('image', 'image_thumbnail', 'image_medium')
+
+
+def get_staging_storage():
+    return FileSystemStorage(location=settings.IMAGE_STAGING_ROOT)
+
+
+def stage_upload(upload):
+    """Write an uploaded image to staging storage, returns its name there"""
+    extension = os.path.splitext(upload.name)[1].lower()
+    return get_staging_storage().save(f'users/{uuid.uuid4().hex}{extension}', upload)
+
+
+def discard_upload(name):
+    """Delete a staged upload whose user was never saved"""
+    _delete(get_staging_storage(), [name])
+
+
+def render_variant(image, size, crop):
+    """``image`` scaled to fit ``size`` pixels, or cropped to a square of it, as file content"""
+    if crop:
+        variant = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    else:
+        variant = image.copy()
+        variant.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    if variant.mode in ('RGBA', 'LA', 'P'):
+        variant.save(buffer, format='PNG', optimize=True)
+        extension = 'png'
+    else:
+        variant.convert('RGB').save(buffer, format='JPEG', quality=85, optimize=True)
+        extension = 'jpg'
+    return ContentFile(buffer.getvalue()), extension
+
+
+def build_profile_images(user_id, name):
+    """
+    Process the staged upload ``name`` for a user. Does nothing if the user
+    has uploaded another image since, that upload's own task wins.
+    """
+    staging = get_staging_storage()
+    if not staging.exists(name):
+        return None
+    storage = User._meta.get_field('image').storage
+    base = os.path.splitext(os.path.basename(name))[0]
+    saved = {}
+    try:
+        with staging.open(name) as staged:
+            image = ImageOps.exif_transpose(Image.open(staged))
+            image.load()
+            staged.seek(0)
+            saved['image'] = storage.save(f'users/{os.path.basename(name)}', staged)
+        for variant, size in settings.PROFILE_IMAGE_SIZES.items():
+            content, extension = render_variant(image, size, crop=variant == 'thumbnail')
+            saved[f'image_{variant}'] = storage.save(f'users/{base}_{variant}.{extension}', content)
+    except (IOError, SyntaxError, Image.DecompressionBombError):
+        logger.exception('Could not process profile image %s', name)
+        User.objects.filter(pk=user_id, image_pending=name).update(image_pending=None)
+        _delete(storage, saved.values())
+        staging.delete(name)
+        return None
+
+    with transaction.atomic():
+        user = User.objects.select_for_update().filter(pk=user_id, image_pending=name).first()
+        if user is None:
+            stale = saved.values()
+        else:
+            stale = [getattr(user, field).name for field in IMAGE_FIELDS]
+            for field in IMAGE_FIELDS:
+                setattr(user, field, saved.get(field))
+            user.image_pending = None
+            # save() rather than update() so the user caches hear about it
+            user.save(update_fields=[*IMAGE_FIELDS, 'image_pending', 'modified_at'])
+    _delete(storage, stale)
+    staging.delete(name)
+    return saved
+
+
+def _delete(storage, names):
+    for name in names:
+        if name:
+            try:
+                storage.delete(name)
+            except Exception:
+                logger.exception('Could not delete %s', name)
@@ -0,0 +1,135 @@
+"""
+Streaming bulk import of users from CSV or JSON lines.
+
+Rows are read lazily and handled a chunk at a time: validated, deduplicated
+against the database with one query, hashed on an executor and written with
+a single ``bulk_create``. Memory use depends on the chunk size only, not on
+the size of the file.
+"""
+import csv
+import io
+import json
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.core.validators import validate_email
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from core.caching import bump_generation
+from .models import User, phone_regex
+
+IMPORT_FIELDS = ('email', 'password', 'firstname', 'lastname', 'phone')
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def read_rows(stream, fmt):
+    """Yield dicts from a binary ``stream`` holding CSV (with a header row) or JSON lines"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        yield from csv.DictReader(text)
+    elif fmt == 'jsonl':
+        for line in text:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield {'_error': 'Invalid JSON'}
+    else:
+        raise ValueError(f'Unsupported format {fmt}')
+
+
+def clean_row(row):
+    """Return ``(data, error)`` for a raw row"""
+    if not isinstance(row, dict):
+        return None, 'Invalid row'
+    if '_error' in row:
+        return None, row['_error']
+    data = {field: (str(row.get(field) or '').strip() or None) for field in IMPORT_FIELDS}
+    if not data['email']:
+        return None, 'Email is required'
+    data['email'] = data['email'].lower()
+    try:
+        # Syntax only, no DNS lookups for a million rows
+        validate_email(data['email'])
+        if data['phone']:
+            phone_regex(data['phone'])
+    except ValidationError as e:
+        return None, '; '.join(e.messages)
+    if data['password'] is not None and len(data['password']) < 8:
+        return None, 'Password must have at least 8 characters'
+    data['verified'] = str(row.get('verified', '')).strip().lower() in TRUE_VALUES
+    return data, None
+
+
+def import_chunk(rows, executor, first_row=1):
+    """Import one chunk of raw rows, returns ``(created, rejects)``"""
+    rejects, valid, seen, phones = [], [], set(), set()
+    for number, row in enumerate(rows, start=first_row):
+        data, error = clean_row(row)
+        if data is None:
+            rejects.append({'row': number, 'error': error})
+        elif data['email'] in seen:
+            rejects.append({'row': number, 'error': 'Duplicate email in file'})
+        elif data['phone'] and data['phone'] in phones:
+            rejects.append({'row': number, 'error': 'Duplicate phone in file'})
+        else:
+            seen.add(data['email'])
+            if data['phone']:
+                phones.add(data['phone'])
+            valid.append((number, data))
+
+    existing_emails, existing_phones = set(), set()
+    for email, phone in User.objects.filter(Q(email__in=seen) | Q(phone__in=phones)).values_list('email', 'phone'):
+        existing_emails.add(email)
+        if phone:
+            existing_phones.add(phone)
+    kept = []
+    for number, data in valid:
+        if data['email'] in existing_emails:
+            rejects.append({'row': number, 'error': 'Email already exists'})
+        elif data['phone'] in existing_phones:
+            rejects.append({'row': number, 'error': 'Phone already exists'})
+        else:
+            kept.append((number, data))
+    valid = kept
+
+    # Rows without a password get an unusable one, the user resets it later
+    passwords = executor.map(make_password, [data.pop('password') for _, data in valid],
+                             chunksize=32)
+    users = [User(password=password, **data) for (_, data), password in zip(valid, passwords)]
+    # A concurrent signup can still win the race for an email or phone, skip those rows
+    User.objects.bulk_create(users, ignore_conflicts=True)
+    # The ids are made here, so the ones in the table are the rows this import inserted
+    inserted = set(User.objects.filter(pk__in=[user.pk for user in users]).values_list('pk', flat=True))
+    for (number, _), user in zip(valid, users):
+        if user.pk not in inserted:
+            rejects.append({'row': number, 'error': 'Email or phone already exists'})
+    rejects.sort(key=lambda reject: reject['row'])
+    return len(inserted), rejects
+
+
+def import_users(rows, executor, chunk_size=1000, on_chunk=None):
+    """
+    Import an iterable of raw rows, calling ``on_chunk(number, created, rejects)``
+    after every chunk. Returns the total ``(created, rejected)`` counts.
+    """
+    rows = iter(rows)
+    created = rejected = 0
+    number, first_row = 0, 1
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            number += 1
+            chunk_created, rejects = import_chunk(chunk, executor, first_row=first_row)
+            first_row += len(chunk)
+            created += chunk_created
+            rejected += len(rejects)
+            if on_chunk:
+                on_chunk(number, chunk_created, rejects)
+    finally:
+        if created:
+            # bulk_create sends no post_save, drop cached user pages by hand
+            bump_generation(User)
+    return created, rejected
@@ -0,0 +1,176 @@
+"""
+Batched email delivery for the celery workers.
+
+Tasks push rendered-on-demand messages onto a Redis outbox. The first one
+queued since the last flush schedules the next ``flush_email_outbox``, which
+runs ``EMAIL_FLUSH_DELAY`` seconds later and drains everything queued by then,
+so a burst of emails is sent in batches over one SMTP connection that every
+worker process keeps open between tasks instead of a TLS handshake per email.
+
+Delivery is at least once. A drain moves each batch atomically onto a list
+of its own and only deletes it once sent, so a worker killed mid-send leaves
+the batch there. The next drain of any worker puts it back in the outbox once
+the dead drain's lease has run out.
+"""
+import json
+import logging
+import smtplib
+import socket
+import time
+import uuid
+from functools import lru_cache
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import get_template
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_KEY = 'mail:outbox'
+# Lease expiry of every drain with a processing list, by drain
+PROCESSING_KEY = 'mail:processing'
+EMAIL_BATCH_SIZE = getattr(settings, 'EMAIL_BATCH_SIZE', 50)
+# Longer than sending a batch can take, reconnect and SMTP timeouts included
+PROCESSING_LEASE = getattr(settings, 'EMAIL_PROCESSING_LEASE', 300)
+# Set while a flush is scheduled
+FLUSH_KEY = 'mail:flush'
+EMAIL_FLUSH_DELAY = getattr(settings, 'EMAIL_FLUSH_DELAY', 2)
+
+# Up to ARGV[1] items from the head of KEYS[1] to the tail of KEYS[2], in one step
+MOVE_ITEMS_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, ARGV[1] - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+_connection = None
+
+
+@lru_cache(maxsize=None)
+def get_cached_template(name):
+    """Compiled template, loaded once per process"""
+    return get_template(name)
+
+
+def build_message(subject, recipient, template, context):
+    """
+    Render ``<template>.html`` and ``<template>.txt`` into a multipart message
+    """
+    text = get_cached_template(f'{template}.txt').render(context)
+    html = get_cached_template(f'{template}.html').render(context)
+    msg = EmailMultiAlternatives(subject, text, settings.EMAIL_FROM, [recipient])
+    msg.attach_alternative(html, 'text/html')
+    return msg
+
+
+def get_connection():
+    """The SMTP connection owned by the current process"""
+    global _connection
+    if _connection is None:
+        _connection = mail.get_connection(fail_silently=False)
+    return _connection
+
+
+def close_connection(**kwargs):
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+
+
+worker_process_shutdown.connect(close_connection)
+
+
+def send_messages(messages, connection=None):
+    """
+    Send ``messages`` over a persistent connection, reconnecting once when
+    the server has dropped it in between. Returns the number of messages sent.
+    """
+    connection = connection or get_connection()
+    for attempt in range(2):
+        try:
+            # Opening here keeps the backend from closing the connection
+            # again at the end of send_messages()
+            connection.open()
+            return connection.send_messages(messages)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout):
+            connection.close()
+            if attempt:
+                raise
+            logger.info('SMTP connection dropped, reconnecting')
+
+
+def queue_email(subject, recipient, template, context):
+    get_redis('celery').rpush(OUTBOX_KEY, json.dumps({
+        'subject': subject, 'recipient': recipient,
+        'template': template, 'context': context,
+    }))
+
+
+def claim_flush():
+    """
+    True when no flush is scheduled yet, the caller then schedules one. The
+    claim expires in case that flush is lost, beat's flush sends the emails.
+    """
+    return bool(get_redis('celery').set(FLUSH_KEY, 1, nx=True, ex=EMAIL_FLUSH_DELAY + 60))
+
+
+def release_flush():
+    """Called as a flush starts, emails queued from then on schedule the next"""
+    get_redis('celery').delete(FLUSH_KEY)
+
+
+def processing_key(worker):
+    return f'{PROCESSING_KEY}:{worker}'
+
+
+def move_items(redis, source, destination, count):
+    return redis.register_script(MOVE_ITEMS_SCRIPT)(keys=[source, destination], args=[count])
+
+
+def requeue_expired(redis, now=None):
+    """Put the batches of drains whose lease ran out back in the outbox"""
+    now = time.time() if now is None else now
+    for worker, expires in redis.hgetall(PROCESSING_KEY).items():
+        if float(expires) > now:
+            continue
+        worker = worker.decode()
+        while move_items(redis, processing_key(worker), OUTBOX_KEY, EMAIL_BATCH_SIZE):
+            pass
+        logger.warning('Requeued the emails of expired mail drain %s', worker)
+        redis.hdel(PROCESSING_KEY, worker)
+
+
+def drain_outbox(batch_size=EMAIL_BATCH_SIZE):
+    """Send everything queued in the outbox and return the number of emails sent"""
+    redis = get_redis('celery')
+    # Unique to this drain, a restarted worker may get the pid of a dead one
+    worker = f'{socket.gethostname()}:{uuid.uuid4().hex}'
+    processing = processing_key(worker)
+    requeue_expired(redis)
+    sent = 0
+    while True:
+        redis.hset(PROCESSING_KEY, worker, time.time() + PROCESSING_LEASE)
+        items = move_items(redis, OUTBOX_KEY, processing, batch_size)
+        if not items:
+            redis.hdel(PROCESSING_KEY, worker)
+            return sent
+        messages = []
+        for item in items:
+            try:
+                messages.append(build_message(**json.loads(item)))
+            except Exception:
+                logger.exception('Dropping undeliverable email %s', item)
+        try:
+            sent += send_messages(messages)
+        except Exception:
+            # Back in the outbox for the next drain
+            move_items(redis, processing, OUTBOX_KEY, len(items))
+            redis.hdel(PROCESSING_KEY, worker)
+            raise
+        redis.delete(processing)
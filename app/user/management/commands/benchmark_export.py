@@ -0,0 +1,42 @@
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = ('Measure time to first byte, total time and peak Python memory of an '
+            'endpoint, e.g. the streaming exports, against the current database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='e.g. /api/v1/community/puppies/export/')
+        parser.add_argument('--as-user', help='Email of the user to authenticate as')
+
+    def handle(self, *args, **options):
+        client = APIClient(SERVER_NAME='localhost')
+        if options['as_user']:
+            user = User.objects.filter(email=options['as_user']).first()
+            if not user:
+                raise CommandError(f'No user {options["as_user"]}')
+            client.force_authenticate(user)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = client.get(options['path'])
+        if response.status_code != 200:
+            raise CommandError(f'{options["path"]} returned {response.status_code}')
+        if response.streaming:
+            chunks = iter(response.streaming_content)
+            size = len(next(chunks, b''))
+            first_byte = time.perf_counter() - started
+            size += sum(len(chunk) for chunk in chunks)
+        else:
+            first_byte = time.perf_counter() - started
+            size = len(response.content)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f'{options["path"]}: first byte {first_byte * 1000:.1f}ms, '
+                          f'total {elapsed:.2f}s, {size / 1024:.0f}KiB, '
+                          f'peak memory {peak / 1024 / 1024:.1f}MiB')
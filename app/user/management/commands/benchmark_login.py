@@ -0,0 +1,44 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth import authenticate
+from django.core.management.base import BaseCommand
+from django.db import connection
+from user import hashers
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = 'Measure login (authenticate) throughput for different password hashing pool sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4,8',
+                            help='Comma separated hashing pool sizes to try')
+        parser.add_argument('--logins', type=int, default=64, help='Logins per run')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Simultaneous login requests, like gunicorn worker threads')
+
+    def handle(self, *args, **options):
+        password = uuid.uuid4().hex
+        user = User.objects.create_user(f'benchmark-{uuid.uuid4().hex}@example.com', password)
+        try:
+            for workers in [int(value) for value in options['workers'].split(',')]:
+                hashers.reset_executor(workers)
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as clients:
+                    results = list(clients.map(lambda _: self.login(user.email, password),
+                                               range(options['logins'])))
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{workers} hashing workers: {options["logins"]} logins in '
+                                  f'{elapsed:.2f}s ({options["logins"] / elapsed:.1f}/s), '
+                                  f'{results.count(False)} failed')
+        finally:
+            hashers.reset_executor()
+            user.delete()
+
+    @staticmethod
+    def login(email, password):
+        try:
+            return authenticate(username=email, password=password) is not None
+        finally:
+            connection.close()
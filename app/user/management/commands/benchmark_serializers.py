@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from community.models import Puppy
+from community.serializers import PuppySerializer
+from core.serializers import ValuesSerializer
+from user.models import User
+from user.serializers import UserSerializer
+
+TARGETS = {
+    'user': (User, UserSerializer),
+    'puppy': (Puppy, PuppySerializer),
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare ModelSerializer and ValuesSerializer list serialization, query '
+            'included, on existing rows (see seed_users and seed_puppies)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=TARGETS, default='puppy')
+        parser.add_argument('--sizes', default='1000,10000,100000')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs')
+
+    def handle(self, *args, **options):
+        model, serializer_class = TARGETS[options['model']]
+        fast = ValuesSerializer(serializer_class)
+        available = model.objects.count()
+        for size in [int(value) for value in options['sizes'].split(',')]:
+            if size > available:
+                self.stdout.write(f'{size} rows: skipped, only {available} in the table')
+                continue
+            queryset = model.objects.all()[:size]
+            slow = self.best_of(options['repeat'], lambda: serializer_class(queryset.all(), many=True).data)
+            quick = self.best_of(options['repeat'], lambda: fast.serialize(queryset.all()))
+            self.stdout.write(f'{size} rows: {serializer_class.__name__} {slow * 1000:.0f}ms, '
+                              f'ValuesSerializer {quick * 1000:.0f}ms ({slow / quick:.1f}x)')
+
+    @staticmethod
+    def best_of(repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
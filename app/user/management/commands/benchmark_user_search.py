@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from user.models import User
+from user.search import UserSearchFilter
+from user.views import UserViewsets
+
+TERMS = ['okafor', 'grace', 'grace bello', 'seed-', '+234803', '803', 'nomatch']
+
+
+class Command(BaseCommand):
+    help = ('Compare icontains SearchFilter with the indexed user search: first page plus '
+            'count, as the user list runs them, on existing rows (see seed_users)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', action='append', help='Search term, repeatable')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The indexed search only runs on PostgreSQL')
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {User._meta.db_table}')
+        self.stdout.write(f'{User.objects.count()} users')
+        view = UserViewsets()
+        for term in options['term'] or TERMS:
+            request = Request(RequestFactory().get('/', {'search': term}))
+            timings = {}
+            for name, backend in (('icontains', SearchFilter()), ('indexed', UserSearchFilter())):
+                queryset = backend.filter_queryset(request, User.objects.all(), view)
+                timings[name] = self.best_of(options['repeat'], lambda: (
+                    list(queryset.all()[:options['page_size']]), queryset.all().count()))
+            count = UserSearchFilter().filter_queryset(request, User.objects.all(), view).count()
+            self.stdout.write(f'{term!r}: {count} matches, icontains {timings["icontains"] * 1000:.1f}ms, '
+                              f'indexed {timings["indexed"] * 1000:.1f}ms '
+                              f'({timings["icontains"] / timings["indexed"]:.1f}x)')
+
+    @staticmethod
+    def best_of(repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
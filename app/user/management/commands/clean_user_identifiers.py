@@ -0,0 +1,60 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from user.backends import email_case_duplicates
+from user.models import User, normalize_phone
+
+
+class Command(BaseCommand):
+    help = ('Get existing users ready for the unique phone column and the lower(email) index: '
+            'blank phones become NULL, phones and emails are stored normalized. Users sharing '
+            'a phone or an email in different cases are reported, and only changed when asked')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report the changes and conflicts, write nothing')
+        parser.add_argument('--clear-shared-phones', action='store_true',
+                            help='Keep a shared phone on its most recently active user, clear it on the others')
+
+    def handle(self, *args, **options):
+        users = User._base_manager.all()
+        owners = defaultdict(list)
+        rows = users.exclude(phone=None).exclude(phone='').order_by(
+            F('last_login').desc(nulls_last=True), F('date_joined').desc(nulls_last=True), 'pk')
+        for pk, phone in rows.values_list('pk', 'phone').iterator():
+            owners[normalize_phone(phone) or phone].append((pk, phone))
+
+        blank = users.filter(phone='').count()
+        normalized, cleared = {}, []
+        for value, holders in owners.items():
+            if len(holders) > 1:
+                self.stdout.write(self.style.WARNING(
+                    f'Phone {value} is shared by users {", ".join(str(pk) for pk, _ in holders)}'))
+                if not options['clear_shared_phones']:
+                    continue
+                cleared.extend(pk for pk, _ in holders[1:])
+            pk, phone = holders[0]
+            if phone != value:
+                normalized[pk] = value
+
+        duplicates = email_case_duplicates(users)
+        for email in duplicates:
+            self.stdout.write(self.style.WARNING('Email %s is held by users %s in different cases, merge them' % (
+                email, ', '.join(str(pk) for pk in users.filter(email__iexact=email).values_list('pk', flat=True)))))
+        mixed_case = users.exclude(email=None).exclude(email=Lower('email'))
+        for email in duplicates:
+            mixed_case = mixed_case.exclude(email__iexact=email)
+
+        self.stdout.write(f'{blank} blank phones to clear, {len(normalized)} phones to normalize, '
+                          f'{len(cleared)} shared phones to clear, {mixed_case.count()} emails to lowercase')
+        if options['dry_run']:
+            return
+        with transaction.atomic():
+            users.filter(phone='').update(phone=None)
+            # Clear first, a kept number may be the normalized form of a cleared one
+            users.filter(pk__in=cleared).update(phone=None)
+            for pk, phone in normalized.items():
+                users.filter(pk=pk).update(phone=phone)
+            mixed_case.update(email=Lower('email'))
+        self.stdout.write(self.style.SUCCESS('Users updated'))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from user.models import Token
+
+
+class Command(BaseCommand):
+    help = 'Delete expired verification and password reset tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.TOKEN_REAPER_BATCH_SIZE,
+                            help='Rows deleted per statement')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between batches, eases replication lag')
+
+    def handle(self, *args, **options):
+        def report(token_type, count, total):
+            self.stdout.write(f'{token_type}: deleted {count} (total {total})')
+
+        deleted = Token.objects.delete_expired(
+            batch_size=options['batch_size'], pause=options['pause'], on_batch=report)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired tokens'))
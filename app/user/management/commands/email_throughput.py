@@ -0,0 +1,45 @@
+import time
+from django.core import mail
+from django.core.management.base import BaseCommand
+from user.mail import build_message, send_messages
+
+
+class Command(BaseCommand):
+    help = ('Compare per-message and pooled email delivery throughput against an SMTP '
+            'server, e.g. a local sink: python -m smtpd -n -c DebuggingServer localhost:1025')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--recipient', default='sink@example.com')
+
+    def handle(self, *args, **options):
+        def connect():
+            return mail.get_connection(host=options['host'], port=options['port'], username='',
+                                       password='', use_tls=False, fail_silently=False)
+
+        context = {'fullname': 'Load Test', 'email': options['recipient'], 'token': 'abc123'}
+        messages = [build_message('Throughput test', options['recipient'],
+                                  'emails/password_reset_template', context)
+                    for _ in range(options['count'])]
+
+        started = time.perf_counter()
+        for message in messages:
+            # what a task used to do: a fresh connection per email
+            connect().send_messages([message])
+        self.report('connection per message', len(messages), time.perf_counter() - started)
+
+        batch_size = options['batch_size']
+        connection = connect()
+        started = time.perf_counter()
+        for index in range(0, len(messages), batch_size):
+            send_messages(messages[index:index + batch_size], connection=connection)
+        elapsed = time.perf_counter() - started
+        connection.close()
+        self.report('pooled, batches of %s' % batch_size, len(messages), elapsed)
+
+    def report(self, label, count, elapsed):
+        self.stdout.write(f'{label}: {count} messages in {elapsed:.2f}s '
+                          f'({count / elapsed:.1f} msg/s)')
@@ -0,0 +1,44 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from user.importer import read_rows, import_users
+
+
+class Command(BaseCommand):
+    help = 'Bulk import users from a CSV (with header) or JSON lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                            help='Processes hashing passwords')
+        parser.add_argument('--rejects', help='Write rejected rows to this CSV file')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or os.path.splitext(options['path'])[1].lstrip('.')
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError('Pass --format csv or --format jsonl')
+
+        rejects_file = open(options['rejects'], 'w', newline='') if options['rejects'] else None
+        rejects_writer = rejects_file and csv.DictWriter(rejects_file, fieldnames=['row', 'error'])
+        if rejects_writer:
+            rejects_writer.writeheader()
+
+        def report(number, created, rejects):
+            self.stdout.write(f'chunk {number}: {created} created, {len(rejects)} rejected')
+            if rejects_writer:
+                rejects_writer.writerows(rejects)
+
+        try:
+            with open(options['path'], 'rb') as stream, \
+                    ProcessPoolExecutor(max_workers=options['processes']) as executor:
+                created, rejected = import_users(read_rows(stream, fmt), executor,
+                                                 chunk_size=options['chunk_size'],
+                                                 on_chunk=report)
+        finally:
+            if rejects_file:
+                rejects_file.close()
+        self.stdout.write(self.style.SUCCESS(f'Imported {created} users, rejected {rejected}'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = ('Fill User.search_vector for rows written before the search trigger existed, '
+            'a batch at a time')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--all', action='store_true', help='Rebuild every row, not just empty ones')
+
+    def handle(self, *args, **options):
+        queryset = User.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(search_vector__isnull=True)
+        updated, last = 0, None
+        while True:
+            batch = queryset if last is None else queryset.filter(pk__gt=last)
+            ids = list(batch.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            # The trigger recomputes the vector on any UPDATE
+            updated += User.objects.filter(pk__in=ids).update(search_vector=None)
+            last = ids[-1]
+            self.stdout.write(f'{updated} users')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search for {updated} users'))
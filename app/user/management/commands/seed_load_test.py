@@ -0,0 +1,59 @@
+import glob
+import json
+import os
+import random
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from core.caching import bump_generation
+from community.models import Puppy
+from user.models import Token, User
+from .seed_users import FIRSTNAMES, LASTNAMES
+
+
+class Command(BaseCommand):
+    help = ('Seed the users, puppies and password reset tokens locustfile.py runs against, and '
+            'write the credentials it needs to --output. Safe to run again before every run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--puppies', type=int, default=10000)
+        parser.add_argument('--reset-tokens', type=int, default=1000,
+                            help='Single use tokens for the password reset scenario')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Locust workers of a distributed run, each gets its own reset tokens')
+        parser.add_argument('--password', default='pAssw0rd!')
+        parser.add_argument('--output', default='locust_seed.json')
+
+    def handle(self, *args, **options):
+        emails = [f'load-{index}@example.com' for index in range(options['users'])]
+        password = make_password(options['password'])
+        User.objects.bulk_create([
+            User(email=email, password=password, firstname=random.choice(FIRSTNAMES),
+                 lastname=random.choice(LASTNAMES), verified=True)
+            for email in emails
+        ], batch_size=5000, ignore_conflicts=True)
+        # A previous run may have reset passwords or deactivated accounts
+        users = User.objects.filter(email__in=emails)
+        users.update(password=password, verified=True, is_active=True)
+        bump_generation(User)
+
+        missing = options['puppies'] - Puppy.objects.count()
+        if missing > 0:
+            call_command('seed_puppies', count=missing, stdout=self.stdout)
+
+        # Tokens of earlier runs were handed out already
+        Token.objects.filter(user__in=users, token_type='PASSWORD_RESET').delete()
+        user_list = list(users)
+        tokens = [Token.objects.create_token(random.choice(user_list), 'PASSWORD_RESET', length=6).raw
+                  for _ in range(options['reset_tokens'])] if user_list else []
+
+        # Worker slots claimed in the previous run, see locustfile.claim_worker_slot()
+        for claim in glob.glob(glob.escape(options['output']) + '.worker*'):
+            os.remove(claim)
+        with open(options['output'], 'w') as output:
+            json.dump({'password': options['password'], 'emails': emails, 'reset_tokens': tokens,
+                       'workers': options['workers']}, output)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(emails)} users, {max(missing, 0)} new puppies and {len(tokens)} reset tokens, '
+            f'credentials in {options["output"]}'))
@@ -0,0 +1,42 @@
+import random
+import uuid
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from core.caching import bump_generation
+from user.models import User
+
+FIRSTNAMES = ['Ada', 'Amaka', 'Bola', 'Chidi', 'David', 'Emeka', 'Fatima', 'Grace', 'Hassan',
+              'Ifeoma', 'John', 'Kemi', 'Lola', 'Musa', 'Ngozi', 'Olu', 'Peter', 'Sade', 'Tunde', 'Zainab']
+LASTNAMES = ['Adeyemi', 'Bello', 'Chukwu', 'Danjuma', 'Eze', 'Fashola', 'Garba', 'Ibrahim', 'Johnson',
+             'Kalu', 'Lawal', 'Mohammed', 'Nwosu', 'Okafor', 'Okonkwo', 'Oyelaran', 'Smith', 'Usman']
+
+
+class Command(BaseCommand):
+    help = 'Insert verified fake users sharing one password for load tests and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='pAssw0rd!')
+        parser.add_argument('--prefix', default='seed')
+
+    def handle(self, *args, **options):
+        # One hash for everybody, hashing every row would take hours
+        password = make_password(options['password'])
+        batch = uuid.uuid4().hex[:8]
+        # Phones are unique, number them like the emails
+        phone_prefix = f'+2348{int(batch, 16) % 10 ** 5:05d}'
+        created = 0
+        while created < options['count']:
+            size = min(options['batch_size'], options['count'] - created)
+            User.objects.bulk_create([
+                User(email=f'{options["prefix"]}-{batch}-{created + index}@example.com',
+                     password=password, firstname=random.choice(FIRSTNAMES),
+                     lastname=random.choice(LASTNAMES), phone=f'{phone_prefix}{created + index:07d}',
+                     verified=True)
+                for index in range(size)
+            ])
+            created += size
+            self.stdout.write(f'{created} users')
+        bump_generation(User)
+        self.stdout.write(self.style.SUCCESS(f'Created {created} users'))
@@ -1,5 +1,13 @@
+import time
+from datetime import timedelta
+from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
+from django.utils.crypto import get_random_string
 from django.utils.translation import ugettext_lazy as _
+from .hashers import set_password
+from .utils import hash_token
 
 
 class CustomUserManager(BaseUserManager):
@@ -15,7 +23,7 @@ class CustomUserManager(BaseUserManager):
             raise ValueError(_('The Email must be set'))
         email = self.normalize_email(email)
         user = self.model(email=email, **extra_fields)
-        user.set_password(password)
+        set_password(user, password)
         user.save()
         return user
 
@@ -33,3 +41,68 @@ class CustomUserManager(BaseUserManager):
         if extra_fields.get('is_superuser') is not True:
             raise ValueError(_('Superuser must have is_superuser=True.'))
         return self.create_user(email, password, **extra_fields)
+
+
+class TokenManager(models.Manager):
+    """
+    Tokens are stored as a digest of the value sent to the user, so lookups
+    are a single unique index probe and a database leak exposes no usable token.
+    """
+    # Draws of a new value before an IntegrityError is taken for something
+    # other than a collision, like a deleted user
+    create_attempts = 5
+
+    def create_token(self, user, token_type, length=100):
+        """
+        Create a token for the user. The raw value is only available on the
+        returned instance as ``raw``, it is never persisted.
+        """
+        for attempt in range(1, self.create_attempts + 1):
+            raw = get_random_string(length=length)
+            try:
+                with transaction.atomic():
+                    token = self.create(user=user, token_type=token_type,
+                                        token=hash_token(raw))
+            except IntegrityError:
+                # Short tokens can collide with an outstanding one, draw again
+                if attempt == self.create_attempts:
+                    raise
+                continue
+            token.raw = raw
+            return token
+
+    def get_valid(self, raw, token_type):
+        """Unexpired token of the given type matching the raw value, or None"""
+        if not raw:
+            return None
+        cutoff = timezone.now() - timedelta(hours=settings.TOKEN_LIFESPAN)
+        return self.select_related('user').filter(
+            token=hash_token(raw), token_type=token_type, created_at__gt=cutoff).first()
+
+    def delete_expired(self, batch_size=1000, pause=0, on_batch=None):
+        """
+        Delete expired tokens in batches of at most ``batch_size`` rows and
+        return how many were removed.
+
+        Each batch is selected through the (token_type, created_at) index and
+        deleted in its own short transaction, so no long lock is held and a
+        large backlog never becomes one huge DELETE.
+        """
+        cutoff = timezone.now() - timedelta(hours=settings.TOKEN_LIFESPAN)
+        deleted = 0
+        for token_type, _label in self.model._meta.get_field('token_type').choices:
+            expired = self.filter(token_type=token_type, created_at__lte=cutoff)
+            while True:
+                ids = list(expired.order_by('created_at')
+                           .values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                count, _rows = self.filter(pk__in=ids).delete()
+                deleted += count
+                if on_batch:
+                    on_batch(token_type, count, deleted)
+                if len(ids) < batch_size:
+                    break
+                if pause:
+                    time.sleep(pause)
+        return deleted
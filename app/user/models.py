@@ -1,6 +1,7 @@
 
 from django.core.files import File
 from urllib.request import urlretrieve
+import re
 import uuid
 from django.db import models
 from django.core.validators import RegexValidator
@@ -11,7 +12,10 @@ from django.contrib.auth.models import PermissionsMixin
 from django.conf import settings
 from django.urls import reverse
 from django.contrib.postgres.fields import ArrayField
-from .managers import CustomUserManager
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from core.conditional import ConditionalUpdateMixin
+from .managers import CustomUserManager, TokenManager
 from django.core.exceptions import ValidationError
 
 
@@ -38,9 +42,20 @@ def default_role():
 
 phone_regex = RegexValidator(
     regex=r'^\+\d{8,16}$', message="Phone number must be in international format: '+xxx...'.")
+PHONE_SEPARATORS = re.compile(r'[\s().-]')
 
 
-class User(AbstractBaseUser, PermissionsMixin):
+def normalize_phone(value):
+    """'+234 803-123 4567' or '00234...' as '+2348031234567', None if it isn't a phone number"""
+    if not value:
+        return None
+    value = PHONE_SEPARATORS.sub('', value)
+    if value.startswith('00'):
+        value = '+' + value[2:]
+    return value if phone_regex.regex.match(value) else None
+
+
+class User(ConditionalUpdateMixin, AbstractBaseUser, PermissionsMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     email = models.EmailField(
         _('email address'), null=True, blank=True, unique=True)
@@ -48,8 +63,12 @@ class User(AbstractBaseUser, PermissionsMixin):
     firstname = models.CharField(max_length=255, blank=True, null=True)
     lastname = models.CharField(max_length=255, blank=True, null=True)
     image = models.FileField(upload_to='users/', blank=True, null=True)
+    # Filled in by user.images once an upload has been processed
+    image_thumbnail = models.FileField(upload_to='users/', blank=True, null=True, editable=False)
+    image_medium = models.FileField(upload_to='users/', blank=True, null=True, editable=False)
+    image_pending = models.CharField(max_length=255, blank=True, null=True, editable=False)
     phone = models.CharField(
-        validators=[phone_regex], max_length=17, blank=True, null=True)
+        validators=[phone_regex], max_length=17, blank=True, null=True, unique=True)
     roles = ArrayField(models.CharField(max_length=20, blank=True,
                                         choices=USER_ROLE), default=default_role, size=4)
     is_staff = models.BooleanField(default=False)
@@ -57,6 +76,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     date_joined = models.DateTimeField(auto_now_add=True, null=True)
     modified_at = models.DateTimeField(auto_now=True)
     verified = models.BooleanField(default=False)
+    # Maintained by a database trigger, see user.search
+    search_vector = SearchVectorField(null=True, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
@@ -64,20 +85,44 @@ class User(AbstractBaseUser, PermissionsMixin):
     objects = CustomUserManager()
 
     class Meta:
-        ordering = ('-date_joined',)
+        ordering = ('-date_joined', '-id')
+        indexes = [
+            models.Index(fields=['-date_joined', '-id'],
+                         name='user_date_joined_id_idx'),
+            GinIndex(fields=['search_vector'], name='user_search_vector_idx'),
+            GinIndex(fields=['email'], opclasses=['gin_trgm_ops'], name='user_email_trgm_idx'),
+            GinIndex(fields=['phone'], opclasses=['gin_trgm_ops'], name='user_phone_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        # Stored normalized so phone logins are a unique index lookup, and '' isn't a duplicate
+        self.phone = normalize_phone(self.phone) or self.phone or None
+        # Lowercase, as user_email_lower_uniq treats case variants as the same address
+        if self.email:
+            self.email = self.email.lower()
+        super().save(*args, **kwargs)
+
 
 class Token(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
-    token = models.CharField(max_length=255)
+    # hex digest of the value sent to the user, see TokenManager
+    token = models.CharField(max_length=64, unique=True)
     token_type = models.CharField(
         max_length=100, choices=TOKEN_TYPE, default='ACCOUNT_VERIFICATION')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TokenManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token_type', 'created_at'],
+                         name='token_type_created_at_idx'),
+        ]
+
     def __str__(self):
         return self.token
 
@@ -0,0 +1,106 @@
+"""
+Indexed user search on PostgreSQL.
+
+``User.search_vector`` is kept up to date by a trigger, so every write path
+(``save()``, ``update()``, ``bulk_create()``, raw SQL) refreshes it. Whole
+words and prefixes are matched against it through a GIN index and ranked;
+partial matches inside emails and phone numbers use trigram GIN indexes on
+those columns. Other databases keep DRF's ``SearchFilter``.
+"""
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import BooleanField, F, Func, Q, Value
+from rest_framework.filters import SearchFilter
+
+SEARCH_CONFIG = 'simple'
+# pg_trgm can't use the index for patterns shorter than a trigram
+TRIGRAM_MIN_LENGTH = 3
+
+SEARCH_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('{config}', coalesce(NEW.firstname, '')), 'A') ||
+        setweight(to_tsvector('{config}', coalesce(NEW.lastname, '')), 'A') ||
+        setweight(to_tsvector('{config}', coalesce(NEW.email, '')), 'B') ||
+        setweight(to_tsvector('{config}', coalesce(NEW.phone, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table};
+CREATE TRIGGER {table}_search_vector_trigger BEFORE INSERT OR UPDATE ON {table}
+    FOR EACH ROW EXECUTE PROCEDURE {table}_search_vector_update();
+"""
+
+
+class TrigramContains(Func):
+    """``column ILIKE '%text%'``, a bare ``ILIKE`` which a ``gin_trgm_ops`` index can serve
+
+    Built per query rather than registered as a lookup, so no other field gets it.
+    """
+    arg_joiner = ' ILIKE '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+    def __init__(self, column, text, connection):
+        super().__init__(F(column), Value('%%%s%%' % connection.ops.prep_for_like_query(text)))
+
+
+def create_trigram_extension(using='default', **kwargs):
+    """pre_migrate receiver, the trigram indexes need pg_trgm"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+def install_search_trigger(using='default', apps=None, **kwargs):
+    """post_migrate receiver creating the trigger that maintains ``search_vector``"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or apps is None:
+        return
+    try:
+        User = apps.get_model('user', 'User')
+    except LookupError:
+        return
+    table = User._meta.db_table
+    if table not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_TRIGGER_SQL.format(table=table, config=SEARCH_CONFIG))
+
+
+def prefix_query(terms):
+    """A tsquery matching every term as a word prefix, ``'ann':* & 'lee':*``"""
+    words = [word for term in terms for word in re.findall(r'[\w@.+-]+', term)]
+    if not words:
+        return None
+    raw = ' & '.join("'%s':*" % word.replace("'", "''") for word in words)
+    return SearchQuery(raw, config=SEARCH_CONFIG, search_type='raw')
+
+
+class UserSearchFilter(SearchFilter):
+    """``?search=`` ranked by full-text relevance, ``SearchFilter`` off PostgreSQL"""
+
+    def filter_queryset(self, request, queryset, view):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        query = prefix_query(terms)
+        if query is None:
+            return queryset.none()
+        condition = Q(search_vector=query)
+        text = ' '.join(terms)
+        if len(text) >= TRIGRAM_MIN_LENGTH:
+            queryset = queryset.annotate(
+                email_match=TrigramContains('email', text, connection),
+                phone_match=TrigramContains('phone', text, connection))
+            condition |= Q(email_match=True) | Q(phone_match=True)
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return queryset.filter(condition).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', *ordering)
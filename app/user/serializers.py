@@ -6,52 +6,142 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers, exceptions
 from django.utils.crypto import get_random_string
-from django.db import IntegrityError
+from django.db import IntegrityError, connection, transaction
 from django.db.models import Q
 from django.core.exceptions import PermissionDenied
 from datetime import date
 from dateutil.relativedelta import relativedelta
 from email_validator import validate_email, EmailNotValidError
-from .models import Token
+from core.serializers import TimedSerializerMixin
+from .models import Token, normalize_phone, phone_regex
+from .hashers import set_password
+from .tasks import send_registration_email, process_profile_image
+from .images import discard_upload, stage_upload
+from .backends import EMAIL_LOWER_INDEX
 
 
-class ListUserSerializer(serializers.ModelSerializer):
+class ListUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['id', 'firstname', 'lastname', 'email', 'role', 'image']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for user object"""
 
+    # Upload only, payloads carry the resized variants
+    image = serializers.ImageField(write_only=True, required=False)
+
     class Meta:
         model = get_user_model()
         fields = ('id', 'email', 'password', 'firstname', 'lastname',
-                  'phone', 'image', 'roles', 'date_joined')
+                  'phone', 'image', 'image_thumbnail', 'image_medium', 'roles', 'date_joined')
+        # No UniqueValidator queries, the unique constraints decide
         extra_kwargs = {'password': {'write_only': True, 'min_length': 8},
-                        'date_joined': {'read_only': True}}
+                        'date_joined': {'read_only': True},
+                        'email': {'validators': []},
+                        'phone': {'validators': [phone_regex]}}
 
     def validate(self, attrs):
-        email = attrs['email'].lower().strip()
-        if get_user_model().objects.filter(email=email).exists():
-            raise serializers.ValidationError('Email already exists')
-        try:
-            valid = validate_email(attrs['email'])
-            attrs['email'] = valid.email
-            return super().validate(attrs)
-        except EmailNotValidError as e:
-            raise serializers.ValidationError(e)
+        # Uniqueness is left to the database constraints, see save_user()
+        if 'email' in attrs:
+            try:
+                # Syntax and normalization only, deliverability checks mean DNS lookups.
+                # Lowercased whole, like the importer, so case variants are duplicates
+                attrs['email'] = validate_email(attrs['email'], check_deliverability=False).email.lower()
+            except EmailNotValidError as e:
+                raise serializers.ValidationError({'email': [str(e)]})
+        return super().validate(attrs)
 
     def create(self, validated_data):
-        return self.Meta.model.objects.create_user(**validated_data)
+        upload = validated_data.pop('image', None)
+        if upload:
+            validated_data['image_pending'] = stage_upload(upload)
+
+        def create_user():
+            user = self.Meta.model.objects.create_user(**validated_data)
+            schedule_image_processing(user)
+            if not user.verified:
+                token = Token.objects.create_token(user, 'ACCOUNT_VERIFICATION', length=100)
+                email_data = {'fullname': user.firstname, 'email': user.email, 'token': token.raw}
+                # Only once the user really exists, and without waiting on the broker
+                transaction.on_commit(lambda: send_registration_email.delay(email_data))
+            return user
+        return save_user(create_user, validated_data.get('image_pending'), validated_data)
 
     def update(self, instance, validated_data):
-        user = self.context['request'].user
-        instance = super().update(instance, validated_data)
-        if validated_data.get('password', False):
-            instance.set_password(validated_data.get('password'))
-            instance.save()
-        return instance
+        password = validated_data.pop('password', None)
+        if password:
+            set_password(instance, password)
+        upload = validated_data.pop('image', None)
+        if upload:
+            validated_data['image_pending'] = stage_upload(upload)
+
+        def update_user():
+            user = super(UserSerializer, self).update(instance, validated_data)
+            if upload:
+                schedule_image_processing(user)
+            return user
+        return save_user(update_user, validated_data.get('image_pending'), validated_data, instance.pk)
+
+
+def schedule_image_processing(user):
+    if user.image_pending:
+        name, user_id = user.image_pending, str(user.pk)
+        transaction.on_commit(lambda: process_profile_image.delay(user_id, name))
+
+
+def save_user(save, staged_image=None, values=None, pk=None):
+    """
+    Run ``save`` in a savepoint, turning unique violations into validation
+    errors. ``staged_image``, the upload the user would point at, is deleted
+    if the save fails. ``values`` are the fields being saved to the user
+    ``pk``, for backends that don't name the violated constraint.
+    """
+    try:
+        with transaction.atomic():
+            return save()
+    except Exception as e:
+        if staged_image:
+            discard_upload(staged_image)
+        name = duplicate_field(e, values or {}, pk) if isinstance(e, IntegrityError) else None
+        if name in ('email', 'phone'):
+            raise serializers.ValidationError({name: [f'{name.capitalize()} already exists']})
+        raise
+
+
+def violated_constraint(error):
+    """Name of the constraint ``error`` violated, None unless psycopg2 tells"""
+    return getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None)
+
+
+def duplicate_field(error, values, pk=None):
+    """
+    The user column of the unique constraint ``error`` violated, found by the
+    constraint's name: the message is localized and backend specific. Other
+    backends look up which of ``values`` another user already holds.
+    """
+    constraint = violated_constraint(error)
+    if not constraint:
+        return held_field(values, pk)
+    if constraint == EMAIL_LOWER_INDEX:
+        return 'email'
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, get_user_model()._meta.db_table)
+    columns = constraints.get(constraint, {}).get('columns') or []
+    return columns[0] if len(columns) == 1 else None
+
+
+def held_field(values, pk=None):
+    """'email' or 'phone' when a user other than ``pk`` already has that value"""
+    users = get_user_model()._default_manager.exclude(pk=pk)
+    if values.get('email') and users.filter(email__iexact=values['email']).exists():
+        return 'email'
+    phone = values.get('phone')
+    if phone and users.filter(phone=normalize_phone(phone) or phone).exists():
+        return 'phone'
+    return None
 
 
 class CustomObtainTokenPairSerializer(TokenObtainPairSerializer):
@@ -67,8 +157,6 @@ class CustomObtainTokenPairSerializer(TokenObtainPairSerializer):
         token['email'] = user.email
         token['roles'] = user.roles
         token['fullname'] = user.firstname + ' ' + user.lastname
-        if user.image:
-            token['image'] = user.image.url
         token['phone'] = user.phone
         return token
 
@@ -87,7 +175,7 @@ class AuthTokenSerializer(serializers.Serializer):
         if email:
             user = authenticate(
                 request=self.context.get('request'),
-                username=email.lower().strip(),
+                username=email,
                 password=password
             )
 
@@ -108,10 +196,9 @@ class PasswordResetSerializer(serializers.Serializer):
         if not user:
             msg = _('Invalid email provided')
             raise serializers.ValidationError(msg, code='authentication')
-        token = Token.objects.create(
-            user=user, type='PASSWORD_RESET', token=get_random_string(length=6))
+        token = Token.objects.create_token(user, 'PASSWORD_RESET', length=6)
         email_data = {'fullname': user.firstname, 'email': user.email,
-                      'token': token.token}
+                      'token': token.raw}
         # send_password_reset_email.delay(email_data)
         return token
 
@@ -122,7 +209,7 @@ class PasswordResetVerifySerializer(serializers.Serializer):
 
     def create(self, validated_data):
         token = validated_data.get('token', None)
-        token_data = Token.objects.filter(token=token).first()
+        token_data = Token.objects.get_valid(token, 'PASSWORD_RESET')
         if not token_data:
             msg = _('Invalid token provided')
             raise serializers.ValidationError(msg, code='authentication')
@@ -137,11 +224,11 @@ class PasswordResetChangeSerializer(serializers.Serializer):
     def create(self, validated_data):
         token = validated_data.get('token', None)
         new_password = validated_data.get('new_password', None)
-        token_data = Token.objects.filter(token=token).first()
+        token_data = Token.objects.get_valid(token, 'PASSWORD_RESET')
         if not token_data:
             msg = _('Invalid token provided')
             raise serializers.ValidationError(msg, code='authentication')
-        token_data.user.set_password(new_password)
+        set_password(token_data.user, new_password)
         token_data.user.save()
         token_data.delete()
         return token_data
@@ -1,38 +1,97 @@
+import logging
 from celery import shared_task
-from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.template.loader import get_template
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.management import call_command
-from .utils import send_email
+from .models import Token
+from .mail import EMAIL_FLUSH_DELAY, claim_flush, drain_outbox, queue_email, release_flush
+from .hashers import get_executor
+from .importer import read_rows, import_users
+from .images import build_profile_images
+
+logger = logging.getLogger(__name__)
+
+
+def queue_and_flush(subject, template, email_data):
+    """Queue an email, scheduling a flush unless one is already scheduled"""
+    queue_email(subject, email_data['email'], template, email_data)
+    if claim_flush():
+        flush_email_outbox.apply_async(countdown=EMAIL_FLUSH_DELAY)
 
 
 @shared_task
 def send_new_user_email(email_data):
-    html_template = get_template('emails/new_user_welcome_template.html')
-    text_template = get_template('emails/new_user_welcome_template.txt')
-    html_alternative = html_template.render(email_data)
-    text_alternative = text_template.render(email_data)
-    send_email('Password Reset',
-               email_data['email'], html_alternative, text_alternative)
+    queue_and_flush('Welcome', 'emails/new_user_welcome_template', email_data)
 
 
 @shared_task
 def send_registration_email(email_data):
-    html_template = get_template(
-        'emails/account_verification_template.html')
-    text_template = get_template(
-        'emails/account_verification_template.txt')
-    html_alternative = html_template.render(email_data)
-    text_alternative = text_template.render(email_data)
-    send_email('Account Verification',
-               email_data['email'], html_alternative, text_alternative)
+    queue_and_flush('Account Verification', 'emails/account_verification_template', email_data)
 
 
 @shared_task
 def send_password_reset_email(email_data):
-    html_template = get_template('emails/password_reset_template.html')
-    text_template = get_template('emails/password_reset_template.txt')
-    html_alternative = html_template.render(email_data)
-    text_alternative = text_template.render(email_data)
-    send_email('Password Reset',
-               email_data['email'], html_alternative, text_alternative)
+    queue_and_flush('Password Reset', 'emails/password_reset_template', email_data)
+
+
+@shared_task
+def process_profile_image(user_id, name):
+    """Resize a staged profile image upload and push it to storage"""
+    build_profile_images(user_id, name)
+
+
+@shared_task
+def flush_email_outbox():
+    """
+    Send the outbox in batches of ``EMAIL_BATCH_SIZE``. Scheduled by queued
+    emails, and by beat as a safety net for emails a failed drain left behind
+    """
+    release_flush()
+    return drain_outbox()
+
+
+@shared_task
+def delete_expired_tokens(batch_size=None):
+    """Periodically remove expired verification and password reset tokens"""
+    batch_size = batch_size or settings.TOKEN_REAPER_BATCH_SIZE
+    deleted = Token.objects.delete_expired(batch_size=batch_size)
+    logger.info('Deleted %s expired tokens', deleted)
+    return deleted
+
+
+IMPORT_STATUS_TTL = 60 * 60 * 24
+IMPORT_MAX_REJECTS = 100  # rejects kept in the job status, the rest are only counted
+
+
+def import_status_key(job_id):
+    return f'user-import:{job_id}'
+
+
+@shared_task
+def import_users_file(name, fmt, job_id):
+    """Import users from an uploaded file in storage, publishing progress per chunk"""
+    status = {'state': 'running', 'chunks': 0, 'created': 0, 'rejected': 0, 'rejects': []}
+    cache.set(import_status_key(job_id), status, IMPORT_STATUS_TTL)
+
+    def report(number, created, rejects):
+        status['chunks'] = number
+        status['created'] += created
+        status['rejected'] += len(rejects)
+        status['rejects'].extend(rejects[:IMPORT_MAX_REJECTS - len(status['rejects'])])
+        cache.set(import_status_key(job_id), status, IMPORT_STATUS_TTL)
+
+    try:
+        with default_storage.open(name, 'rb') as stream:
+            # Prefork celery workers can't start child processes, so hashing
+            # uses the thread pool; PBKDF2 releases the GIL and scales the same
+            import_users(read_rows(stream, fmt), get_executor(),
+                         chunk_size=settings.USER_IMPORT_CHUNK_SIZE, on_chunk=report)
+        status['state'] = 'done'
+    except Exception as e:
+        logger.exception('User import %s failed', job_id)
+        status.update(state='failed', error=str(e))
+    finally:
+        cache.set(import_status_key(job_id), status, IMPORT_STATUS_TTL)
+        default_storage.delete(name)
+    return status['created']
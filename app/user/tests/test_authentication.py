@@ -0,0 +1,47 @@
+from django.test import TestCase, RequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+from user.authentication import CachedJWTAuthentication, user_cache
+from user.models import User
+
+
+class CachedJWTAuthenticationTest(TestCase):
+    """Test module for the user cache behind JWT authentication"""
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user('user@example.com', 'pAssw0rd!')
+        self.request = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.authentication = CachedJWTAuthentication()
+
+    def test_cached_user_needs_no_query(self):
+        with self.assertNumQueries(1):
+            self.authentication.authenticate(self.request)
+        with self.assertNumQueries(0):
+            user, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(user, self.user)
+
+    def test_save_evicts_user(self):
+        self.authentication.authenticate(self.request)
+        self.user.firstname = 'Changed'
+        self.user.save()
+        with self.assertNumQueries(1):
+            user, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(user.firstname, 'Changed')
+
+    def test_deactivated_user_is_rejected(self):
+        self.authentication.authenticate(self.request)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate(self.request)
+
+    def test_requests_share_no_mutable_state(self):
+        user, _ = self.authentication.authenticate(self.request)
+        user.roles.append('ADMIN')
+        user._state.adding = True
+        with self.assertNumQueries(0):
+            cached, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(cached.roles, ['CANDIDATE'])
+        self.assertFalse(cached._state.adding)
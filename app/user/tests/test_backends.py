@@ -0,0 +1,90 @@
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import authenticate
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from user.models import User, normalize_phone
+
+PASSWORD = 'pAssw0rd!'
+
+
+class IdentifierBackendTest(TestCase):
+    """Test module for logging in with an email or a phone number"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('Ada.Okafor@example.com', PASSWORD, phone='+2348031234567',
+                                             firstname='Ada', lastname='Okafor', verified=True)
+
+    def test_email_in_any_case(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username='ADA.OKAFOR@EXAMPLE.COM', password=PASSWORD), self.user)
+        self.assertIsNone(authenticate(username='ada.okafor@example.com', password='wrong'))
+
+    def test_case_variant_of_an_email_is_rejected(self):
+        self.assertEqual(self.user.email, 'ada.okafor@example.com')
+        response = APIClient().post(reverse('user:signup'), {
+            'email': 'ADA.Okafor@example.com', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'email': ['Email already exists']})
+        # Writes that skip save() hit the unique index
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.bulk_create([User(email='Ada.Okafor@Example.com')])
+        self.assertEqual(authenticate(username='ada.okafor@example.com', password=PASSWORD), self.user)
+
+    def test_phone_in_any_format(self):
+        for phone in ('+2348031234567', '+234 803 123 4567', '00234-803-123-4567'):
+            with self.assertNumQueries(1):
+                self.assertEqual(authenticate(username=phone, password=PASSWORD), self.user)
+
+    def test_unknown_user_still_hashes(self):
+        with mock.patch('user.backends.make_password') as make_password:
+            self.assertIsNone(authenticate(username='nobody@example.com', password=PASSWORD))
+            self.assertIsNone(authenticate(username='+2340000000000', password=PASSWORD))
+        self.assertEqual(make_password.call_count, 2)
+
+    def test_phone_is_stored_normalized(self):
+        self.assertEqual(normalize_phone('(+234) 803.123.4567'), '+2348031234567')
+        self.assertIsNone(normalize_phone('ada@example.com'))
+        blank = User.objects.create_user('blank@example.com', PASSWORD, phone='')
+        self.assertIsNone(blank.phone)
+
+    def test_clean_user_identifiers(self):
+        User.objects.filter(pk=self.user.pk).update(last_login=timezone.now())
+        # Rows written before phones were normalized on save
+        blank, spaced, foreign = User.objects.bulk_create([
+            User(email='Blank@Example.com', phone=''),
+            User(email='spaced@example.com', phone='+234 803 123 4567'),
+            User(email='foreign@example.com', phone='(0044) 20 7946 0000'),
+        ])
+        out = StringIO()
+        call_command('clean_user_identifiers', '--dry-run', stdout=out)
+        self.assertIn(f'Phone +2348031234567 is shared by users {self.user.pk}, {spaced.pk}', out.getvalue())
+        self.assertIn('1 blank phones to clear, 1 phones to normalize, 0 shared phones to clear, '
+                      '1 emails to lowercase', out.getvalue())
+        self.assertEqual(User.objects.get(pk=blank.pk).phone, '')
+
+        call_command('clean_user_identifiers', stdout=StringIO())
+        self.assertEqual(User.objects.get(pk=blank.pk).phone, None)
+        self.assertEqual(User.objects.get(pk=blank.pk).email, 'blank@example.com')
+        self.assertEqual(User.objects.get(pk=foreign.pk).phone, '+442079460000')
+        # Shared numbers are only reported unless asked
+        self.assertEqual(User.objects.get(pk=spaced.pk).phone, '+234 803 123 4567')
+
+        call_command('clean_user_identifiers', '--clear-shared-phones', stdout=StringIO())
+        # The most recently active user keeps a shared number
+        self.assertEqual(User.objects.get(pk=self.user.pk).phone, '+2348031234567')
+        self.assertEqual(User.objects.get(pk=spaced.pk).phone, None)
+        self.assertEqual(authenticate(username='+234 803 123 4567', password=PASSWORD), self.user)
+
+    def test_token_by_phone_without_image_url(self):
+        self.user.image.name = 'users/ada.png'
+        self.user.save()
+        with mock.patch('django.core.files.storage.FileSystemStorage.url') as url:
+            response = APIClient().post(reverse('user:login'), {'email': '+234 803 123 4567', 'password': PASSWORD})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertIn('access', response.data)
+        url.assert_not_called()
@@ -0,0 +1,29 @@
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2SHA1PasswordHasher
+from django.test import TestCase, override_settings
+from user.models import User
+
+PASSWORD = 'pAssw0rd!'
+
+
+@override_settings(PASSWORD_HASHERS=['user.hashers.ConfigurablePBKDF2PasswordHasher',
+                                     'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher'])
+class PooledHashingTest(TestCase):
+    """Test module for pooled password hashing and rehash on login"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('user@example.com', PASSWORD)
+
+    def test_new_passwords_use_preferred_hasher(self):
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(authenticate(username='user@example.com', password=PASSWORD), self.user)
+        self.assertIsNone(authenticate(username='user@example.com', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody@example.com', password=PASSWORD))
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        User.objects.filter(pk=self.user.pk).update(
+            password=PBKDF2SHA1PasswordHasher().encode(PASSWORD, 'salt', 1000))
+        self.assertEqual(authenticate(username='user@example.com', password=PASSWORD), self.user)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(self.user.check_password(PASSWORD))
@@ -0,0 +1,111 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from user.images import build_profile_images, get_staging_storage
+from user.models import User
+
+STORAGE_ROOT = tempfile.mkdtemp()
+
+
+def image_upload(width=1000, height=600, name='me.jpg'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+                   MEDIA_ROOT=os.path.join(STORAGE_ROOT, 'media'),
+                   IMAGE_STAGING_ROOT=os.path.join(STORAGE_ROOT, 'staging'))
+class ProfileImageTest(TestCase):
+    """Test module for the asynchronous profile image pipeline"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(STORAGE_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user('image@example.com', 'pAssw0rd!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('user:user-detail', kwargs={'pk': self.user.pk})
+
+    def upload(self):
+        with mock.patch('user.serializers.process_profile_image.delay') as delay:
+            response = self.client.patch(self.url, {'image': image_upload()}, format='multipart')
+            callbacks, connection.run_on_commit = connection.run_on_commit, []
+            for _, callback in callbacks:
+                callback()
+        self.assertEqual(response.status_code, 200, response.data)
+        delay.assert_called_once()
+        return delay.call_args[0]
+
+    def test_upload_is_only_staged(self):
+        user_id, name = self.upload()
+        self.user.refresh_from_db()
+        self.assertEqual((user_id, self.user.image_pending), (str(self.user.pk), name))
+        self.assertTrue(get_staging_storage().exists(name))
+        self.assertFalse(self.user.image)
+
+    def test_variants_are_built_and_exposed(self):
+        user_id, name = self.upload()
+        build_profile_images(user_id, name)
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.image_pending)
+        self.assertFalse(get_staging_storage().exists(name))
+        with Image.open(self.user.image_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (96, 96))
+        with Image.open(self.user.image_medium.path) as medium:
+            self.assertEqual(medium.size, (512, 307))
+        data = self.client.get(self.url).data
+        self.assertTrue(data['image_thumbnail'].endswith(self.user.image_thumbnail.name))
+        self.assertNotIn('image', data)
+
+    def test_superseded_upload_is_discarded(self):
+        user_id, first = self.upload()
+        _, second = self.upload()
+        build_profile_images(user_id, first)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.image)
+        self.assertEqual(self.user.image_pending, second)
+        build_profile_images(user_id, second)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.image_medium)
+        self.assertEqual(len(os.listdir(os.path.join(STORAGE_ROOT, 'media', 'users'))), 3)
+
+    def test_rejects_non_images(self):
+        upload = SimpleUploadedFile('me.jpg', b'not an image', content_type='image/jpeg')
+        response = self.client.patch(self.url, {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch('PIL.Image.MAX_IMAGE_PIXELS', 100000)
+    def test_rejects_decompression_bombs(self):
+        # Over twice the pixel limit, Pillow refuses to open it
+        response = self.client.patch(self.url, {'image': image_upload()}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+        # Past validation, e.g. staged before the limit went down, the task drops it
+        staged = get_staging_storage().save('users/bomb.jpg', image_upload())
+        User.objects.filter(pk=self.user.pk).update(image_pending=staged)
+        self.assertIsNone(build_profile_images(str(self.user.pk), staged))
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.image_pending)
+        self.assertFalse(get_staging_storage().exists(staged))
+
+    def test_failed_save_discards_the_staged_upload(self):
+        User.objects.create_user('taken@example.com', 'pAssw0rd!')
+        staging = os.path.join(STORAGE_ROOT, 'staging', 'users')
+        os.makedirs(staging, exist_ok=True)
+        staged = set(os.listdir(staging))
+        response = self.client.patch(self.url, {'image': image_upload(), 'email': 'taken@example.com'},
+                                     format='multipart')
+        self.assertEqual(response.data, {'email': ['Email already exists']})
+        self.assertEqual(set(os.listdir(staging)), staged)
@@ -0,0 +1,61 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from django.test import TestCase
+from user.importer import read_rows, import_users
+from user.models import User
+
+CSV = b"""email,password,firstname,lastname,phone
+first@example.com,pAssw0rd!,First,User,+2348012345678
+not-an-email,pAssw0rd!,Bad,Email,
+existing@example.com,pAssw0rd!,Already,There,
+second@example.com,,Second,User,
+first@example.com,pAssw0rd!,Again,First,
+short@example.com,short,Short,Password,
+"""
+
+
+class ImportUsersTest(TestCase):
+    """Test module for the bulk user importer"""
+
+    def setUp(self):
+        User.objects.create_user('existing@example.com', 'pAssw0rd!')
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_csv_import(self):
+        chunks = []
+        created, rejected = import_users(
+            read_rows(io.BytesIO(CSV), 'csv'), self.executor, chunk_size=4,
+            on_chunk=lambda number, count, rejects: chunks.append((number, count, rejects)))
+        self.assertEqual((created, rejected), (2, 4))
+        self.assertEqual([chunk[:2] for chunk in chunks], [(1, 2), (2, 0)])
+        self.assertEqual([reject['row'] for chunk in chunks for reject in chunk[2]], [2, 3, 5, 6])
+        self.assertTrue(User.objects.get(email='first@example.com').check_password('pAssw0rd!'))
+        self.assertFalse(User.objects.get(email='second@example.com').has_usable_password())
+
+    def test_jsonl_import(self):
+        data = b'{"email": "JSON@example.com", "password": "pAssw0rd!"}\nnot json\n'
+        created, rejected = import_users(read_rows(io.BytesIO(data), 'jsonl'), self.executor)
+        self.assertEqual((created, rejected), (1, 1))
+        self.assertTrue(User.objects.filter(email='json@example.com').exists())
+
+    def test_chunk_costs_constant_queries(self):
+        rows = [{'email': f'user{index}@example.com'} for index in range(50)]
+        # Existing users, the INSERT, the inserted ids
+        with self.assertNumQueries(3):
+            import_users(rows, self.executor, chunk_size=50)
+
+    def test_rows_lost_to_a_concurrent_signup_are_not_counted(self):
+        class RacingExecutor:
+            """Signs the user up while the import hashes its passwords"""
+
+            def map(self, fn, items, chunksize=1):
+                User.objects.create_user('racer@example.com', 'pAssw0rd!')
+                return map(fn, items)
+
+        rows = [{'email': 'racer@example.com'}, {'email': 'other@example.com'}]
+        created, rejected = import_users(rows, RacingExecutor())
+        self.assertEqual((created, rejected), (1, 1))
+        self.assertEqual(User.objects.filter(email__in=['racer@example.com', 'other@example.com']).count(), 2)
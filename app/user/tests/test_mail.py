@@ -0,0 +1,79 @@
+import smtplib
+import subprocess
+import sys
+from unittest import mock
+from django.conf import settings
+from django.core import mail as django_mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase
+from user import mail, tasks
+
+CONTEXT = {'fullname': 'Test', 'email': 'user@example.com', 'token': 'abc123'}
+
+
+class FlakyBackend(EmailBackend):
+    """Locmem backend whose first send finds the connection dropped"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = self.closed = 0
+        self.dropped = False
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        self.closed += 1
+
+    def send_messages(self, messages):
+        if not self.dropped:
+            self.dropped = True
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+class MailTest(TestCase):
+    """Test module for batched email delivery"""
+
+    def test_templates_are_compiled_once(self):
+        mail.get_cached_template.cache_clear()
+        for _ in range(3):
+            mail.build_message('Password Reset', 'user@example.com',
+                               'emails/password_reset_template', CONTEXT)
+        self.assertEqual(mail.get_cached_template.cache_info().misses, 2)
+
+    def test_batch_is_sent_over_one_connection(self):
+        messages = [mail.build_message('Password Reset', 'user@example.com',
+                                       'emails/password_reset_template', CONTEXT)
+                    for _ in range(3)]
+        self.assertEqual(mail.send_messages(messages), 3)
+        self.assertEqual(len(django_mail.outbox), 3)
+        self.assertEqual(django_mail.outbox[0].alternatives[0][1], 'text/html')
+
+    def test_dropped_connection_reconnects(self):
+        connection = FlakyBackend()
+        message = mail.build_message('Password Reset', 'user@example.com',
+                                     'emails/password_reset_template', CONTEXT)
+        self.assertEqual(mail.send_messages([message], connection=connection), 1)
+        self.assertEqual((connection.opened, connection.closed), (2, 1))
+        self.assertEqual(len(django_mail.outbox), 1)
+
+    def test_queued_emails_share_one_flush(self):
+        with mock.patch('user.tasks.queue_email') as queue, \
+                mock.patch('user.tasks.claim_flush', side_effect=[True, False, False]), \
+                mock.patch('user.tasks.flush_email_outbox.apply_async') as schedule, \
+                mock.patch('user.tasks.drain_outbox') as drain:
+            for _ in range(3):
+                tasks.send_password_reset_email(CONTEXT)
+        self.assertEqual(queue.call_count, 3)
+        schedule.assert_called_once_with(countdown=mail.EMAIL_FLUSH_DELAY)
+        drain.assert_not_called()
+
+    def test_web_processes_queue_through_the_project_app(self):
+        # A fresh process that only sets Django up, like gunicorn. With Celery's default app
+        # the tasks would go to an AMQP broker that isn't there, and retry forever
+        script = ('import django; django.setup(); from user.tasks import send_registration_email as t; '
+                  'print(t.app.main, t.app.conf.broker_url)')
+        output = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True,
+                                text=True, cwd=settings.BASE_DIR).stdout.split()
+        self.assertEqual(output, ['core', settings.CELERY_BROKER_URL])
@@ -0,0 +1,51 @@
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import timezone
+from user.models import User, Token
+
+
+class TokenTest(TestCase):
+    """Test module for Token Model"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('user@example.com', 'pAssw0rd!')
+
+    def test_only_digest_is_stored(self):
+        token = Token.objects.create_token(self.user, 'PASSWORD_RESET', length=6)
+        self.assertEqual(len(token.raw), 6)
+        self.assertEqual(len(Token.objects.get(pk=token.pk).token), 64)
+        self.assertFalse(Token.objects.filter(token=token.raw).exists())
+
+    def test_create_gives_up_on_other_integrity_errors(self):
+        with mock.patch('user.managers.TokenManager.create', side_effect=IntegrityError) as create:
+            with self.assertRaises(IntegrityError):
+                Token.objects.create_token(self.user, 'PASSWORD_RESET')
+        self.assertEqual(create.call_count, Token.objects.create_attempts)
+
+    def test_get_valid_checks_type(self):
+        token = Token.objects.create_token(self.user, 'ACCOUNT_VERIFICATION')
+        self.assertEqual(Token.objects.get_valid(token.raw, 'ACCOUNT_VERIFICATION'), token)
+        self.assertIsNone(Token.objects.get_valid(token.raw, 'PASSWORD_RESET'))
+        self.assertIsNone(Token.objects.get_valid('not-a-token', 'ACCOUNT_VERIFICATION'))
+
+    def test_get_valid_checks_expiry(self):
+        token = Token.objects.create_token(self.user, 'PASSWORD_RESET')
+        Token.objects.filter(pk=token.pk).update(
+            created_at=timezone.now() - timedelta(hours=settings.TOKEN_LIFESPAN, seconds=1))
+        self.assertIsNone(Token.objects.get_valid(token.raw, 'PASSWORD_RESET'))
+
+    def test_delete_expired_in_batches(self):
+        expired = timezone.now() - timedelta(hours=settings.TOKEN_LIFESPAN, seconds=1)
+        for _ in range(5):
+            token = Token.objects.create_token(self.user, 'PASSWORD_RESET')
+            Token.objects.filter(pk=token.pk).update(created_at=expired)
+        fresh = Token.objects.create_token(self.user, 'PASSWORD_RESET')
+        batches = []
+        deleted = Token.objects.delete_expired(
+            batch_size=2, on_batch=lambda token_type, count, total: batches.append(count))
+        self.assertEqual(deleted, 5)
+        self.assertEqual(batches, [2, 2, 1])
+        self.assertEqual(list(Token.objects.all()), [fresh])
@@ -0,0 +1,242 @@
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from django.db import connection
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+from core.testing import QueryBudgetMixin
+from user.models import User, Token
+
+client = Client()
+
+
+def create_user(email, password='pAssw0rd!', **kwargs):
+    return User.objects.create_user(email, password, **kwargs)
+
+
+class UserListPaginationTest(QueryBudgetMixin, TestCase):
+    """Test module for the cursor paginated user list"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [create_user(f'user{index}@example.com') for index in range(5)]
+
+    def test_walks_every_user_once_in_order(self):
+        url = reverse('user:user-user-list') + '?page_size=2'
+        seen = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['links']['next']
+        expected = [str(user.id) for user in User.objects.order_by('-date_joined', '-id')]
+        self.assertEqual(seen, expected)
+
+    def test_walks_users_without_date_joined(self):
+        undated = self.users[2]
+        User.objects.filter(pk=undated.pk).update(date_joined=None)
+        url = reverse('user:user-user-list') + '?page_size=1'
+        seen = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['links']['next']
+        # NULL sorts first in a descending ordering
+        expected = [str(undated.id)] + [str(user.id) for user in User.objects.exclude(
+            pk=undated.pk).order_by('-date_joined', '-id')]
+        self.assertEqual(seen, expected)
+        # And back again from the last page
+        url = response.data['links']['previous']
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.pop()
+            self.assertEqual(seen[-1], response.data['results'][0]['id'])
+            url = response.data['links']['previous']
+        self.assertEqual(seen, [str(undated.id)])
+
+    def test_previous_link_returns_prior_page(self):
+        first = client.get(reverse('user:user-user-list') + '?page_size=2')
+        self.assertIsNone(first.data['links']['previous'])
+        second = client.get(first.data['links']['next'])
+        back = client.get(second.data['links']['previous'])
+        self.assertEqual([item['id'] for item in back.data['results']],
+                         [item['id'] for item in first.data['results']])
+
+    def test_page_size_is_bounded(self):
+        response = client.get(reverse('user:user-user-list') + '?page_size=100000')
+        self.assertEqual(response.data['page_size'], 100)
+
+    def test_invalid_cursor(self):
+        response = client.get(reverse('user:user-user-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_query_budget(self):
+        url = reverse('user:user-user-list') + '?page_size=100'
+        with self.assertQueryBudget(1):
+            client.get(url)
+        # Served from the cache
+        with self.assertQueryBudget(0):
+            client.get(url)
+
+    def test_cached_links_keep_only_pagination_params(self):
+        path = reverse('user:user-user-list')
+        response = client.get(path + '?page_size=2&utm_source=mail')
+        link = urlsplit(response.data['links']['next'])
+        self.assertEqual((link.scheme, link.path), ('http', path))
+        self.assertEqual(sorted(parse_qs(link.query)), ['cursor', 'page_size'])
+        # The same page over https gets links of its own
+        response = client.get(path + '?page_size=2', secure=True)
+        self.assertEqual(urlsplit(response.data['links']['next']).scheme, 'https')
+
+    def test_new_user_invalidates_cached_pages(self):
+        url = reverse('user:user-user-list') + '?page_size=2'
+        client.get(url)
+        newest = create_user('newest@example.com')
+        response = client.get(url)
+        self.assertEqual(response.data['results'][0]['id'], str(newest.id))
+
+
+class UserConditionalRequestTest(TestCase):
+    """Test module for ETags on the user detail endpoint"""
+
+    def setUp(self):
+        self.user = create_user('etag@example.com')
+        self.url = reverse('user:user-detail', kwargs={'pk': self.user.pk})
+
+    def test_if_none_match_returns_304(self):
+        etag = client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.user.save()
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_match_on_patch(self):
+        user_client = Client()
+        user_client.force_login(self.user)
+        etag = user_client.get(self.url)['ETag']
+        response = user_client.patch(self.url, data={'firstname': 'First'},
+                                     content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = user_client.patch(self.url, data={'firstname': 'Second'},
+                                     content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.firstname, 'First')
+
+
+class UserSearchTest(TestCase):
+    """Test module for the indexed user search"""
+
+    def setUp(self):
+        self.ada = create_user('ada.okafor@example.com', firstname='Ada', lastname='Okafor', phone='+2348031234567')
+        self.grace = create_user('grace@mail.test', firstname='Grace', lastname='Adaeze', phone='+2347059876543')
+        self.john = create_user('john@example.com', firstname='John', lastname='Smith')
+
+    def search(self, term):
+        response = client.get(reverse('user:user-list'), {'search': term})
+        return [user['email'] for user in response.data['results']]
+
+    def test_prefix_match_ranked(self):
+        # Ada's first name outranks a prefix of Grace's last name
+        self.assertEqual(self.search('ada'), ['ada.okafor@example.com', 'grace@mail.test'])
+        self.assertEqual(self.search('grace adae'), ['grace@mail.test'])
+
+    def test_partial_email_and_phone(self):
+        self.assertEqual(self.search('mail.te'), ['grace@mail.test'])
+        self.assertEqual(self.search('0312345'), ['ada.okafor@example.com'])
+
+    def test_vector_follows_updates(self):
+        User.objects.filter(pk=self.john.pk).update(lastname='Okonkwo')
+        self.assertEqual(self.search('okonkwo'), ['john@example.com'])
+        self.assertEqual(self.search('nobody'), [])
+
+
+class SignUpTest(TestCase):
+    """Test module for the signup hot path"""
+
+    def setUp(self):
+        self.payload = {'email': 'new@example.com', 'password': 'pAssw0rd!', 'firstname': 'New',
+                        'lastname': 'User', 'phone': '+2348031234567'}
+
+    def signup(self, **changes):
+        return client.post(reverse('user:signup'), data=dict(self.payload, **changes),
+                           content_type='application/json')
+
+    def test_signup_writes_without_lookups(self):
+        # Savepoints around the user and token INSERTs, no SELECT before them
+        with self.assertNumQueries(6):
+            response = self.signup()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Token.objects.filter(user__email='new@example.com',
+                                             token_type='ACCOUNT_VERIFICATION').exists())
+
+    def test_verification_email_queued_on_commit(self):
+        with mock.patch('user.serializers.send_registration_email.delay') as delay:
+            self.signup()
+            delay.assert_not_called()
+            for _, callback in connection.run_on_commit:
+                callback()
+        delay.assert_called_once()
+        self.assertEqual(delay.call_args[0][0]['email'], 'new@example.com')
+
+    def test_duplicates_are_validation_errors(self):
+        self.signup()
+        response = self.signup(phone='+2348039999999')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'email': ['Email already exists']})
+        response = self.signup(email='other@example.com')
+        self.assertEqual(response.data, {'phone': ['Phone already exists']})
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_duplicates_without_constraint_names(self):
+        # Backends other than psycopg2 don't say which constraint was violated
+        self.signup()
+        with mock.patch('user.serializers.violated_constraint', return_value=None):
+            response = self.signup(email='NEW@example.com', phone='+2348039999999')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data, {'email': ['Email already exists']})
+            response = self.signup(email='other@example.com')
+            self.assertEqual(response.data, {'phone': ['Phone already exists']})
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_email_case_variants_are_duplicates(self):
+        self.signup(email='New.User@Example.com')
+        self.assertTrue(User.objects.filter(email='new.user@example.com').exists())
+        response = self.signup(email='NEW.USER@example.com', phone='+2348039999999')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'email': ['Email already exists']})
+
+    def test_invalid_email_syntax(self):
+        response = self.signup(email='new@@example')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.data)
+
+
+class PasswordResetTest(TestCase):
+    """Test module for the anonymous password reset flow"""
+
+    def setUp(self):
+        self.user = create_user('reset@example.com', verified=True)
+
+    @mock.patch('user.views.UserViewsets.permission_classes', [IsAuthenticated])
+    def test_reset_steps_allow_anonymous_users(self):
+        # Even when the viewset defaults to requiring a login
+        token = Token.objects.create_token(self.user, 'PASSWORD_RESET', length=6)
+        response = client.post(reverse('user:user-reset-password-token-validate'),
+                               data={'token': token.raw}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = client.post(reverse('user:user-reset-password-change'),
+                               data={'token': token.raw, 'new_password': 'n3wPassw0rd!'},
+                               content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('n3wPassw0rd!'))
@@ -1,5 +1,6 @@
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
+from django.utils.crypto import salted_hmac
 from django.template.loader import get_template
 from django.core.files import File
 from urllib.request import urlretrieve
@@ -12,5 +13,10 @@ def send_email(subject, email_from, html_alternative, text_alternative):
     msg.send(fail_silently=False)
 
 
+def hash_token(raw_token):
+    """Keyed, fixed length digest under which a Token is stored"""
+    return salted_hmac('user.Token', raw_token, algorithm='sha256').hexdigest()
+
+
 async def create_file_from_image(url):
     return File(open(url, 'rb'))
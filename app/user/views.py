@@ -1,4 +1,6 @@
 import asyncio
+import os
+import uuid
 from django.conf import settings
 from rest_framework.decorators import action
 from rest_framework import filters, permissions
@@ -17,13 +19,23 @@ from django.utils.crypto import get_random_string
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.cache import cache
 from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.files.storage import default_storage
+from rest_framework.parsers import MultiPartParser
 from user.models import User, Token
 from user.permissions import IsAdmin
+from user.search import UserSearchFilter
+from core.pagination import KeysetPagination
+from core.caching import get_or_build
+from core.streaming import export_response
+from core.serializers import ValuesSerializer
+from core.conditional import check_preconditions, make_etag, precondition_failed, save_if_unchanged
+from .tasks import import_users_file, import_status_key, IMPORT_STATUS_TTL
 from .serializers import (UserSerializer, RegisterVerifySerializer, AuthTokenSerializer, CustomObtainTokenPairSerializer,
                           PasswordResetChangeSerializer, PasswordResetSerializer, PasswordResetVerifySerializer)
 
 
 CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
+USER_LIST_SERIALIZER = ValuesSerializer(UserSerializer)
 
 
 class SignUpView(generics.CreateAPIView):
@@ -54,7 +66,7 @@ class UserViewsets(viewsets.ModelViewSet):
     queryset = get_user_model().objects.all()
     serializer_class = UserSerializer
     http_method_names = ['get', 'post', 'patch', 'delete']
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, UserSearchFilter]
     filterset_fields = ['is_active']
     search_fields = ['email', 'firstname', 'lastname', 'phone']
 
@@ -71,34 +83,95 @@ class UserViewsets(viewsets.ModelViewSet):
 
     def get_permissions(self):
         permission_classes = self.permission_classes
-        if self.action in ['createuser', 'verify', 'verify_resend', 'reset_password', 'reset_password_token_validate', 'retrieve', 'list']:
+        # The password reset steps are for users who can't log in
+        if self.action in ['createuser', 'verify', 'verify_resend', 'reset_password', 'reset_password_token_validate',
+                           'reset_password_change', 'retrieve', 'list']:
             permission_classes = [AllowAny]
         elif self.action in ['destroy', 'partial_update']:
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def retrieve(self, request, *args, **kwargs):
+        """A matching If-None-Match gets a 304 without loading the user"""
+        precondition = check_preconditions(request, self.get_queryset(), kwargs[self.lookup_field], 'modified_at')
+        if precondition is not None:
+            return precondition
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data, headers={'ETag': make_etag(instance.modified_at)})
+
+    def partial_update(self, request, *args, **kwargs):
+        """With If-Match, the update only applies if the user is unchanged since that ETag"""
+        precondition = check_preconditions(request, self.get_queryset(), kwargs[self.lookup_field], 'modified_at')
+        if precondition is not None:
+            return precondition
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        if 'HTTP_IF_MATCH' not in request.META:
+            serializer.save()
+        elif not save_if_unchanged(serializer, 'modified_at', request.META['HTTP_IF_MATCH']):
+            return precondition_failed()
+        return Response(serializer.data, headers={'ETag': make_etag(instance.modified_at)})
+
     def get_response_data(self, paginated_queryset):
         serializer = self.serializer_class(paginated_queryset, many=True)
         return serializer.data
 
     @action(methods=['GET'], detail=False, url_path='user-list')
     def user_list(self, request):
-        if 'users' in cache:
-            users = cache.get('users')
-            return Response(users, status=status.HTTP_200_OK)
-        users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
-        cache.set('users', serializer.data, timeout=CACHE_TTL)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        """Cursor paginated user list, cached one page at a time"""
+        paginator = KeysetPagination()
+
+        def build_page():
+            users = paginator.paginate_queryset(
+                USER_LIST_SERIALIZER.prepare(User.objects.all()), request, view=self)
+            return paginator.get_paginated_response(
+                USER_LIST_SERIALIZER.to_representation(users)).data
+
+        data = get_or_build(paginator.get_cache_key(request, prefix='users'),
+                            build_page, timeout=CACHE_TTL, models=[User])
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(methods=['GET'], detail=False, url_path='export',
+            permission_classes=[IsAuthenticated, IsAdmin])
+    def export(self, request):
+        """Stream every user as a JSON array, or NDJSON with ?output=ndjson"""
+        return export_response(request, User.objects.all(), UserSerializer, 'users')
+
+    @action(methods=['POST'], detail=False, url_path='import', parser_classes=[MultiPartParser],
+            permission_classes=[IsAuthenticated, IsAdmin])
+    def bulk_import(self, request):
+        """Queue a bulk import of users from an uploaded CSV or JSON lines file"""
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'message': 'No file uploaded'}, status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or os.path.splitext(upload.name)[1].lstrip('.')
+        if fmt not in ('csv', 'jsonl'):
+            return Response({'message': 'Format must be csv or jsonl'}, status.HTTP_400_BAD_REQUEST)
+        job_id = uuid.uuid4().hex
+        name = default_storage.save(f'imports/{job_id}.{fmt}', upload)
+        cache.set(import_status_key(job_id), {'state': 'queued'}, IMPORT_STATUS_TTL)
+        import_users_file.delay(name, fmt, job_id)
+        return Response({'job_id': job_id}, status=status.HTTP_202_ACCEPTED)
+
+    @action(methods=['GET'], detail=False, url_path=r'import/(?P<job_id>[0-9a-f]{32})',
+            permission_classes=[IsAuthenticated, IsAdmin])
+    def bulk_import_status(self, request, job_id=None):
+        """Progress and rejected rows of a bulk import"""
+        job = cache.get(import_status_key(job_id))
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(job, status=status.HTTP_200_OK)
 
     @action(methods=['POST'], detail=False, url_path='register/verification')
     def verify(self, request):
         """This endpoint verifies user account on company registration"""
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            token = Token.objects.filter(
-                token=serializer.validated_data.get('token')).first()
-            if token and token.is_valid():
+            token = Token.objects.get_valid(
+                serializer.validated_data.get('token'), 'ACCOUNT_VERIFICATION')
+            if token:
                 token.verify_user()
                 token.delete()
                 return Response({'success': True}, status=status.HTTP_200_OK)
@@ -114,10 +187,10 @@ class UserViewsets(viewsets.ModelViewSet):
                 user = User.objects.filter(
                     email=serializer.validated_data.get('email')).first()
                 if user:
-                    token = Token.objects.create(
-                        user=user, type='ACCOUNT_VERIFICATION', token=get_random_string(length=100))
+                    token = Token.objects.create_token(
+                        user, 'ACCOUNT_VERIFICATION', length=100)
                     email_data = {'fullname': user.firstname, 'email': user.email,
-                                  'token': token.token}
+                                  'token': token.raw}
                     # send_registration_email.delay(email_data)
                     return Response({'success': True}, status=status.HTTP_200_OK)
                 return Response({'message': 'Invalid email'}, status.HTTP_400_BAD_REQUEST)
@@ -160,7 +233,7 @@ class UserViewsets(viewsets.ModelViewSet):
 
 
 class CustomObtainTokenPairView(TokenObtainPairView):
-    """Login with any of phone, email or username"""
+    """Login with an email, in any case, or a phone number"""
     serializer_class = CustomObtainTokenPairSerializer
 
 